@@ -1,42 +1,4151 @@
+import time
+# Taken before the other imports so the startup breakdown includes them
+IMPORT_STARTED = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
 import json
 import os
+import re
 from datetime import datetime
 from pathlib import Path
-from PIL import Image, ImageTk
 import io
 import base64
+import threading
+import hashlib
+import mmap
+from collections import OrderedDict, Counter
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate
+import heapq
+from datetime import timedelta
+import queue
+import marshal
+import gc
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import functools
+import math
+from array import array
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# "json" keeps everything in memory backed by DATA_FILE, "shards" keeps one set of files
+# per user under SHARD_DIR and loads them on demand, "sqlite" queries SQLITE_FILE per screen.
+# "shards" is single-instance: a second window or --serve on the same SHARD_DIR is refused
+STORAGE_BACKEND = "json"
 
 # Data storage file
 DATA_FILE = "social_media_data.json"
 
+# "binary" keeps the snapshot in BINARY_SNAPSHOT_FILE (converted from DATA_FILE once),
+# "json" keeps it in DATA_FILE
+SNAPSHOT_FORMAT = "binary"
+BINARY_SNAPSHOT_FILE = "social_media_data.snap"
+
+# SQLite database used by the "sqlite" backend, migrated from DATA_FILE on first use
+SQLITE_FILE = "social_media_data.db"
+
+# Per-user shard directory used by the "shards" backend, migrated from DATA_FILE on first use
+SHARD_DIR = "social_media_shards"
+
+# Append-only change log replayed on top of DATA_FILE at startup
+LOG_FILE = "social_media_data.log"
+
+# "log" appends one small record per action, "snapshot" rewrites DATA_FILE every time.
+# Only "log" mode is safe with several instances sharing the data files.
+PERSISTENCE_MODE = "log"
+
+# How often a running instance checks for changes other instances made
+SYNC_INTERVAL_MS = 1000
+
+# In "snapshot" mode, saves arriving within this many seconds are written once
+SAVE_DELAY = 0.5
+
+# Fold the log into a fresh snapshot once it grows past this many bytes
+LOG_COMPACT_BYTES = 1024 * 1024
+
+# Content-addressed image blobs; posts only keep the digest
+IMAGE_DIR = "social_media_images"
+
+# Memory budget for decoded post thumbnails kept around between renders
+PHOTO_CACHE_BYTES = 64 * 1024 * 1024
+
+# Bounding box posts are displayed in
+POST_IMAGE_SIZE = (550, 550)
+
+# Small previews, e.g. on the profile page
+THUMBNAIL_SIZE = (120, 120)
+
+# Renditions made once per upload; rendering only ever opens these, never the original
+RENDITIONS = {'display': POST_IMAGE_SIZE, 'thumb': THUMBNAIL_SIZE}
+
+# Still images are recompressed as "JPEG" or "WEBP" at this quality
+IMAGE_FORMAT = "JPEG"
+IMAGE_QUALITY = 82
+
+# Threads reading, decoding and shrinking images, and how often the UI picks up results
+IMAGE_WORKERS = 4
+IMAGE_POLL_MS = 30
+
+# Released rows kept per scroll list for reuse
+VIRTUAL_LIST_POOL = 20
+
+# Posts fetched per page by the Feed and Explore lists
+FEED_PAGE_SIZE = 20
+
+# "read" merges followees' posts per page (fan-out-on-read), "write" pushes each new
+# post into its followers' materialized timelines (fan-out-on-write)
+FEED_MODE = "read"
+
+# Newest entries kept per materialized timeline; older pages fall back to merging
+TIMELINE_LENGTH = 800
+
+# Explore shows this many tag tabs, ranked by posts in the last TRENDING_DAYS days
+TRENDING_TAGS = 5
+TRENDING_DAYS = 7
+
+# Users per page in the Rankings tab
+RANKINGS_PAGE_SIZE = 25
+
+# Users per page in the Discover tab
+DISCOVER_PAGE_SIZE = 20
+
+# Instrumentation is off unless this environment variable is set or --metrics is given
+METRICS_ENV = "HABITHUB_METRICS"
+
+# While it is on, a metrics snapshot is appended to this file as a JSON line this often
+METRICS_FILE = "habithub_metrics.jsonl"
+METRICS_INTERVAL_MS = 10000
+
+# cProfile stats of a profiled interaction
+PROFILE_FILE = "habithub_profile.pstats"
+
+# Address the --serve API server listens on and --loadtest connects to
+API_HOST = "127.0.0.1"
+API_PORT = 8080
+
+# Largest request body the API server accepts (posts may carry a base64 image)
+API_MAX_BODY = 16 * 1024 * 1024
+
+# Full-text search ranks a post's BM25 score down by half every this many days of age,
+# counted from SEARCH_EPOCH
+SEARCH_HALF_LIFE_DAYS = 30
+SEARCH_EPOCH = datetime(2024, 1, 1)
+
+# Who-to-follow suggestions kept per user, and how much each signal adds to a candidate:
+# every account you follow that follows them, them following you, and the cosine
+# similarity of your hashtag use
+SUGGESTIONS = 5
+SUGGEST_MUTUAL_WEIGHT = 1.0
+SUGGEST_FOLLOWS_YOU_WEIGHT = 2.0
+SUGGEST_TAG_WEIGHT = 3.0
+
+# Heaviest users of each hashtag offered on shared interests alone, users scored per
+# sparse product, and how old the suggestions may get before the next login rebuilds them
+SUGGEST_TAG_AUTHORS = 50
+SUGGEST_BLOCK = 2048
+SUGGEST_REFRESH_S = 600
+
+# Weeks of activity shown per habit on the profile, and series of daily activity bits
+# unpacked per vectorized streak computation
+STREAK_WEEKS = 8
+STREAK_BLOCK = 4096
+
+# Tag tabs used to fill Explore while there is not enough data to rank
+DEFAULT_EXPLORE_TAGS = ["#study", "#hydrated", "#nutrition", "#fitness", "#sleep"]
+
+
+def post_seq(post_id):
+    """Split a post id ("author:seq") into author and sequence number"""
+    author, seq = post_id.rsplit(':', 1)
+    return author, int(seq)
+
+
+def post_key(author, post):
+    """Chronological sort key; author and seq break ties between posts in the same minute"""
+    return (post.get('timestamp', ''), author, post_seq(post['id'])[1])
+
+
+def encode_cursor(key):
+    """Opaque page cursor for a post key"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii'))))
+
+
+def first_older(author, posts, before):
+    """Index of the first post older than key before in a newest-first posts list"""
+    lo, hi = 0, len(posts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if post_key(author, posts[mid]) < before:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def merge_timeline(users, authors, cursor=None, limit=FEED_PAGE_SIZE):
+    """One page of the authors' posts newest first, plus the cursor of the next page (None at the end)
+
+    Every posts list is already newest first, so this is a lazy k-way merge: the cost depends
+    on the page size and the number of authors, not on how many posts they have in total.
+    """
+    before = decode_cursor(cursor) if cursor else None
+
+    def stream(author, posts, start):
+        for i in range(start, len(posts)):
+            yield post_key(author, posts[i]), author, posts[i]
+
+    streams = []
+    for author in authors:
+        posts = users.get(author, {}).get('posts', [])
+        start = 0 if before is None else first_older(author, posts, before)
+        if start < len(posts):
+            streams.append(stream(author, posts, start))
+
+    page = []
+    for key, author, post in heapq.merge(*streams, key=lambda e: e[0], reverse=True):
+        page.append((author, post))
+        if len(page) == limit:
+            return page, encode_cursor(key)
+    return page, None
+
+
+def extract_tags(content):
+    """Hashtags in a post (case-insensitive, stored lowercase, first occurrence order)"""
+    tags = []
+    for w in content.split():
+        if w.startswith("#") and len(w) > 1:
+            tag = w.lower()
+            if tag not in tags:
+                tags.append(tag)
+    return tags
+
+
+def assign_post_ids(users):
+    """Give every post a stable id; posts are only ever prepended so seq counts from the oldest"""
+    for username, data in users.items():
+        posts = data.get('posts', [])
+        for i, post in enumerate(posts):
+            if 'id' not in post:
+                post['id'] = f"{username}:{len(posts) - 1 - i}"
+
+
+def find_post(users, post_id):
+    """Look up a post by id without scanning the author's posts"""
+    author, seq = post_seq(post_id)
+    posts = users.get(author, {}).get('posts', [])
+    index = len(posts) - 1 - seq
+    if 0 <= index < len(posts):
+        return posts[index]
+    return None
+
+
+def apply_change(users, change, graph=None):
+    """Apply one mutation record to the users dict (idempotent, so logs can be replayed safely)
+
+    Given the SocialGraph indexing users, follows and likes are checked and applied there
+    instead of scanning lists; the lists in users are then only refreshed by graph.export.
+    """
+    op = change['op']
+    if op == 'signup':
+        if change['user'] not in users:
+            users[change['user']] = change['data']
+        if graph is not None:
+            graph.user_id(change['user'])
+    elif op == 'post':
+        posts = users[change['user']].setdefault('posts', [])
+        _, seq = post_seq(change['post']['id'])
+        if seq >= len(posts):
+            posts.insert(0, change['post'])
+    elif op == 'like':
+        post = find_post(users, change['post'])
+        if post is None:
+            return
+        if graph is not None:
+            graph.like(change['post'], change['user'])
+        elif change['user'] not in post.get('likes', []):
+            post.setdefault('likes', []).append(change['user'])
+    elif op == 'follow':
+        follower, followee = change['user'], change['target']
+        if graph is not None:
+            # Both accounts must exist, like on the list path below
+            if follower in users and followee in users:
+                graph.follow(follower, followee)
+            return
+        if followee not in users[follower].setdefault('following', []):
+            users[follower]['following'].append(followee)
+        if follower not in users[followee].setdefault('followers', []):
+            users[followee]['followers'].append(follower)
+    elif op == 'unfollow':
+        follower, followee = change['user'], change['target']
+        if graph is not None:
+            if follower in users and followee in users:
+                graph.unfollow(follower, followee)
+            return
+        if followee in users[follower].get('following', []):
+            users[follower]['following'].remove(followee)
+        if follower in users[followee].get('followers', []):
+            users[followee]['followers'].remove(follower)
+
+
+# Pillow is imported by load_pillow() the first time an image is decoded or encoded
+Image = ImageTk = ImageOps = ImageSequence = None
+
+
+def load_pillow():
+    """Import Pillow on first use, so starting up and logging in never pay for it"""
+    global Image, ImageTk, ImageOps, ImageSequence
+    if Image is not None:
+        return
+    started = time.perf_counter()
+    from PIL import Image as image, ImageTk as image_tk, ImageOps as image_ops, ImageSequence as image_sequence
+    ImageTk, ImageOps, ImageSequence = image_tk, image_ops, image_sequence
+    # Assigned last: other threads take a non-None Image to mean everything is ready
+    Image = image
+    METRICS.gauge("pillow import ms", round((time.perf_counter() - started) * 1000, 1))
+
+
+# NumPy and SciPy are optional; load_numpy() and load_scipy() import them the first time
+# streaks or suggestions are built
+np = sparse = None
+
+
+def load_numpy():
+    """Import NumPy on first use; False when it is not installed"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+
+def load_scipy():
+    """Import NumPy and SciPy on first use; False when they are not installed"""
+    global sparse
+    if sparse is None:
+        if not load_numpy():
+            return False
+        try:
+            import scipy.sparse
+        except ImportError:
+            return False
+        sparse = scipy.sparse
+    return True
+
+
+class Stopwatch:
+    """Named laps for the startup timing breakdown"""
+
+    def __init__(self, started=None):
+        self.started = self.last = started if started is not None else time.perf_counter()
+        self.laps = []
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.laps.append((name, now - self.last))
+        self.last = now
+
+    def report(self, title="startup"):
+        laps = " | ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.laps)
+        return f"{title}: {laps} | total {(self.last - self.started) * 1000:.1f} ms"
+
+
+STARTUP = Stopwatch(IMPORT_STARTED)
+
+
+class Span:
+    """One timed block recorded by Metrics"""
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.profiler = None
+
+    def __enter__(self):
+        import cProfile
+        local = self.metrics.local
+        depth = getattr(local, 'depth', 0)
+        local.depth = depth + 1
+        if depth == 0 and self.metrics.profile_armed and threading.current_thread() is threading.main_thread():
+            self.metrics.profile_armed = False
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        import pstats
+        elapsed = time.perf_counter() - self.started
+        self.metrics.local.depth -= 1
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(PROFILE_FILE)
+            print(f"profiled {self.name} ({elapsed * 1000:.1f} ms), stats in {PROFILE_FILE}")
+            pstats.Stats(self.profiler).sort_stats("cumulative").print_stats(15)
+        self.metrics.record(self.name, elapsed)
+
+
+def count_widgets(widget):
+    """Number of widgets below widget"""
+    return sum(1 + count_widgets(child) for child in widget.winfo_children())
+
+
+class Metrics:
+    """Spans, counters and gauges on the hot paths; every hook is a cheap no-op while disabled
+
+    Spans nest per thread. While a profile is armed, the next outermost span on the UI
+    thread (one tab build, one like, ...) runs under cProfile.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.spans = {}
+        self.counters = {}
+        self.gauges = {}
+        self.sources = {}
+        self.profile_armed = False
+        self.started = time.time()
+
+    def span(self, name):
+        """Context manager timing a block"""
+        return Span(self, name) if self.enabled else NULL_SPAN
+
+    def timed(self, name):
+        """Decorator recording every call of a function as a span"""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with Span(self, name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def rendered(self, name):
+        """Decorator for methods building widgets into a parent: a span plus the widgets created"""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(app, parent, *args, **kwargs):
+                if not self.enabled:
+                    return fn(app, parent, *args, **kwargs)
+                before = count_widgets(parent)
+                with Span(self, name):
+                    result = fn(app, parent, *args, **kwargs)
+                created = count_widgets(parent) - before
+                self.count("widgets created", created)
+                self.gauge(f"widgets per {name}", created)
+                return result
+            return wrapper
+        return decorate
+
+    def record(self, name, seconds):
+        with self.lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                entry = self.spans[name] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def add_source(self, name, stats):
+        """Include stats() (e.g. a cache's hit rate) in every snapshot"""
+        self.sources[name] = stats
+
+    def snapshot(self):
+        with self.lock:
+            spans = {
+                name: {
+                    'count': count,
+                    'total_ms': round(total * 1000, 3),
+                    'mean_ms': round(total * 1000 / count, 3),
+                    'max_ms': round(longest * 1000, 3)
+                }
+                for name, (count, total, longest) in self.spans.items()
+            }
+            counters = dict(self.counters)
+        return {
+            'time': datetime.now().isoformat(timespec="seconds"),
+            'uptime_s': round(time.time() - self.started, 1),
+            'spans': spans,
+            'counters': counters,
+            'gauges': dict(self.gauges),
+            **{name: stats() for name, stats in self.sources.items()}
+        }
+
+    def write(self, path=METRICS_FILE):
+        """Append a snapshot as one JSON line"""
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+
+NULL_SPAN = contextlib.nullcontext()
+
+METRICS = Metrics(enabled=bool(os.environ.get(METRICS_ENV)))
+
+SNAPSHOT_MAGIC = b"HABITHUB-SNAPSHOT-1\n"
+
+# Byte sizes of the user, post and body sections that follow the magic
+SNAPSHOT_HEADER = struct.Struct("<QQQ")
+
+
+class SnapshotBodies:
+    """Post bodies of a binary snapshot, read from the file one at a time as posts need them
+
+    The file stays open, so a snapshot later written over it by this or another instance
+    does not change what references point at. Windows cannot replace an open file, so
+    there the body section is read into memory up front instead.
+    """
+
+    def __init__(self, f, start, size):
+        self.file = f
+        self.start = start
+        self.lock = threading.Lock()
+        self.data = None
+        if os.name == "nt":
+            f.seek(start)
+            self.data = f.read(size)
+            self.close()
+
+    def text(self, ref):
+        offset, length = ref
+        if self.data is not None:
+            return self.data[offset:offset + length].decode('utf-8')
+        # The UI fills posts while the writer thread may be encoding a snapshot
+        with self.lock:
+            self.file.seek(self.start + offset)
+            raw = self.file.read(length)
+        return raw.decode('utf-8')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def fill(self, post):
+        """Give a lazily loaded post its content"""
+        if '_body' in post:
+            # Content goes in before the reference leaves, so a post always has one of them
+            post['content'] = self.text(post['_body'])
+            del post['_body']
+
+
+def encode_snapshot(users, bodies=None):
+    """Binary snapshot: magic, section sizes, user records, post metadata, post bodies
+
+    Records are marshal-encoded so loading a section is one C call. User records come
+    first so a reader can stop after them, and bodies are only decoded on demand; posts
+    still waiting for theirs carry a '_body' reference resolved through bodies.
+    """
+    profiles = {}
+    posts = {}
+    chunks = []
+    offset = 0
+    for username, data in users.items():
+        profiles[username] = {key: value for key, value in data.items() if key != 'posts'}
+        metas = []
+        for post in data.get('posts', []):
+            text = bodies.text(post['_body']) if 'content' not in post and '_body' in post else post.get('content', '')
+            raw = text.encode('utf-8')
+            meta = {key: value for key, value in post.items() if key not in ('content', '_body')}
+            meta['_body'] = (offset, len(raw))
+            metas.append(meta)
+            chunks.append(raw)
+            offset += len(raw)
+        posts[username] = metas
+    users_block = marshal.dumps(profiles)
+    posts_block = marshal.dumps(posts)
+    header = SNAPSHOT_HEADER.pack(len(users_block), len(posts_block), offset)
+    return b"".join([SNAPSHOT_MAGIC, header, users_block, posts_block] + chunks)
+
+
+def read_binary_snapshot(path, lazy=False):
+    """Load a binary snapshot, returns (users, bodies)
+
+    With lazy=True posts come back without 'content'; bodies.fill(post) adds it, reading
+    just that body from the file.
+    """
+    f = open(path, 'rb')
+    start = len(SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size
+    # Nothing loaded here can form a cycle, and collecting while building ~10^5 containers
+    # roughly doubles the load time
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        users_size, posts_size, bodies_size = SNAPSHOT_HEADER.unpack(f.read(start)[len(SNAPSHOT_MAGIC):])
+        if os.fstat(f.fileno()).st_size != start + users_size + posts_size + bodies_size:
+            raise ValueError("truncated")
+        users = marshal.loads(f.read(users_size))
+        posts = marshal.loads(f.read(posts_size))
+    except (ValueError, EOFError, TypeError, struct.error) as e:
+        f.close()
+        raise ValueError(f"{path} is corrupt ({e}); restore it from a backup") from None
+    finally:
+        if collecting:
+            gc.enable()
+    bodies = SnapshotBodies(f, start + users_size + posts_size, bodies_size)
+    for username, metas in posts.items():
+        users[username]['posts'] = metas
+        if not lazy:
+            for post in metas:
+                bodies.fill(post)
+    if not lazy:
+        bodies.close()
+    return users, bodies
+
+
+def is_binary_snapshot(path):
+    with open(path, 'rb') as f:
+        return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+
+def read_snapshot(path):
+    """Load a snapshot file (JSON or binary, by its contents), treating a missing file as empty
+
+    A file that does not parse raises ValueError instead of silently becoming {}, which
+    would wipe every account on the next save.
+    """
+    if not os.path.exists(path):
+        return {}
+    if is_binary_snapshot(path):
+        return read_binary_snapshot(path)[0]
+    with open(path, 'r') as f:
+        try:
+            return json.load(f)
+        except ValueError as e:
+            raise ValueError(f"{path} is corrupt ({e}); restore it from a backup") from None
+
+
+@METRICS.timed("write file")
+def write_atomic(path, data):
+    """Write text or bytes next to the target, fsync it and swap it in with a rename"""
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb' if isinstance(data, bytes) else 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    METRICS.count("bytes written", len(data))
+
+
+@METRICS.timed("encode snapshot")
+def encode_users(path, users, bodies=None):
+    """Snapshot contents for path: JSON for a .json file, the binary format otherwise"""
+    if path.endswith(".json"):
+        return json.dumps(users, indent=4)
+    return encode_snapshot(users, bodies)
+
+
+def write_snapshot(path, users):
+    """Write a snapshot next to the target and swap it in atomically"""
+    write_atomic(path, encode_users(path, users))
+
+
+def encode_still(image, size):
+    """Shrink a still image into size and recompress it as IMAGE_FORMAT"""
+    load_pillow()
+    image = image.copy()
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        if IMAGE_FORMAT == "JPEG":
+            # JPEG has no alpha; flatten onto the post background
+            background = Image.new("RGB", image.size, "#262626")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    if IMAGE_FORMAT == "JPEG":
+        image.save(out, "JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(out, IMAGE_FORMAT, quality=IMAGE_QUALITY)
+    return out.getvalue()
+
+
+def encode_animation(image, size):
+    """Shrink every frame of an animated GIF, keeping frame timing and looping"""
+    frames = []
+    durations = []
+    for frame in ImageSequence.Iterator(image):
+        durations.append(frame.info.get('duration', 100))
+        frame = frame.convert("RGBA")
+        frame.thumbnail(size, Image.Resampling.LANCZOS)
+        frames.append(frame)
+    out = io.BytesIO()
+    frames[0].save(
+        out, "GIF", save_all=True, append_images=frames[1:], duration=durations,
+        loop=image.info.get('loop', 0), disposal=2, optimize=True
+    )
+    return out.getvalue()
+
+
+def make_renditions(data):
+    """{name: bytes} for every entry in RENDITIONS, from the original image bytes
+
+    Photos are rotated upright from their EXIF orientation first. Animated GIFs keep
+    their animation in the display rendition; the thumbnail is the first frame.
+    """
+    load_pillow()
+    image = Image.open(io.BytesIO(data))
+    animated = getattr(image, 'is_animated', False) and image.format == "GIF"
+    if not animated:
+        image = ImageOps.exif_transpose(image)
+    renditions = {}
+    for name, size in RENDITIONS.items():
+        if animated and name == 'display':
+            renditions[name] = encode_animation(image, size)
+        else:
+            image.seek(0)
+            renditions[name] = encode_still(image, size)
+    return renditions
+
+
+def build_renditions(root, digest):
+    """Process pool job: make the renditions of one stored original"""
+    images = ImageStore(root)
+    with open(images.path(digest), 'rb') as f:
+        images.put_renditions(digest, f.read())
+    return digest
+
+
+def migrate_image_renditions(images, workers=None):
+    """Make renditions for every stored original that lacks them, in parallel processes
+
+    Returns (done, failed) digest lists; failed ones keep rendering from the original.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    todo = [digest for digest in images.digests() if not images.has_renditions(digest)]
+    done, failed = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(build_renditions, images.root, digest): digest for digest in todo}
+        for future, digest in futures.items():
+            try:
+                done.append(future.result())
+            except Exception:
+                failed.append(digest)
+    return done, failed
+
+
+class ImageStore:
+    """Write-once blob directory keyed by the sha256 of the image bytes"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        """Blob path, fanned out over 256 subdirectories"""
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def put(self, data):
+        """Store image bytes and return their digest; identical uploads share one blob"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def put_file(self, file_path):
+        """Store the contents of an image file along with its renditions"""
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        digest = self.put(data)
+        self.put_renditions(digest, data)
+        return digest
+
+    def rendition_path(self, digest, name):
+        return f"{self.path(digest)}.{name}"
+
+    def has_renditions(self, digest):
+        return all(os.path.exists(self.rendition_path(digest, name)) for name in RENDITIONS)
+
+    def put_renditions(self, digest, data):
+        """Write every rendition of an original next to it"""
+        for name, rendition in make_renditions(data).items():
+            path = self.rendition_path(digest, name)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(rendition)
+            os.replace(tmp_path, path)
+
+    def digests(self):
+        """Every original blob in the store"""
+        for prefix in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []:
+            for name in sorted(os.listdir(os.path.join(self.root, prefix))):
+                if "." not in name:
+                    yield prefix + name
+
+    def open(self, digest, rendition=None):
+        """Memory-map a blob read-only; pages are only read when the image is decoded
+
+        With a rendition name, that rendition is opened when it exists and the original
+        otherwise (posts uploaded before renditions were made).
+        """
+        path = self.path(digest)
+        if rendition is not None and os.path.exists(self.rendition_path(digest, rendition)):
+            path = self.rendition_path(digest, rendition)
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO(b'')
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PhotoCache:
+    """LRU of ready PhotoImages keyed by (post id, size), evicted by decoded byte size"""
+
+    def __init__(self, max_bytes=PHOTO_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """Return the cached photo for key, or None on a miss"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, image):
+        """Turn a decoded image into a photo and cache it; must run on the UI thread"""
+        # Every waiter on a shared decode lands here; they all get the one photo
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry[0]
+        load_pillow()
+        photo = ImageTk.PhotoImage(image)
+        size = image.width * image.height * 4
+        self.entries[key] = (photo, size)
+        self.bytes += size
+        # Widgets on screen hold their own reference, so evicting never blanks a visible image
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+        return photo
+
+    def stats(self):
+        """Counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes
+        }
+
+
+class ImagePipeline:
+    """Worker pool for image file reads, decodes and thumbnails
+
+    Workers never touch Tk: finished jobs land on a queue that the UI thread drains with
+    root.after, which is where callbacks run and PhotoImages get built. Jobs with the
+    same key share one run, and a job nobody waits for any more is cancelled if it has
+    not started yet. Jobs submitted with finish=True, such as uploads whose callback
+    stores a post, are the exception: shutdown() waits for them and runs their callbacks.
+    """
+
+    def __init__(self, root, workers=IMAGE_WORKERS):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+        self.done = queue.Queue()
+        self.pending = {}
+        self.finishing = set()
+        self.polling = False
+
+    def submit(self, key, job, on_done, finish=False):
+        """Run job() on a worker, then on_done(result, error) on the UI thread; returns a ticket for cancel()"""
+        entry = self.pending.get(key)
+        if entry is None:
+            future = self.executor.submit(job)
+            entry = self.pending[key] = (future, [])
+            future.add_done_callback(lambda f: self.done.put((key, f)))
+        if finish:
+            self.finishing.add(key)
+        entry[1].append(on_done)
+        self.poll()
+        return key, on_done
+
+    def cancel(self, ticket):
+        """Stop waiting for a job; it is dropped if no one else waits and it has not started"""
+        key, on_done = ticket
+        entry = self.pending.get(key)
+        if entry is None or on_done not in entry[1]:
+            return
+        entry[1].remove(on_done)
+        if not entry[1] and entry[0].cancel():
+            del self.pending[key]
+            self.finishing.discard(key)
+
+    def poll(self):
+        if not self.polling:
+            self.polling = True
+            self.root.after(IMAGE_POLL_MS, self.drain)
+
+    def drain(self):
+        """Hand finished jobs to their callbacks on the UI thread"""
+        self.polling = False
+        while True:
+            try:
+                key, future = self.done.get_nowait()
+            except queue.Empty:
+                break
+            entry = self.pending.get(key)
+            if entry is None or entry[0] is not future:
+                continue
+            self.deliver(key)
+        if self.pending:
+            self.poll()
+
+    def deliver(self, key):
+        """Pass a job's outcome to everyone waiting on it, blocking until it is done"""
+        future, callbacks = self.pending.pop(key)
+        self.finishing.discard(key)
+        error = future.exception()
+        result = None if error is not None else future.result()
+        for on_done in callbacks:
+            on_done(result, error)
+
+    def shutdown(self):
+        """Finish jobs submitted with finish=True and run their callbacks here; drop the rest"""
+        for key in list(self.finishing):
+            self.deliver(key)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def migrate_inline_images(users, images):
+    """Move base64 images embedded in posts into the image store, returns how many moved"""
+    migrated = 0
+    for data in users.values():
+        for post in data.get('posts', []):
+            if post.get('image'):
+                try:
+                    post['image_id'] = images.put(base64.b64decode(post['image']))
+                except ValueError:
+                    continue
+                del post['image']
+                migrated += 1
+            elif 'image' in post:
+                del post['image']
+    return migrated
+
+
+class FileLock:
+    """Exclusive lock on a file shared with other instances, re-entrant within this one"""
+
+    def __init__(self, path):
+        self.path = path
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            self.file = open(self.path, 'a+b')
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        self.file.seek(0)
+                        msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK gives up after ten seconds; keep waiting
+                        pass
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+
+def claim_file(path):
+    """Open path holding an exclusive lock until it is closed; ValueError if another instance holds it"""
+    file = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        file.close()
+        raise ValueError(f"{path} is held by another running instance")
+    return file
+
+
+class ChangeLog:
+    """Append-only JSON-lines log of mutations, compacted into the snapshot in the background
+
+    The log is shared by every instance using the data files. Each record carries a version
+    one higher than the record before it and every log file starts with a generation record
+    naming it, so read_new() can pick up where this instance last stopped even after the
+    file was rotated for compaction. Writes, rotation and the final snapshot swap all hold
+    self.lock, an exclusive file lock.
+    """
+
+    def __init__(self, snapshot_path, log_path, compact_bytes=LOG_COMPACT_BYTES):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.compacting_path = log_path + ".compacting"
+        self.compact_bytes = compact_bytes
+        self.lock = FileLock(log_path + ".lock")
+        self.compactor = None
+        # Newest version seen, and where in which log file reading resumes
+        self.version = 0
+        self.generation = None
+        self.offset = 0
+        self.seen = None
+
+    def size(self):
+        """Current size of the live log in bytes"""
+        return os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+
+    def stat(self):
+        """Cheap fingerprint of both log files, to tell whether anyone wrote to them"""
+        fingerprint = []
+        for path in (self.log_path, self.compacting_path):
+            try:
+                info = os.stat(path)
+                fingerprint.append((info.st_size, info.st_mtime_ns))
+            except FileNotFoundError:
+                fingerprint.append(None)
+        return fingerprint
+
+    def changed(self):
+        return self.stat() != self.seen
+
+    @staticmethod
+    def records(path, offset=0):
+        """Yield (record, end offset) for each complete line of a log file from offset on"""
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in iter(f.readline, b""):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line is either a crash mid-append or a write still in progress
+                    break
+                offset += len(line)
+                yield record, offset
+
+    def generation_of(self, path):
+        """Id from the generation record heading a log file, None if absent"""
+        if not os.path.exists(path):
+            return None
+        for record, _ in self.records(path):
+            return record.get('id') if record.get('op') == "generation" else None
+        return None
+
+    def read(self, path, offset):
+        """Records in path after offset that are newer than self.version; moves the version on"""
+        changes = []
+        for record, end in self.records(path, offset):
+            offset = end
+            if record.get('op') == "generation":
+                self.version = record['base']
+                continue
+            version = record.get('v', self.version + 1)
+            if version <= self.version:
+                continue
+            self.version = version
+            changes.append(record)
+        return changes, offset
+
+    def replay(self, users, graph=None):
+        """Re-apply every logged change on top of the snapshot already in users (and graph, see apply_change)"""
+        self.version, self.generation, self.offset = 0, None, 0
+        with self.lock:
+            for path in (self.compacting_path, self.log_path):
+                if not os.path.exists(path):
+                    continue
+                changes, offset = self.read(path, 0)
+                for change in changes:
+                    try:
+                        apply_change(users, change, graph)
+                    except KeyError:
+                        pass
+                if path == self.log_path:
+                    self.generation, self.offset = self.generation_of(path), offset
+            self.seen = self.stat()
+
+    def read_new(self):
+        """Records other instances logged since the last read or append
+
+        The caller holds self.lock. Returns None when records were compacted away before this
+        instance saw them, in which case it has to reload from the snapshot.
+        """
+        if not self.changed():
+            return []
+        changes = []
+        live = self.generation_of(self.log_path)
+        if live != self.generation or (live is None and self.offset > self.size()):
+            # The file we were reading was rotated aside; finish it if it is still there
+            if self.generation is not None and self.generation_of(self.compacting_path) == self.generation:
+                changes, _ = self.read(self.compacting_path, self.offset)
+            elif self.generation is not None or self.offset:
+                return None
+            self.generation, self.offset = live, 0
+        if os.path.exists(self.log_path):
+            new, self.offset = self.read(self.log_path, self.offset)
+            changes += new
+        self.seen = self.stat()
+        return changes
+
+    def append(self, change):
+        """Append a change record at the next version and kick off compaction if the log got too big
+
+        The caller holds self.lock and has caught up with read_new() first.
+        """
+        with self.lock:
+            record = dict(change, v=self.version + 1)
+            with open(self.log_path, 'ab') as f:
+                if f.tell() == 0:
+                    self.generation = os.urandom(16).hex()
+                    header = {'op': "generation", 'id': self.generation, 'base': self.version}
+                    f.write(json.dumps(header).encode() + b"\n")
+                line = json.dumps(record).encode() + b"\n"
+                f.write(line)
+                self.offset = size = f.tell()
+            METRICS.count("log bytes written", len(line))
+            self.version += 1
+            self.seen = self.stat()
+        if size >= self.compact_bytes:
+            self.compact()
+
+    def flush(self):
+        """Force appended records to disk and wait for a running compaction"""
+        with self.lock:
+            if os.path.exists(self.log_path):
+                with open(self.log_path, 'ab') as f:
+                    os.fsync(f.fileno())
+        if self.compactor is not None:
+            self.compactor.join()
+
+    def compact(self):
+        """Rotate the live log aside and fold it into a new snapshot on a worker thread"""
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        with self.lock:
+            if os.path.exists(self.log_path):
+                if os.path.exists(self.compacting_path):
+                    # Another compaction is running or died half way; keep folding both logs in order
+                    with open(self.compacting_path, 'ab') as dst, open(self.log_path, 'rb') as src:
+                        dst.write(src.read())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.compacting_path)
+            if not os.path.exists(self.compacting_path):
+                return
+        self.compactor = threading.Thread(target=self._fold, daemon=True)
+        self.compactor.start()
+
+    def _fold(self):
+        """Build the new snapshot from disk only, so the UI thread's dict is never touched"""
+        while True:
+            if not os.path.exists(self.compacting_path):
+                return
+            users = read_snapshot(self.snapshot_path)
+            assign_post_ids(users)
+            graph = SocialGraph()
+            graph.build(users)
+            end = 0
+            for record, end in self.records(self.compacting_path):
+                try:
+                    apply_change(users, record, graph)
+                except KeyError:
+                    continue
+            with self.lock:
+                # Another instance may have folded it already or appended more to it meanwhile
+                if not os.path.exists(self.compacting_path):
+                    return
+                if os.path.getsize(self.compacting_path) != end:
+                    continue
+                if self.generation == self.generation_of(self.compacting_path) and self.offset == end:
+                    # This instance has read all of it, so it can move on without a reload
+                    self.generation, self.offset = self.generation_of(self.log_path), 0
+                graph.export(users)
+                write_snapshot(self.snapshot_path, users)
+                os.remove(self.compacting_path)
+                return
+
+
+class SnapshotWriter:
+    """Writer thread for snapshots, coalescing bursts of saves into a single write
+
+    encode() returns the [(path, data)] files to write. Callers mutate what it reads while
+    holding self.lock; the thread only holds it while running encode(), so the slow part
+    (writing and fsyncing the files) never blocks the UI. When a save fails, failed() runs
+    under self.lock so an encode() that consumes dirty marks can put them back.
+    """
+
+    def __init__(self, encode, delay=SAVE_DELAY, failed=None):
+        self.encode = encode
+        self.delay = delay
+        self.failed = failed
+        self.lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.dirty = False
+        self.writing = False
+        self.urgent = False
+        self.stopped = False
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request(self):
+        """Schedule a save; returns at once"""
+        with self.cond:
+            self.dirty = True
+            self.cond.notify_all()
+
+    def flush(self):
+        """Block until every requested save is on disk"""
+        with self.cond:
+            self.urgent = True
+            self.cond.notify_all()
+            while self.dirty or self.writing:
+                self.cond.wait()
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        self.flush()
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.dirty and not self.stopped:
+                    self.cond.wait()
+                if not self.dirty:
+                    return
+                # Let more saves pile up unless someone is waiting on this one
+                deadline = time.monotonic() + self.delay
+                while not self.urgent and not self.stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                self.dirty = False
+                self.writing = True
+            try:
+                with self.lock:
+                    files = self.encode()
+                for path, data in files:
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    write_atomic(path, data)
+            except Exception as e:
+                # Kept for flush() to raise; the thread lives on for the next save
+                self.error = e
+                if self.failed is not None:
+                    with self.lock:
+                        self.failed()
+            finally:
+                with self.cond:
+                    self.writing = False
+                    if not self.dirty:
+                        self.urgent = False
+                    self.cond.notify_all()
+
+
+class TagIndex:
+    """Hashtag -> posts index kept in chronological order, plus an index of every post"""
+
+    def __init__(self):
+        self.tags = {}
+        self.all = []
+
+    def build(self, users):
+        """Index every post once at load"""
+        self.tags = {}
+        self.all = []
+        for author, data in users.items():
+            for post in data.get('posts', []):
+                entry = (post_key(author, post), author, post)
+                self.all.append(entry)
+                for tag in set(t.lower() for t in post.get('tags', [])):
+                    self.tags.setdefault(tag, []).append(entry)
+        self.all.sort(key=lambda e: e[0])
+        for entries in self.tags.values():
+            entries.sort(key=lambda e: e[0])
+
+    def add(self, author, post):
+        """Index a newly published post"""
+        entry = (post_key(author, post), author, post)
+        # Keys are unique per post, so comparisons never reach the post dict
+        insort(self.all, entry)
+        for tag in set(t.lower() for t in post.get('tags', [])):
+            insort(self.tags.setdefault(tag, []), entry)
+
+    def posts(self, tag=None, cursor=None, limit=None):
+        """(author, post) pairs newest first for a tag (every post when tag is None), and the next cursor"""
+        entries = self.all if tag is None else self.tags.get(tag.lower(), [])
+        end = len(entries) if cursor is None else bisect_left(entries, (decode_cursor(cursor),))
+        start = 0 if limit is None else max(end - limit, 0)
+        page = [(author, post) for _, author, post in reversed(entries[start:end])]
+        next_cursor = encode_cursor(entries[start][0]) if start > 0 else None
+        return page, next_cursor
+
+    def count(self, tag):
+        return len(self.tags.get(tag.lower(), []))
+
+    def trending(self, n=TRENDING_TAGS, days=TRENDING_DAYS):
+        """Top n tags by posts in the last days, ties broken by all-time count"""
+        cutoff = ((datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M"),)
+
+        def score(tag):
+            entries = self.tags[tag]
+            return (len(entries) - bisect_left(entries, (cutoff,)), len(entries))
+
+        return heapq.nlargest(n, self.tags, key=score)
+
+
+class TimelineStore:
+    """Materialized home timelines for fan-out-on-write, bounded to the newest entries
+
+    A timeline holds every post of its owner's authors from its boundary key onward (no
+    boundary means the whole history). It is built with merge_timeline the first time its
+    owner reads it and is then kept current: publish() pushes new posts to the author's
+    followers, follow() backfills the followee's recent posts and unfollow() prunes them.
+    """
+
+    def __init__(self, users, graph, limit=TIMELINE_LENGTH):
+        self.users = users
+        self.graph = graph
+        self.limit = limit
+        self.timelines = {}
+        self.boundaries = {}
+
+    def clear(self):
+        """Drop every timeline so each is rebuilt on its next read"""
+        self.timelines.clear()
+        self.boundaries.clear()
+
+    def authors(self, username):
+        return self.graph.following_of(username) + [username]
+
+    def timeline(self, username):
+        """Entries (key, author, post) oldest first, materializing on first use"""
+        entries = self.timelines.get(username)
+        if entries is None:
+            page, cursor = merge_timeline(self.users, self.authors(username), None, self.limit)
+            entries = [(post_key(author, post), author, post) for author, post in reversed(page)]
+            self.timelines[username] = entries
+            self.boundaries[username] = entries[0][0] if cursor else None
+        return entries
+
+    def trim(self, username):
+        entries = self.timelines[username]
+        if len(entries) > self.limit:
+            del entries[:len(entries) - self.limit]
+            self.boundaries[username] = entries[0][0]
+
+    def publish(self, author, post):
+        """Fan a new post out to every materialized follower timeline"""
+        entry = (post_key(author, post), author, post)
+        for username in self.graph.followers_of(author) + [author]:
+            entries = self.timelines.get(username)
+            if entries is not None:
+                insort(entries, entry)
+                self.trim(username)
+
+    def follow(self, username, target):
+        """Backfill a new followee's posts back to the timeline's boundary"""
+        entries = self.timelines.get(username)
+        if entries is None:
+            return
+        boundary = self.boundaries[username]
+        posts = self.users[target].get('posts', [])
+        backfill = []
+        for post in posts:
+            key = post_key(target, post)
+            if boundary is not None and key < boundary:
+                break
+            backfill.append((key, target, post))
+            if len(backfill) == self.limit:
+                break
+        # Drop anything already there so a repeated follow never duplicates posts
+        entries[:] = [e for e in entries if e[1] != target]
+        if len(backfill) == self.limit and len(posts) > self.limit:
+            # The followee alone fills the window; everything older is served by merging
+            boundary = backfill[-1][0]
+            self.boundaries[username] = boundary
+            entries[:] = [e for e in entries if e[0] >= boundary]
+        entries.extend(backfill)
+        entries.sort(key=lambda e: e[0])
+        self.trim(username)
+
+    def unfollow(self, username, target):
+        """Prune an unfollowed account's posts"""
+        entries = self.timelines.get(username)
+        if entries is not None:
+            entries[:] = [e for e in entries if e[1] != target]
+
+    def on_change(self, change):
+        if change['op'] == 'post':
+            self.publish(change['user'], change['post'])
+        elif change['op'] == 'follow':
+            self.follow(change['user'], change['target'])
+        elif change['op'] == 'unfollow':
+            self.unfollow(change['user'], change['target'])
+
+    def page(self, username, cursor=None, limit=FEED_PAGE_SIZE):
+        """Same contract as merge_timeline, read from the materialized timeline"""
+        entries = self.timeline(username)
+        boundary = self.boundaries[username]
+        end = len(entries) if cursor is None else bisect_left(entries, (decode_cursor(cursor),))
+        start = max(end - limit, 0)
+        page = [(author, post) for _, author, post in reversed(entries[start:end])]
+        if start > 0:
+            return page, encode_cursor(entries[start][0])
+        if boundary is None:
+            # The whole history fits in the timeline
+            return page, None
+        if len(page) == limit:
+            return page, encode_cursor(boundary)
+        # Older than the materialized window: finish the page by merging on read
+        if cursor is None or decode_cursor(cursor) > boundary:
+            cursor = encode_cursor(boundary)
+        older, next_cursor = merge_timeline(self.users, self.authors(username), cursor, limit - len(page))
+        return page + older, next_cursor
+
+
+class SocialGraph:
+    """Follow graph and post likes over integer user ids with O(1) membership checks
+
+    Adjacency and like sets are dicts used as insertion-ordered sets, so exporting back to
+    the users dict reproduces the original list order and the JSON round-trips unchanged.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.following = []
+        self.followers = []
+        self.likes = {}
+
+    def build(self, users):
+        """Index the edges and likes stored in the users dict"""
+        self.__init__()
+        for username in users:
+            self.user_id(username)
+        # Each side is read in its own list's order, then an edge listed on one side only
+        # is added to the other
+        for username, data in users.items():
+            uid = self.ids[username]
+            for followee in data.get('following', []):
+                self.following[uid][self.user_id(followee)] = None
+            for follower in data.get('followers', []):
+                self.followers[uid][self.user_id(follower)] = None
+            for post in data.get('posts', []):
+                for liker in post.get('likes', []):
+                    self.like(post['id'], liker)
+        for a, following in enumerate(self.following):
+            for b in following:
+                self.followers[b][a] = None
+        for b, followers in enumerate(self.followers):
+            for a in followers:
+                self.following[a][b] = None
+
+    def user_id(self, username):
+        """Integer id for a username, assigning the next one on first sight"""
+        uid = self.ids.get(username)
+        if uid is None:
+            uid = len(self.names)
+            self.ids[username] = uid
+            self.names.append(username)
+            self.following.append({})
+            self.followers.append({})
+        return uid
+
+    def follow(self, follower, followee):
+        a, b = self.user_id(follower), self.user_id(followee)
+        self.following[a][b] = None
+        self.followers[b][a] = None
+
+    def unfollow(self, follower, followee):
+        a, b = self.user_id(follower), self.user_id(followee)
+        self.following[a].pop(b, None)
+        self.followers[b].pop(a, None)
+
+    def is_following(self, follower, followee):
+        a, b = self.ids.get(follower), self.ids.get(followee)
+        return a is not None and b is not None and b in self.following[a]
+
+    def following_of(self, username):
+        uid = self.ids.get(username)
+        return [] if uid is None else [self.names[i] for i in self.following[uid]]
+
+    def followers_of(self, username):
+        uid = self.ids.get(username)
+        return [] if uid is None else [self.names[i] for i in self.followers[uid]]
+
+    def following_count(self, username):
+        uid = self.ids.get(username)
+        return 0 if uid is None else len(self.following[uid])
+
+    def follower_count(self, username):
+        uid = self.ids.get(username)
+        return 0 if uid is None else len(self.followers[uid])
+
+    def like(self, post_id, username):
+        self.likes.setdefault(post_id, {})[self.user_id(username)] = None
+
+    def has_liked(self, post_id, username):
+        uid = self.ids.get(username)
+        return uid is not None and uid in self.likes.get(post_id, ())
+
+    def like_count(self, post_id):
+        return len(self.likes.get(post_id, ()))
+
+    def on_change(self, change):
+        op = change['op']
+        if op == 'signup':
+            self.user_id(change['user'])
+        elif op == 'like':
+            self.like(change['post'], change['user'])
+        elif op == 'follow':
+            self.follow(change['user'], change['target'])
+        elif op == 'unfollow':
+            self.unfollow(change['user'], change['target'])
+
+    def export(self, users):
+        """Write edges and likes back into the users dict in their original order"""
+        for username, data in users.items():
+            data['following'] = self.following_of(username)
+            data['followers'] = self.followers_of(username)
+            for post in data.get('posts', []):
+                post['likes'] = [self.names[i] for i in self.likes.get(post['id'], ())]
+
+
+class Leaderboard:
+    """Users ranked by a positive integer score, highest first, ties by username
+
+    A Fenwick tree counts users per score, so updates, rank() and finding where a page
+    starts are all O(log n) in the score range; users sharing a score sit in a sorted bucket.
+    """
+
+    def __init__(self):
+        self.scores = {}
+        self.buckets = {}
+        self.total = 0
+        self.capacity = 16
+        self.tree = [0] * (self.capacity + 1)
+
+    def _add(self, score, delta):
+        while score <= self.capacity:
+            self.tree[score] += delta
+            score += score & -score
+
+    def _prefix(self, score):
+        """Number of users with a score <= score"""
+        count = 0
+        score = min(score, self.capacity)
+        while score > 0:
+            count += self.tree[score]
+            score -= score & -score
+        return count
+
+    def _lowest_reaching(self, count):
+        """Smallest score whose prefix count reaches count"""
+        pos = 0
+        step = self.capacity
+        while step:
+            if pos + step <= self.capacity and self.tree[pos + step] < count:
+                pos += step
+                count -= self.tree[pos]
+            step //= 2
+        return pos + 1
+
+    def _grow(self, score):
+        while self.capacity < score:
+            self.capacity *= 2
+        self.tree = [0] * (self.capacity + 1)
+        for s, bucket in self.buckets.items():
+            self._add(s, len(bucket))
+
+    @classmethod
+    def from_scores(cls, scores):
+        """A board of the positive scores in a {username: score} dict, built in one pass"""
+        board = cls()
+        for username, score in scores.items():
+            if score > 0:
+                board.scores[username] = score
+                board.buckets.setdefault(score, []).append(username)
+        for bucket in board.buckets.values():
+            bucket.sort()
+        board.total = len(board.scores)
+        board._grow(max(board.buckets, default=0))
+        return board
+
+    def set(self, username, score):
+        old = self.scores.get(username, 0)
+        if old == score:
+            return
+        if old > 0:
+            bucket = self.buckets[old]
+            del bucket[bisect_left(bucket, username)]
+            if not bucket:
+                del self.buckets[old]
+            self._add(old, -1)
+            self.total -= 1
+        if score > 0:
+            if score > self.capacity:
+                self._grow(score)
+            insort(self.buckets.setdefault(score, []), username)
+            self._add(score, 1)
+            self.total += 1
+            self.scores[username] = score
+        else:
+            self.scores.pop(username, None)
+
+    def add(self, username, delta):
+        self.set(username, self.scores.get(username, 0) + delta)
+
+    def score(self, username):
+        return self.scores.get(username, 0)
+
+    def rank(self, username):
+        """1-based rank, or None for users without a score"""
+        score = self.scores.get(username, 0)
+        if score <= 0:
+            return None
+        higher = self.total - self._prefix(score)
+        return higher + bisect_left(self.buckets[score], username) + 1
+
+    def page(self, offset=0, limit=RANKINGS_PAGE_SIZE):
+        """[(rank, username, score)] for ranks offset+1 .. offset+limit"""
+        if offset >= self.total:
+            return []
+        # The score holding the user at position offset (counting from the top)
+        score = self._lowest_reaching(self.total - offset)
+        skip = offset - (self.total - self._prefix(score))
+        entries = []
+        rank = offset + 1
+        while len(entries) < limit:
+            for username in self.buckets[score][skip:skip + limit - len(entries)]:
+                entries.append((rank, username, score))
+                rank += 1
+            below = self._prefix(score - 1)
+            if below == 0:
+                break
+            score = self._lowest_reaching(below)
+            skip = 0
+        return entries
+
+
+def week_start():
+    """Timestamp string of this Monday 00:00, comparable with post timestamps"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return (today - timedelta(days=today.weekday())).strftime("%Y-%m-%d %H:%M")
+
+
+class RankingIndex:
+    """Leaderboards per (key, window), maintained from the change stream
+
+    Keys are posts published, likes received and followers; posts and likes also have a
+    "week" window counting only posts published since Monday. Follow edges carry no time,
+    so followers are all-time only.
+    """
+
+    KEYS = {'posts': "posts", 'likes': "likes received", 'followers': "followers"}
+    WINDOWS = {'all': "All time", 'week': "This week"}
+    WINDOWED_KEYS = ('posts', 'likes')
+
+    def __init__(self, users, graph, tag_index):
+        self.users = users
+        self.graph = graph
+        self.tag_index = tag_index
+        self.boards = {}
+        self.week = None
+
+    def build(self):
+        for key in self.KEYS:
+            self.boards[(key, 'all')] = Leaderboard()
+        for username, data in self.users.items():
+            posts = data.get('posts', [])
+            self.boards[('posts', 'all')].set(username, len(posts))
+            self.boards[('likes', 'all')].set(username, sum(self.graph.like_count(p['id']) for p in posts))
+            self.boards[('followers', 'all')].set(username, self.graph.follower_count(username))
+        self.week = None
+
+    def ensure_week(self):
+        """Start fresh weekly boards when the week rolls over, from this week's posts only"""
+        start = week_start()
+        if start == self.week:
+            return
+        self.week = start
+        posts_board = self.boards[('posts', 'week')] = Leaderboard()
+        likes_board = self.boards[('likes', 'week')] = Leaderboard()
+        entries = self.tag_index.all
+        for _, author, post in entries[bisect_left(entries, ((start,),)):]:
+            posts_board.add(author, 1)
+            likes_board.add(author, self.graph.like_count(post['id']))
+
+    def board(self, key, window='all'):
+        if window == 'week':
+            self.ensure_week()
+        return self.boards[(key, window)]
+
+    def on_change(self, change):
+        op = change['op']
+        if op == 'post':
+            self.boards[('posts', 'all')].add(change['user'], 1)
+            if self.week is not None and change['post'].get('timestamp', '') >= self.week:
+                self.boards[('posts', 'week')].add(change['user'], 1)
+        elif op == 'like':
+            author, _ = post_seq(change['post'])
+            self.boards[('likes', 'all')].add(author, 1)
+            post = find_post(self.users, change['post'])
+            if self.week is not None and post is not None and post.get('timestamp', '') >= self.week:
+                self.boards[('likes', 'week')].add(author, 1)
+        elif op in ('follow', 'unfollow'):
+            self.boards[('followers', 'all')].set(change['target'], self.graph.follower_count(change['target']))
+
+
+class UserSearchIndex:
+    """Username prefix index plus a bio token index for the Discover search box"""
+
+    def __init__(self):
+        self.names = []
+        self.tokens = []
+
+    def build(self, users):
+        self.names = sorted((username.lower(), username) for username in users)
+        self.tokens = sorted(
+            (token, username)
+            for username, data in users.items()
+            for token in set(re.findall(r"\w+", data.get('bio', '').lower()))
+        )
+
+    def add(self, username, bio):
+        insort(self.names, (username.lower(), username))
+        for token in set(re.findall(r"\w+", bio.lower())):
+            insort(self.tokens, (token, username))
+
+    def on_change(self, change):
+        if change['op'] == 'signup':
+            self.add(change['user'], change['data'].get('bio', ''))
+
+    @staticmethod
+    def prefix_range(entries, prefix):
+        return bisect_left(entries, (prefix,)), bisect_left(entries, (prefix + "\uffff",))
+
+    def search(self, query, offset=0, limit=DISCOVER_PAGE_SIZE, exclude=None):
+        """One page of matching usernames and the total number of matches
+
+        Usernames starting with the query come first, then users whose bio has words
+        starting with every word of the query. An empty query lists everyone.
+        """
+        query = query.strip().lower()
+        lo, hi = self.prefix_range(self.names, query)
+        name_hits = hi - lo
+
+        bio_hits = []
+        if query:
+            matches = None
+            for word in query.split():
+                start, end = self.prefix_range(self.tokens, word)
+                found = set(username for _, username in self.tokens[start:end])
+                matches = found if matches is None else matches & found
+            bio_hits = sorted(u for u in matches if not u.lower().startswith(query))
+
+        # Position of the excluded user (usually yourself) among the matches, if present
+        skip = None
+        if exclude is not None:
+            if exclude.lower().startswith(query):
+                skip = bisect_left(self.names, (exclude.lower(), exclude)) - lo
+            elif exclude in bio_hits:
+                skip = name_hits + bio_hits.index(exclude)
+
+        total = name_hits + len(bio_hits) - (skip is not None)
+        page = []
+        for i in range(offset, min(offset + limit, total)):
+            j = i if skip is None or i < skip else i + 1
+            page.append(self.names[lo + j][1] if j < name_hits else bio_hits[j - name_hits])
+        return page, total
+
+
+def post_tokens(content):
+    """Search terms of a text: lowercase words plus its hashtags as extract_tags finds them"""
+    return re.findall(r"\w+", content.lower()) + extract_tags(content)
+
+
+def timestamp_minutes(timestamp):
+    """Minutes from SEARCH_EPOCH to a "YYYY-MM-DD HH:MM" timestamp, 0 if it does not parse"""
+    try:
+        day = datetime(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10])).toordinal()
+        return (day - SEARCH_EPOCH.toordinal()) * 1440 + int(timestamp[11:13]) * 60 + int(timestamp[14:16])
+    except (ValueError, IndexError):
+        return 0
+
+
+class PostSearchIndex:
+    """Inverted index over post content, ranked by BM25 weighted by recency
+
+    Posts are numbered in the order they are indexed. A term's postings are those numbers
+    in an array('I') plus a bytearray of term frequencies (capped at 255), five bytes per
+    posting. A post's impact for a term is its BM25 term weight times
+    2 ** (minutes since SEARCH_EPOCH / half-life), so newer posts win ties and the order
+    does not depend on when the query runs. Queries run the threshold algorithm over each
+    term's HEAD highest-impact postings. When a head runs out, postings are scored
+    newest first until the age alone rules out the rest; a fresh index numbers posts
+    by time and BLOCK-sized runs of numbers keep their newest time to bound that. Heads
+    are kept current as posts arrive and saved with the index, so the average post length
+    they were computed with is fixed when the index is first built.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    HEAD = 1000
+    BLOCK = 1024
+    FORMAT = 1
+
+    def __init__(self, half_life_days=SEARCH_HALF_LIFE_DAYS):
+        self.half_life = half_life_days * 1440
+        self.authors = []
+        self.author_ids = {}
+        self.doc_author = array('I')
+        self.doc_seq = array('I')
+        self.doc_len = array('H')
+        self.doc_time = array('i')
+        self.block_time = array('i')
+        self.terms = {}
+        self.heads = {}
+        self.indexed = {}
+        self.avgdl = None
+        self.saved_heads = {}
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.doc_seq)
+
+    def add(self, author, seq, content, timestamp):
+        """Index one post"""
+        if author not in self.author_ids:
+            self.author_ids[author] = len(self.authors)
+            self.authors.append(author)
+        doc = len(self.doc_seq)
+        tokens = post_tokens(content)
+        self.doc_author.append(self.author_ids[author])
+        self.doc_seq.append(seq)
+        self.doc_len.append(min(len(tokens), 65535))
+        minutes = timestamp_minutes(timestamp)
+        self.doc_time.append(minutes)
+        if doc % self.BLOCK == 0:
+            self.block_time.append(minutes)
+        elif minutes > self.block_time[-1]:
+            self.block_time[-1] = minutes
+        self.indexed[author] = max(self.indexed.get(author, 0), seq + 1)
+        self.dirty = True
+        if self.avgdl is None:
+            self.avgdl = max(len(tokens), 1)
+
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            postings = self.terms.get(token)
+            if postings is None:
+                postings = self.terms[token] = (array('I'), bytearray())
+            postings[0].append(doc)
+            postings[1].append(min(tf, 255))
+            head = self.head(token) if token in self.saved_heads else self.heads.get(token)
+            if head is not None:
+                entry = (-self.impact(doc, tf), doc)
+                # A head holds the top impacts of its term, so only better postings join it
+                if len(head) == len(postings[0]) - 1 or entry < head[-1]:
+                    insort(head, entry)
+                    # Past HEAD entries the lowest drops off, leaving a partial head
+                    if len(head) > self.HEAD:
+                        head.pop()
+
+    def catch_up(self, counts, fetch):
+        """Index the posts published since the index was saved
+
+        counts maps each author to their post count and fetch(author, start) yields
+        (seq, content, timestamp) for their posts from seq start on. Returns False if the
+        index knows posts the data does not, in which case it has to be rebuilt.
+        """
+        if any(done > counts.get(author, 0) for author, done in self.indexed.items()):
+            return False
+        new = []
+        for author, count in counts.items():
+            done = self.indexed.get(author, 0)
+            if count > done:
+                new.extend((timestamp, author, seq, content) for seq, content, timestamp in fetch(author, done))
+        # Numbering posts by time lets searches stop early on age
+        new.sort(key=lambda post: post[:3])
+        fresh = not len(self)
+        for timestamp, author, seq, content in new:
+            self.add(author, seq, content, timestamp)
+        if fresh and len(self):
+            self.avgdl = sum(self.doc_len) / len(self) or 1
+        return True
+
+    def build_heads(self):
+        """Work out the heads of terms too common to score in full, ahead of the first search"""
+        for token, (ids, _) in self.terms.items():
+            if len(ids) > self.HEAD:
+                self.head(token)
+
+    def on_change(self, change):
+        author, seq = post_seq(change['post']['id'])
+        if seq >= self.indexed.get(author, 0):
+            self.add(author, seq, change['post'].get('content', ''), change['post'].get('timestamp', ''))
+
+    def impact(self, doc, tf):
+        norm = self.K1 * (1 - self.B + self.B * self.doc_len[doc] / self.avgdl)
+        return tf * (self.K1 + 1) / (tf + norm) * 2.0 ** (self.doc_time[doc] / self.half_life)
+
+    def head(self, token):
+        """The term's highest-impact postings as sorted (-impact, doc) pairs"""
+        head = self.heads.get(token)
+        if head is None and token in self.saved_heads:
+            negatives, docs = self.saved_heads.pop(token)
+            head = self.heads[token] = list(zip(array('d', negatives), array('I', docs)))
+        elif head is None:
+            ids, tfs = self.terms[token]
+            entries = [(-self.impact(doc, tf), doc) for doc, tf in zip(ids, tfs)]
+            head = self.heads[token] = heapq.nsmallest(self.HEAD, entries) if len(entries) > self.HEAD else sorted(entries)
+        return head
+
+    def search(self, query, k=FEED_PAGE_SIZE):
+        """The k best matches as (author, post id, score), best first"""
+        n = len(self)
+        weighted = []
+        for token in dict.fromkeys(post_tokens(query)):
+            if token in self.terms:
+                ids, tfs = self.terms[token]
+                idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+                weighted.append((idf, ids, tfs, self.head(token)))
+        if not weighted:
+            return []
+
+        def score(doc):
+            total = 0.0
+            for idf, ids, tfs, _ in weighted:
+                i = bisect_left(ids, doc)
+                if i < len(ids) and ids[i] == doc:
+                    total += idf * self.impact(doc, tfs[i])
+            return total
+
+        best = []
+        seen = set()
+        depth = 0
+        while True:
+            # No post not seen yet can score above the sum of the impacts at this depth
+            threshold = 0.0
+            active = False
+            for idf, ids, _, head in weighted:
+                if depth < len(head):
+                    active = True
+                    negative, doc = head[depth]
+                    threshold -= idf * negative
+                    if doc not in seen:
+                        seen.add(doc)
+                        entry = (score(doc), doc)
+                        if len(best) < k:
+                            heapq.heappush(best, entry)
+                        elif entry > best[0]:
+                            heapq.heapreplace(best, entry)
+                elif len(head) < len(ids):
+                    best = self.score_recent(weighted, k, best[0][0] if len(best) == k else 0.0)
+                    active = False
+                    break
+            if not active or (len(best) == k and best[0][0] >= threshold):
+                break
+            depth += 1
+        return [
+            (self.authors[self.doc_author[doc]], f"{self.authors[self.doc_author[doc]]}:{self.doc_seq[doc]}", score)
+            for score, doc in sorted(best, reverse=True)
+        ]
+
+    def score_recent(self, weighted, k, floor):
+        """Exact top k from the postings of posts new enough to score at least floor
+
+        k posts are known to reach floor. No post scores above
+        2 ** (time / half-life) * sum(idf * (K1 + 1)), so every block up to the last one
+        whose newest post cannot reach floor is skipped.
+        """
+        reach = sum(idf for idf, _, _, _ in weighted) * (self.K1 + 1)
+        first = 0
+        for block, newest in enumerate(accumulate(self.block_time, max)):
+            if 2.0 ** (newest / self.half_life) * reach >= floor:
+                break
+            first = (block + 1) * self.BLOCK
+        scores = {}
+        for idf, ids, tfs, _ in weighted:
+            start = bisect_left(ids, first)
+            for doc, tf in zip(ids[start:], tfs[start:]):
+                scores[doc] = scores.get(doc, 0.0) + idf * self.impact(doc, tf)
+        return heapq.nlargest(k, ((score, doc) for doc, score in scores.items()))
+
+    def encode(self):
+        return marshal.dumps({
+            'format': self.FORMAT,
+            'half_life': self.half_life,
+            'authors': self.authors,
+            'doc_author': self.doc_author.tobytes(),
+            'doc_seq': self.doc_seq.tobytes(),
+            'doc_len': self.doc_len.tobytes(),
+            'doc_time': self.doc_time.tobytes(),
+            'block_time': self.block_time.tobytes(),
+            'terms': {token: (ids.tobytes(), bytes(tfs)) for token, (ids, tfs) in self.terms.items()},
+            'avgdl': self.avgdl,
+            # Complete heads are cheap to recompute, partial ones are what saves work
+            'heads': {
+                **self.saved_heads,
+                **{
+                    token: (array('d', (e[0] for e in head)).tobytes(), array('I', (e[1] for e in head)).tobytes())
+                    for token, head in self.heads.items() if len(head) < len(self.terms[token][0])
+                }
+            },
+            'indexed': self.indexed
+        })
+
+    def save(self, path):
+        """Write the index out if it changed since it was loaded or last saved"""
+        if self.dirty:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            write_atomic(path, self.encode())
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path, half_life_days=SEARCH_HALF_LIFE_DAYS):
+        """The index saved at path, or None if there is none or it was saved with other settings"""
+        if not os.path.exists(path):
+            return None
+        index = cls(half_life_days)
+        with open(path, 'rb') as f:
+            data = f.read()
+        gc.disable()
+        try:
+            saved = marshal.loads(data)
+        except (ValueError, EOFError, TypeError):
+            return None
+        finally:
+            gc.enable()
+        if not isinstance(saved, dict) or saved.get('format') != cls.FORMAT or saved.get('half_life') != index.half_life:
+            return None
+        index.authors = saved['authors']
+        index.author_ids = {author: i for i, author in enumerate(index.authors)}
+        for name in ('doc_author', 'doc_seq', 'doc_len', 'doc_time', 'block_time'):
+            getattr(index, name).frombytes(saved[name])
+        for token, (ids, tfs) in saved['terms'].items():
+            postings = index.terms[token] = (array('I'), bytearray(tfs))
+            postings[0].frombytes(ids)
+        index.indexed = saved['indexed']
+        index.avgdl = saved['avgdl']
+        index.saved_heads = saved['heads']
+        return index
+
+
+def load_search_index(path, counts, fetch):
+    """The saved full-text index caught up with newer posts, or a new one if it cannot be"""
+    index = PostSearchIndex.load(path)
+    if index is None or not index.catch_up(counts, fetch):
+        index = PostSearchIndex()
+        index.catch_up(counts, fetch)
+        index.build_heads()
+    return index
+
+
+class FollowSuggestions:
+    """Who-to-follow suggestions for every user, scored with sparse matrix products
+
+    follows is the users x users follow matrix (row follows column) and interests the
+    users x hashtags matrix of log post counts, rows normalized to unit length. For a
+    block B of users the candidates are friends of friends (follows[B] @ follows),
+    followers (followers[B]) and the SUGGEST_TAG_AUTHORS heaviest users of their hashtags
+    (interests[B] @ tag_authors). Each candidate is scored on mutual follows, following
+    back and the cosine of hashtag use, and the SUGGESTIONS best of each user are kept in
+    users x SUGGESTIONS arrays. A follow or unfollow patches both matrices and rescores the
+    follower at once; the follower's followers and the followee are marked stale, since
+    their friends of friends or followers changed, and rescored when next asked for.
+    Users who sign up after the build get suggestions from the next one.
+    """
+
+    def __init__(self, usernames, follows, uses):
+        self.names = list(usernames)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+        edges = np.array(
+            [(self.ids[a], self.ids[b]) for a, b in follows if a in self.ids and b in self.ids and a != b],
+            dtype=np.int32
+        ).reshape(-1, 2)
+        self.follows = sparse.csr_matrix((np.ones(len(edges), np.float32), (edges[:, 0], edges[:, 1])), shape=(n, n))
+        # Duplicate edges were summed
+        self.follows.data[:] = 1
+        self.followers = self.follows.T.tocsr()
+
+        self.tags = sorted({tag for _, tag, _ in uses})
+        tag_ids = {tag: i for i, tag in enumerate(self.tags)}
+        counts = np.array([(self.ids[u], tag_ids[t], c) for u, t, c in uses if u in self.ids], dtype=np.int64).reshape(-1, 3)
+        weights = sparse.csr_matrix(
+            (np.log1p(counts[:, 2]).astype(np.float32), (counts[:, 0], counts[:, 1])), shape=(n, len(self.tags))
+        )
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+        self.interests = (sparse.diags(1 / np.where(norms > 0, norms, 1)) @ weights).tocsr()
+
+        # Rank each hashtag's users by weight and keep the heaviest, all columns at once
+        by_tag = weights.tocsc()
+        column = np.repeat(np.arange(len(self.tags)), np.diff(by_tag.indptr))
+        order = np.lexsort((-by_tag.data, column))
+        rank = np.arange(len(order)) - by_tag.indptr[column[order]]
+        keep = order[rank < SUGGEST_TAG_AUTHORS]
+        self.tag_authors = sparse.csr_matrix(
+            (np.ones(len(keep), np.float32), (column[keep], by_tag.indices[keep])), shape=(len(self.tags), n)
+        )
+
+        self.top = np.full((n, SUGGESTIONS), -1, np.int32)
+        self.top_mutual = np.zeros((n, SUGGESTIONS), np.int32)
+        self.top_follows_you = np.zeros((n, SUGGESTIONS), bool)
+        self.top_tag = np.full((n, SUGGESTIONS), -1, np.int32)
+        self.stale = set()
+
+    @classmethod
+    def build(cls, usernames, follows, uses):
+        """The matrices and every user's suggestions, for a background job"""
+        suggestions = cls(usernames, follows, uses)
+        suggestions.score(np.arange(len(suggestions.names)))
+        return suggestions
+
+    def score(self, users):
+        """Rescore the suggestions of an array of user ids, SUGGEST_BLOCK users per product"""
+        for start in range(0, len(users), SUGGEST_BLOCK):
+            block = users[start:start + SUGGEST_BLOCK]
+            own = self.follows[block]
+            mutual = own @ self.follows
+            follows_you = self.followers[block]
+            candidates = (mutual + follows_you + self.interests[block] @ self.tag_authors).tocoo()
+            rows, cols = candidates.row, candidates.col
+            # Never suggest yourself or an account you already follow
+            keep = (cols != block[rows]) & (self.values(own, rows, cols) == 0)
+            rows, cols = rows[keep], cols[keep]
+
+            mutual_counts = self.values(mutual, rows, cols)
+            back = self.values(follows_you, rows, cols) > 0
+            similarity = np.asarray(self.interests[block[rows]].multiply(self.interests[cols]).sum(axis=1)).ravel()
+            scores = (SUGGEST_MUTUAL_WEIGHT * mutual_counts + SUGGEST_FOLLOWS_YOU_WEIGHT * back
+                      + SUGGEST_TAG_WEIGHT * similarity)
+
+            # Best SUGGESTIONS per row: sort by (row, -score) and keep each row's first few
+            order = np.lexsort((cols, -scores, rows))
+            rank = np.arange(len(order)) - np.searchsorted(rows[order], rows[order])
+            best = order[rank < SUGGESTIONS]
+            rank = rank[rank < SUGGESTIONS]
+            targets = block[rows[best]]
+            self.top[block] = -1
+            self.top_tag[block] = -1
+            self.top[targets, rank] = cols[best]
+            self.top_mutual[targets, rank] = mutual_counts[best]
+            self.top_follows_you[targets, rank] = back[best]
+            # The hashtag contributing most to each kept pair's similarity
+            if len(best) and self.tags:
+                shared = self.interests[targets].multiply(self.interests[cols[best]]).tocsr()
+                self.top_tag[targets, rank] = np.where(
+                    shared.max(axis=1).toarray().ravel() > 0, np.asarray(shared.argmax(axis=1)).ravel(), -1
+                )
+            self.stale.difference_update(block.tolist())
+
+    @staticmethod
+    def values(matrix, rows, cols):
+        """matrix[rows[i], cols[i]] for every i as a flat array, 0 where nothing is stored"""
+        if not len(rows):
+            return np.zeros(0, matrix.dtype)
+        return np.asarray(matrix[rows, cols]).ravel()
+
+    def suggestions(self, username):
+        """[(username, mutual follows, follows you, shared hashtag or None)], best first"""
+        uid = self.ids.get(username)
+        if uid is None:
+            return []
+        if uid in self.stale:
+            self.score(np.array([uid]))
+        return [
+            (self.names[c], int(mutual), bool(back), self.tags[tag] if tag >= 0 else None)
+            for c, mutual, back, tag in zip(self.top[uid], self.top_mutual[uid], self.top_follows_you[uid], self.top_tag[uid])
+            if c >= 0
+        ]
+
+    def on_change(self, change):
+        """Patch the matrices for a follow or unfollow and refresh whose suggestions it affects"""
+        if change['op'] not in ('follow', 'unfollow'):
+            return
+        a, b = self.ids.get(change['user']), self.ids.get(change['target'])
+        if a is None or b is None or a == b or bool(self.follows[a, b]) == (change['op'] == 'follow'):
+            return
+        sign = 1 if change['op'] == 'follow' else -1
+        n = len(self.names)
+        self.follows = self.follows + sparse.csr_matrix(([sign], ([a], [b])), shape=(n, n), dtype=np.float32)
+        self.followers = self.followers + sparse.csr_matrix(([sign], ([b], [a])), shape=(n, n), dtype=np.float32)
+        self.follows.eliminate_zeros()
+        self.followers.eliminate_zeros()
+        self.score(np.array([a]))
+        self.stale.update(self.followers[a].indices.tolist())
+        self.stale.add(b)
+
+
+def timestamp_dates(timestamps):
+    """The days of "YYYY-MM-DD HH:MM" timestamps as a datetime64[D] array, NaT where one does not parse"""
+    try:
+        return np.array([timestamp[:10] for timestamp in timestamps], dtype='datetime64[D]')
+    except ValueError:
+        pass
+
+    # Some timestamp is malformed, so parse them one at a time to find which
+    def parse(timestamp):
+        try:
+            return np.datetime64(timestamp[:10], 'D')
+        except ValueError:
+            return np.datetime64('NaT', 'D')
+
+    return np.array([parse(timestamp) for timestamp in timestamps], dtype='datetime64[D]')
+
+
+class HabitStreaks:
+    """Daily activity of every user, overall and per hashtag, as bitsets with vectorized streaks
+
+    A series is a user's posts (tag None) or their posts with one hashtag. Each one is a
+    row of `bits`, where bit d (little-endian within a byte) is set when the series has a
+    post on day origin + d, so timestamps are parsed once: when the bitsets are built or
+    a post arrives. Streaks come from unpacking STREAK_BLOCK rows at a time and taking a
+    running maximum of the last inactive day along each row. A streak is current while
+    its last active day is today or yesterday. Leaderboards of current streaks are filled
+    from one pass over every series of a tag and rebuilt when the day changes; in between,
+    a new post rescores just its author.
+    """
+
+    def __init__(self, posts):
+        self.series = {}
+        self.tag_rows = {}
+        self.user_tags = {}
+        self.boards = {}
+        self.board_day = None
+        dates = timestamp_dates([timestamp for _, timestamp, _ in posts])
+        parsed = ~np.isnat(dates)
+        self.origin = dates[parsed].min() if parsed.any() else np.datetime64(datetime.now().date(), 'D')
+        days = (dates - self.origin).astype(np.int64)
+
+        rows = []
+        columns = []
+        for (author, _, tags), day, ok in zip(posts, days.tolist(), parsed.tolist()):
+            if ok:
+                for tag in [None] + sorted(set(tags)):
+                    rows.append(self.row(author, tag))
+                    columns.append(day)
+        rows = np.array(rows, np.int64)
+        columns = np.array(columns, np.int64)
+        self.bits = np.zeros((0, 0), np.uint8)
+        self.ensure(len(self.series), max(int(columns.max(initial=0)), self.today()[0]) + 1)
+        np.bitwise_or.at(self.bits, (rows, columns >> 3), (1 << (columns & 7)).astype(np.uint8))
+
+    def row(self, username, tag):
+        """The row of a series, adding it on first sight"""
+        rows = self.tag_rows.setdefault(tag, {})
+        row = rows.get(username)
+        if row is None:
+            row = rows[username] = len(self.series)
+            self.series[(username, tag)] = row
+            self.user_tags.setdefault(username, []).append(tag)
+        return row
+
+    def ensure(self, rows, days):
+        """Grow the bitsets, doubling, to hold rows series over days days"""
+        height, width = self.bits.shape
+        need = (days + 7) // 8
+        if rows > height or need > width:
+            grown = np.zeros((max(rows, 2 * height) if rows > height else height,
+                              max(need, 2 * width) if need > width else width), np.uint8)
+            grown[:height, :width] = self.bits
+            self.bits = grown
+
+    def today(self):
+        """(day number of today, its weekday with Monday 0)"""
+        today = datetime.now().date()
+        return int((np.datetime64(today, 'D') - self.origin).astype(np.int64)), today.weekday()
+
+    def stats(self, rows, weeks=0):
+        """Current streaks, best streaks and active days in each of the last weeks weeks, for an array of rows"""
+        today, weekday = self.today()
+        current = np.zeros(len(rows), np.int32)
+        longest = np.zeros(len(rows), np.int32)
+        weekly = np.zeros((len(rows), weeks), np.int32)
+        if today < 0:
+            return current, longest, weekly
+        position = np.arange(1, today + 2, dtype=np.int32)
+        # Calendar weeks from Monday, oldest first; the current one ends after today
+        first = today - weekday - 7 * (weeks - 1)
+        for start in range(0, len(rows), STREAK_BLOCK):
+            block = rows[start:start + STREAK_BLOCK]
+            active = np.unpackbits(self.bits[block], axis=1, count=today + 1, bitorder='little')
+            # Length of the run of active days ending on each day
+            run = position - np.maximum.accumulate(np.where(active, 0, position), axis=1)
+            longest[start:start + len(block)] = run.max(axis=1)
+            current[start:start + len(block)] = np.maximum(run[:, today], run[:, today - 1] if today else 0)
+            if weeks:
+                window = np.zeros((len(block), 7 * weeks), np.uint8)
+                since = max(first, 0)
+                window[:, since - first:today + 1 - first] = active[:, since:]
+                weekly[start:start + len(block)] = window.reshape(len(block), weeks, 7).sum(axis=2)
+        return current, longest, weekly
+
+    def profile(self, username):
+        """[(tag or None for every post, current streak, best streak, active days per week)], overall first"""
+        tags = self.user_tags.get(username, [])
+        current, longest, weekly = self.stats(np.array([self.tag_rows[tag][username] for tag in tags], np.int64), STREAK_WEEKS)
+        return sorted(
+            zip(tags, current.tolist(), longest.tolist(), weekly.tolist()),
+            key=lambda habit: (habit[0] is not None, -habit[1], -habit[2], habit[0] or "")
+        )
+
+    def board(self, tag=None):
+        """Leaderboard of current streaks over every post, or over posts with tag"""
+        today = self.today()[0]
+        if self.board_day != today:
+            self.boards = {}
+            self.board_day = today
+        board = self.boards.get(tag)
+        if board is None:
+            rows = self.tag_rows.get(tag, {})
+            current = self.stats(np.fromiter(rows.values(), np.int64, len(rows)))[0]
+            board = self.boards[tag] = Leaderboard.from_scores(dict(zip(rows, current.tolist())))
+        return board
+
+    def rankings(self, tag=None, offset=0, limit=RANKINGS_PAGE_SIZE):
+        """[(rank, username, streak)] for one page and the number of users on a streak"""
+        board = self.board(tag)
+        return board.page(offset, limit), board.total
+
+    def rank(self, username, tag=None):
+        return self.board(tag).rank(username)
+
+    def tags(self, n=TRENDING_TAGS):
+        """The n hashtags the most users have posted with"""
+        return heapq.nlargest(n, (tag for tag in self.tag_rows if tag is not None), key=lambda tag: len(self.tag_rows[tag]))
+
+    def on_change(self, change):
+        """Set the day of a new post in its author's series and rescore them on built boards"""
+        if change['op'] != 'post':
+            return
+        author, post = change['user'], change['post']
+        date = timestamp_dates([post.get('timestamp', '')])[0]
+        if np.isnat(date) or date < self.origin:
+            return
+        day = int((date - self.origin).astype(np.int64))
+        tags = [None] + sorted(set(post.get('tags', [])))
+        rows = [self.row(author, tag) for tag in tags]
+        self.ensure(len(self.series), day + 1)
+        self.bits[rows, day >> 3] |= np.uint8(1 << (day & 7))
+        if self.board_day == self.today()[0]:
+            for tag, streak in zip(tags, self.stats(np.array(rows, np.int64))[0].tolist()):
+                if tag in self.boards:
+                    self.boards[tag].set(author, streak)
+
+
+def change_topics(change):
+    """Topics a change is published under: ('post', id), ('user', name), 'posts', 'likes', 'follows', 'users'
+
+    The app also publishes {'op': 'suggestions'} and {'op': 'streaks'} when a rebuilt
+    FollowSuggestions or HabitStreaks is ready.
+    """
+    op = change['op']
+    if op == 'signup':
+        return ['users']
+    if op == 'post':
+        return ['posts', ('user', change['user'])]
+    if op == 'like':
+        return ['likes', ('post', change['post'])]
+    if op in ('follow', 'unfollow'):
+        return ['follows', ('user', change['user']), ('user', change['target'])]
+    if op in ('suggestions', 'streaks'):
+        return [op]
+    return []
+
+
+class ChangeNotifier:
+    """Publish/subscribe on data changes so views can patch just the widgets they affect"""
+
+    def __init__(self):
+        self.subscribers = {}
+
+    def subscribe(self, topic, callback, owner=None):
+        """Call callback(change) for changes on topic; drops itself when owner is destroyed"""
+        self.subscribers.setdefault(topic, []).append(callback)
+        if owner is not None:
+            def on_destroy(event):
+                if str(event.widget) == str(owner):
+                    self.unsubscribe(topic, callback)
+            owner.bind("<Destroy>", on_destroy, add="+")
+
+    def unsubscribe(self, topic, callback):
+        callbacks = self.subscribers.get(topic, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            self.subscribers.pop(topic, None)
+
+    def publish(self, change):
+        """Notify every subscriber of the topics this change touches"""
+        for topic in change_topics(change):
+            for callback in list(self.subscribers.get(topic, [])):
+                # An earlier callback may have torn down the view this one belongs to
+                if callback in self.subscribers.get(topic, []):
+                    callback(change)
+
+
+def maximize(window):
+    """Maximize a window; 'zoomed' is a state on Windows and macOS but an attribute on X11"""
+    try:
+        window.state('zoomed')
+    except tk.TclError:
+        window.attributes('-zoomed', True)
+
+
+class LazyNotebook:
+    """ttk.Notebook whose tabs are built on first selection and kept until invalidated"""
+
+    def __init__(self, parent):
+        self.notebook = ttk.Notebook(parent)
+        self.builders = {}
+        self.built = set()
+        self.notebook.bind("<<NotebookTabChanged>>", lambda e: self.build(self.notebook.select()))
+
+    def add(self, text, builder):
+        """Add an empty tab that runs builder(frame) the first time it is shown"""
+        frame = ttk.Frame(self.notebook)
+        self.notebook.add(frame, text=text)
+        self.builders[str(frame)] = (frame, builder)
+        return frame
+
+    def build(self, name):
+        """Build the tab with the given widget name unless it is already built"""
+        if not name or name in self.built or name not in self.builders:
+            return
+        self.built.add(name)
+        frame, builder = self.builders[name]
+        builder(frame)
+
+    def is_selected(self, frame):
+        return self.notebook.select() == str(frame)
+
+    def invalidate(self, frame):
+        """Drop a tab's widgets; it is rebuilt now if visible, otherwise on next selection"""
+        name = str(frame)
+        if name not in self.built:
+            return
+        self.built.discard(name)
+        for child in frame.winfo_children():
+            child.destroy()
+        if self.is_selected(frame):
+            self.build(name)
+
+    def refresh(self, frame, patch):
+        """Patch a visible tab in place, or just invalidate it while it is hidden"""
+        if self.is_selected(frame):
+            patch()
+        else:
+            self.invalidate(frame)
+
+
+class VirtualList:
+    """Scrollable canvas that only builds widgets for the rows near the viewport
+
+    render(row, item) fills an empty row frame. Rows that scroll out of range go back to
+    a pool and are reused for the next row that scrolls in: update(row, item) may patch a
+    recycled row in place and return True, otherwise its children are rebuilt with render.
+    Rows that were never shown count with the average measured height, so the scrollbar
+    covers the whole list without building it. on_end() is called whenever the last row
+    comes into range, which is where paged lists fetch their next page.
+    """
+
+    def __init__(self, parent, render, key=None, update=None, bg="#1a1a1a", row_bg=None,
+                 anchor="n", gap=0, estimate=200, overscan=800, empty_text=None, empty_fg="white",
+                 on_end=None):
+        self.render = render
+        self.key = key or (lambda item: item)
+        self.update = update
+        self.row_bg = row_bg
+        self.anchor = anchor
+        self.gap = gap
+        self.default_estimate = estimate
+        self.overscan = overscan
+        self.empty_text = empty_text
+        self.empty_fg = empty_fg
+        self.on_end = on_end
+
+        self.items = []
+        self.heights = []
+        self.offsets = [0]
+        self.layout_dirty = True
+        self.rows = {}
+        self.pool = []
+        self.empty_item = None
+        self.refresh_pending = False
+
+        self.canvas = tk.Canvas(parent, bg=bg, highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.yview)
+        self.canvas.configure(yscrollcommand=self.on_scroll)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.bind("<Configure>", self.on_resize)
+
+    def set_items(self, items):
+        """Replace the whole list"""
+        for index in list(self.rows):
+            self.release(index)
+        self.items = list(items)
+        self.heights = [None] * len(self.items)
+        self.layout_dirty = True
+        self.schedule_refresh()
+
+    def append(self, items):
+        """Add rows at the bottom"""
+        items = list(items)
+        self.items.extend(items)
+        self.heights.extend([None] * len(items))
+        self.layout_dirty = True
+        self.schedule_refresh()
+
+    def insert(self, index, item):
+        """Add a row, shifting the rows below it down"""
+        self.rows = {(i + 1 if i >= index else i): row for i, row in self.rows.items()}
+        self.items.insert(index, item)
+        self.heights.insert(index, None)
+        self.layout_dirty = True
+        self.schedule_refresh()
+
+    def index_of(self, key):
+        """Position of the row with the given key, or None"""
+        for index, item in enumerate(self.items):
+            if self.key(item) == key:
+                return index
+        return None
+
+    def remove(self, key):
+        """Drop the row with the given key, shifting the rows below it up"""
+        index = self.index_of(key)
+        if index is None:
+            return
+        if index in self.rows:
+            self.release(index)
+        self.rows = {(i - 1 if i > index else i): row for i, row in self.rows.items()}
+        del self.items[index]
+        del self.heights[index]
+        self.layout_dirty = True
+        self.schedule_refresh()
+
+    def refresh_item(self, key):
+        """Re-render one row in place if it is currently materialized"""
+        index = self.index_of(key)
+        if index is None or index not in self.rows:
+            return
+        row, _ = self.rows[index]
+        if not (self.update and self.update(row, self.items[index])):
+            for child in row.winfo_children():
+                child.destroy()
+            self.render(row, self.items[index])
+
+    def row_x(self):
+        """Horizontal position rows are anchored at"""
+        return self.canvas.winfo_width() // 2 if self.anchor == "n" else 0
+
+    def relayout(self):
+        """Recompute row offsets and the scroll region from measured/estimated heights"""
+        measured = [h for h in self.heights if h is not None]
+        estimate = sum(measured) / len(measured) if measured else self.default_estimate
+        self.offsets = [0]
+        self.offsets.extend(accumulate((estimate if h is None else h) + self.gap for h in self.heights))
+        self.layout_dirty = False
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), self.offsets[-1]))
+        x = self.row_x()
+        for index, (row, window) in self.rows.items():
+            self.canvas.coords(window, x, self.offsets[index])
+
+        if self.items or not self.empty_text:
+            if self.empty_item is not None:
+                self.canvas.delete(self.empty_item)
+                self.empty_item = None
+        elif self.empty_item is None:
+            self.empty_item = self.canvas.create_text(
+                x, 20, text=self.empty_text, fill=self.empty_fg, font=("Arial", 12), anchor=self.anchor
+            )
+        else:
+            self.canvas.coords(self.empty_item, x, 20)
+            self.canvas.itemconfigure(self.empty_item, text=self.empty_text)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_refresh()
+
+    def on_resize(self, event):
+        self.layout_dirty = True
+        self.schedule_refresh()
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        """Coalesce scroll/resize/data events into one refresh per idle cycle"""
+        if not self.refresh_pending:
+            self.refresh_pending = True
+            self.canvas.after_idle(self.refresh)
+
+    def visible_range(self):
+        """Indices of the rows overlapping the viewport plus the overscan margin"""
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(bisect_right(self.offsets, top - self.overscan) - 1, 0)
+        last = min(bisect_left(self.offsets, bottom + self.overscan), len(self.items))
+        return first, last
+
+    def refresh(self):
+        """Materialize rows that came into range and release the ones that left it"""
+        self.refresh_pending = False
+        if not self.canvas.winfo_exists():
+            return
+        if self.layout_dirty:
+            self.relayout()
+        first, last = self.visible_range()
+        for index in [i for i in self.rows if i < first or i >= last]:
+            self.release(index)
+        for index in range(first, last):
+            if index not in self.rows:
+                self.materialize(index)
+        if self.layout_dirty:
+            # Real heights differ from the estimate; place rows again and fill any gap
+            self.relayout()
+            self.schedule_refresh()
+        elif last == len(self.items) and self.on_end:
+            self.on_end()
+
+    def materialize(self, index):
+        """Show the row at index, reusing a pooled row frame when one is free"""
+        item = self.items[index]
+        x = self.row_x()
+        if self.pool:
+            row, window = self.pool.pop()
+            if not (self.update and self.update(row, item)):
+                for child in row.winfo_children():
+                    child.destroy()
+                self.render(row, item)
+            self.canvas.coords(window, x, self.offsets[index])
+            self.canvas.itemconfigure(window, state="normal")
+        else:
+            row = tk.Frame(self.canvas, bg=self.row_bg) if self.row_bg else ttk.Frame(self.canvas)
+            # Content filled in later (e.g. an image arriving) changes the row's height
+            row.bind("<Configure>", lambda event, r=row: self.on_row_resize(r))
+            self.render(row, item)
+            window = self.canvas.create_window(x, self.offsets[index], window=row, anchor=self.anchor)
+        self.rows[index] = (row, window)
+        row.update_idletasks()
+        height = row.winfo_reqheight()
+        if self.heights[index] != height:
+            self.heights[index] = height
+            self.layout_dirty = True
+
+    def on_row_resize(self, row):
+        """Re-measure a shown row whose content changed size after it was rendered"""
+        for index, (shown, _) in self.rows.items():
+            if shown is row:
+                height = row.winfo_reqheight()
+                if self.heights[index] != height:
+                    self.heights[index] = height
+                    self.layout_dirty = True
+                    self.schedule_refresh()
+                return
+
+    def release(self, index):
+        """Hide a row and keep its frame for reuse"""
+        row, window = self.rows.pop(index)
+        if len(self.pool) < VIRTUAL_LIST_POOL:
+            if not self.update:
+                # It gets rebuilt on reuse anyway; clearing now cancels work pending for it
+                for child in row.winfo_children():
+                    child.destroy()
+            self.canvas.itemconfigure(window, state="hidden")
+            self.pool.append((row, window))
+        else:
+            self.canvas.delete(window)
+            row.destroy()
+
+
+class JsonStore:
+    """Storage backend keeping every user in memory, persisted to a snapshot plus the change log
+
+    All UI reads and writes go through the same methods as SqliteStore; mutations are
+    applied as change records and published on self.notifier. With a binary snapshot,
+    post bodies stay encoded until a screen asks for the posts holding them.
+    """
+
+    def __init__(self, images, data_file=None, log_file=LOG_FILE):
+        self.images = images
+        if data_file is None:
+            data_file = BINARY_SNAPSHOT_FILE if SNAPSHOT_FORMAT == "binary" else DATA_FILE
+        self.data_file = data_file
+        self.bodies = None
+        self.reloaded = False
+        self.change_log = ChangeLog(data_file, log_file)
+        self.notifier = ChangeNotifier()
+        # Follows and likes live in the graph, which apply_change updates with the users dict
+        self.graph = SocialGraph()
+        self.users = self.load_data()
+        self.writer = SnapshotWriter(self.encode)
+
+        # Indexes are subscribed first so views notified after them see fresh data
+        self.tag_index = TagIndex()
+        self.tag_index.build(self.users)
+        self.notifier.subscribe('posts', lambda change: self.tag_index.add(change['user'], change['post']))
+        
+        self.user_search = UserSearchIndex()
+        self.user_search.build(self.users)
+        self.notifier.subscribe('users', self.user_search.on_change)
+        
+        self.rankings_index = RankingIndex(self.users, self.graph, self.tag_index)
+        self.rankings_index.build()
+        for topic in ('posts', 'likes', 'follows'):
+            self.notifier.subscribe(topic, self.rankings_index.on_change)
+        
+        self.timelines = TimelineStore(self.users, self.graph)
+        if FEED_MODE == "write":
+            self.notifier.subscribe('posts', self.timelines.on_change)
+            self.notifier.subscribe('follows', self.timelines.on_change)
+        
+        # The full-text index is loaded on the first search
+        self.post_search = None
+        self.notifier.subscribe('posts', self.index_post)
+        STARTUP.lap("indexes")
+    
+    def read_users(self, source):
+        """Read a snapshot and replay the change log on top"""
+        if os.path.exists(source) and is_binary_snapshot(source):
+            users, self.bodies = read_binary_snapshot(source, lazy=True)
+        else:
+            users, self.bodies = read_snapshot(source), None
+        STARTUP.lap("snapshot")
+        assign_post_ids(users)
+        self.graph.build(users)
+        self.change_log.replay(users, self.graph)
+        STARTUP.lap("log replay")
+        return users
+    
+    @METRICS.timed("load data")
+    def load_data(self):
+        """Load user data from the snapshot and replay the change log on top"""
+        source = self.data_file
+        # The first start with a binary snapshot converts the JSON data file
+        converting = source != DATA_FILE and not os.path.exists(source) and os.path.exists(DATA_FILE)
+        if converting:
+            source = DATA_FILE
+        users = self.read_users(source)
+        leftover_log = self.change_log.size() or os.path.exists(self.change_log.compacting_path)
+        # Older data files embed images as base64; moving them out needs one full rewrite
+        migrated = migrate_inline_images(users, self.images) or converting
+        if PERSISTENCE_MODE == "log" and not migrated:
+            if self.change_log.size() >= LOG_COMPACT_BYTES or os.path.exists(self.change_log.compacting_path):
+                self.change_log.compact()
+        elif migrated or leftover_log:
+            # Fold the leftover log in right away so nothing replays stale records
+            with self.change_log.lock:
+                self.graph.export(users)
+                write_atomic(self.data_file, encode_users(self.data_file, users, self.bodies))
+                for path in (self.change_log.log_path, self.change_log.compacting_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+        return users
+    
+    def reload(self):
+        """Start over from disk after another instance compacted away records not seen yet"""
+        users = self.read_users(self.data_file)
+        with self.writer.lock:
+            self.users.clear()
+            self.users.update(users)
+        self.tag_index.build(self.users)
+        self.user_search.build(self.users)
+        self.rankings_index.build()
+        self.timelines.clear()
+        self.post_search = None
+        self.reloaded = True
+    
+    def save_data(self):
+        """Queue a save of user data to the snapshot on the writer thread"""
+        self.writer.request()
+    
+    def encode(self):
+        """Snapshot files for the writer thread, with follows and likes written back from the graph"""
+        self.graph.export(self.users)
+        return [(self.data_file, encode_users(self.data_file, self.users, self.bodies))]
+    
+    @METRICS.timed("record change")
+    def record_change(self, change):
+        """Apply a mutation in memory and persist it according to PERSISTENCE_MODE
+
+        In log mode the change was prepared optimistically: changes other instances logged
+        meanwhile are merged in first and the change is rebased on them. Returns False if
+        it no longer applies, e.g. the username was taken or the like already counted.
+        """
+        if PERSISTENCE_MODE != "log":
+            with self.writer.lock:
+                apply_change(self.users, change, self.graph)
+            self.save_data()
+            self.notifier.publish(change)
+            return True
+        with self.change_log.lock:
+            external = self.pull()
+            applies = self.rebase(change)
+            if applies:
+                with self.writer.lock:
+                    apply_change(self.users, change, self.graph)
+                self.change_log.append(change)
+        for record in external:
+            self.notifier.publish(record)
+        if applies:
+            self.notifier.publish(change)
+        return applies
+    
+    def rebase(self, change):
+        """Check a change against the current state, renumbering a new post if needed"""
+        op, user = change['op'], change['user']
+        if op == 'signup':
+            return user not in self.users
+        if op == 'post':
+            change['post']['id'] = f"{user}:{len(self.users[user].get('posts', []))}"
+            return True
+        if op == 'like':
+            return find_post(self.users, change['post']) is not None and not self.graph.has_liked(change['post'], user)
+        if op == 'follow':
+            return not self.graph.is_following(user, change['target'])
+        if op == 'unfollow':
+            return self.graph.is_following(user, change['target'])
+        return True
+    
+    def pull(self):
+        """Apply changes other instances logged since the last look (the caller holds the log lock)"""
+        records = self.change_log.read_new()
+        if records is None:
+            self.reload()
+            return []
+        with self.writer.lock:
+            for record in records:
+                try:
+                    apply_change(self.users, record, self.graph)
+                except KeyError:
+                    pass
+        return records
+    
+    def sync(self):
+        """Merge in what other instances changed; only a stat() call when nothing did
+
+        Views hear about merged changes through self.notifier as usual. Returns "reload"
+        when everything was reloaded from disk instead, so every view has to be rebuilt.
+        """
+        if PERSISTENCE_MODE == "log" and self.change_log.changed():
+            with self.change_log.lock:
+                external = self.pull()
+            for record in external:
+                self.notifier.publish(record)
+        if self.reloaded:
+            self.reloaded = False
+            return "reload"
+        return None
+    
+    def fill(self, posts):
+        """Decode the bodies of posts a screen is about to show"""
+        if self.bodies is not None:
+            with self.writer.lock:
+                for post in posts:
+                    self.bodies.fill(post)
+        return posts
+    
+    def flush(self):
+        """Wait until every change so far is on disk"""
+        self.writer.flush()
+        self.change_log.flush()
+        if self.post_search is not None:
+            self.post_search.save(self.data_file + ".search")
+    
+    def close(self):
+        self.writer.close()
+        self.change_log.flush()
+        if self.post_search is not None:
+            self.post_search.save(self.data_file + ".search")
+        if self.bodies is not None:
+            self.bodies.close()
+    
+    # ----------- Users -------------
+    
+    def user_exists(self, username):
+        return username in self.users
+    
+    def check_password(self, username, password):
+        return username in self.users and self.users[username]['password'] == password
+    
+    def add_user(self, username, password, bio):
+        """Create an account, returns False if the name is taken"""
+        if username in self.users:
+            return False
+        return self.record_change({
+            'op': 'signup',
+            'user': username,
+            'data': {
+                'password': password,
+                'bio': bio,
+                'followers': [],
+                'following': [],
+                'posts': [],
+                'likes': []
+            }
+        })
+    
+    def get_user(self, username):
+        """Profile fields and counters shown on cards"""
+        data = self.users[username]
+        return {
+            'username': username,
+            'bio': data.get('bio', ''),
+            'post_count': len(data.get('posts', [])),
+            'follower_count': self.graph.follower_count(username),
+            'following_count': self.graph.following_count(username)
+        }
+    
+    def followers(self, username):
+        return self.graph.followers_of(username)
+    
+    def following(self, username):
+        return self.graph.following_of(username)
+    
+    def is_following(self, username, target):
+        return self.graph.is_following(username, target)
+    
+    def follow(self, username, target):
+        self.record_change({'op': 'follow', 'user': username, 'target': target})
+    
+    def unfollow(self, username, target):
+        self.record_change({'op': 'unfollow', 'user': username, 'target': target})
+    
+    def search_users(self, query, offset=0, limit=DISCOVER_PAGE_SIZE, exclude=None):
+        return self.user_search.search(query, offset, limit, exclude)
+    
+    # ----------- Posts -------------
+    
+    def add_post(self, username, content, image_id=None):
+        """Publish a post and return it"""
+        new_post = {
+            'id': f"{username}:{len(self.users[username].get('posts', []))}",
+            'content': content,
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M"),
+            'likes': [],
+            'image_id': image_id,
+            # Extract hashtags (case-insensitive, store lowercase)
+            'tags': extract_tags(content)
+        }
+        # Insert at front of user's posts
+        self.record_change({'op': 'post', 'user': username, 'post': new_post})
+        return new_post
+    
+    def user_posts(self, username):
+        """A user's posts, newest first"""
+        return self.fill(self.users[username].get('posts', []))
+    
+    def like(self, username, post_id):
+        """Like a post, returns False if it was already liked"""
+        if self.graph.has_liked(post_id, username):
+            return False
+        return self.record_change({'op': 'like', 'post': post_id, 'user': username})
+    
+    def has_liked(self, username, post_id):
+        return self.graph.has_liked(post_id, username)
+    
+    def like_count(self, post_id):
+        return self.graph.like_count(post_id)
+    
+    def feed(self, username, cursor=None, limit=FEED_PAGE_SIZE):
+        """One page of a home timeline (own posts + following) and the next cursor"""
+        if FEED_MODE == "write":
+            page, cursor = self.timelines.page(username, cursor, limit)
+        else:
+            authors = self.graph.following_of(username) + [username]
+            page, cursor = merge_timeline(self.users, authors, cursor, limit)
+        self.fill(post for _, post in page)
+        return page, cursor
+    
+    def explore(self, tag=None, cursor=None, limit=FEED_PAGE_SIZE):
+        """One page of posts with a tag (every post when tag is None) and the next cursor"""
+        page, cursor = self.tag_index.posts(tag, cursor, limit)
+        self.fill(post for _, post in page)
+        return page, cursor
+    
+    def trending_tags(self, n=TRENDING_TAGS):
+        return self.tag_index.trending(n)
+    
+    # ----------- Search -------------
+    
+    def indexable_posts(self, author, start):
+        """(seq, content, timestamp) of an author's posts from seq start on, oldest first"""
+        posts = self.users[author].get('posts', [])
+        for seq, post in enumerate(reversed(posts[:len(posts) - start]), start):
+            content = self.bodies.text(post['_body']) if '_body' in post else post.get('content', '')
+            yield seq, content, post.get('timestamp', '')
+    
+    def index_post(self, change):
+        if self.post_search is not None:
+            self.post_search.on_change(change)
+    
+    def search_posts(self, query, offset=0, limit=FEED_PAGE_SIZE):
+        """One page of posts matching a free-text query, best first, and whether more follow"""
+        if self.post_search is None:
+            counts = {username: len(data.get('posts', [])) for username, data in self.users.items()}
+            self.post_search = load_search_index(self.data_file + ".search", counts, self.indexable_posts)
+        hits = self.post_search.search(query, offset + limit)
+        page = [(author, find_post(self.users, post_id)) for author, post_id, _ in hits[offset:]]
+        # An indexed post can be gone after a reload
+        page = [(author, post) for author, post in page if post is not None]
+        self.fill([post for _, post in page])
+        return page, len(hits) == offset + limit
+    
+    # ----------- Analytics -------------
+    
+    def interest_graph(self):
+        """(usernames, (follower, followee) edges, (username, hashtag, posts) uses) for FollowSuggestions"""
+        names = self.graph.names
+        follows = [(names[a], names[b]) for a, following in enumerate(self.graph.following) for b in following]
+        uses = Counter((author, tag) for tag, entries in self.tag_index.tags.items() for _, author, _ in entries)
+        return list(self.users), follows, [(author, tag, count) for (author, tag), count in uses.items()]
+    
+    def post_activity(self):
+        """(author, timestamp, tags) of every post, for HabitStreaks"""
+        return [(author, post.get('timestamp', ''), post.get('tags', [])) for _, author, post in self.tag_index.all]
+    
+    # ----------- Rankings -------------
+    
+    def rankings(self, key='posts', window='all', offset=0, limit=RANKINGS_PAGE_SIZE):
+        """[(rank, username, score)] for one page and the number of ranked users"""
+        board = self.rankings_index.board(key, window)
+        return board.page(offset, limit), board.total
+    
+    def rank(self, username, key='posts', window='all'):
+        return self.rankings_index.board(key, window).rank(username)
+
+
+class SqliteStore:
+    """Storage backend on stdlib sqlite3 (WAL mode) with the same interface as JsonStore
+
+    Only the rows a screen shows are loaded: feed, explore, rankings and user search run as
+    indexed SQL with keyset or LIMIT/OFFSET pagination. Post keys and cursors match the
+    JSON backend, so views cannot tell the two apart.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            username_lower TEXT NOT NULL,
+            password TEXT NOT NULL,
+            bio TEXT NOT NULL DEFAULT '',
+            post_count INTEGER NOT NULL DEFAULT 0,
+            likes_received INTEGER NOT NULL DEFAULT 0,
+            follower_count INTEGER NOT NULL DEFAULT 0,
+            following_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS users_lower ON users (username_lower, username);
+        CREATE INDEX IF NOT EXISTS users_by_posts ON users (post_count DESC, username);
+        CREATE INDEX IF NOT EXISTS users_by_likes ON users (likes_received DESC, username);
+        CREATE INDEX IF NOT EXISTS users_by_followers ON users (follower_count DESC, username);
+
+        CREATE TABLE IF NOT EXISTS user_tokens (
+            token TEXT NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (token, username)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS posts (
+            id TEXT PRIMARY KEY,
+            author TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            content TEXT NOT NULL DEFAULT '',
+            timestamp TEXT NOT NULL DEFAULT '',
+            image_id TEXT,
+            tags TEXT NOT NULL DEFAULT '[]',
+            like_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS posts_by_author ON posts (author, timestamp DESC, seq DESC);
+        CREATE INDEX IF NOT EXISTS posts_by_time ON posts (timestamp DESC, author DESC, seq DESC);
+
+        CREATE TABLE IF NOT EXISTS post_tags (
+            tag TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            author TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            post_id TEXT NOT NULL,
+            PRIMARY KEY (tag, timestamp, author, seq)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS likes (
+            post_id TEXT NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (post_id, username)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS likes_by_user ON likes (username);
+
+        CREATE TABLE IF NOT EXISTS follows (
+            follower TEXT NOT NULL,
+            followee TEXT NOT NULL,
+            PRIMARY KEY (follower, followee)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS follows_by_followee ON follows (followee, follower);
+
+        CREATE TABLE IF NOT EXISTS changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            record TEXT NOT NULL
+        );
+    """
+
+    POST_COLUMNS = "id, author, seq, content, timestamp, image_id, tags"
+
+    RANK_COLUMNS = {'posts': "post_count", 'likes': "likes_received", 'followers': "follower_count"}
+    WEEK_SCORES = {'posts': "COUNT(*)", 'likes': "SUM(like_count)"}
+
+    # Change records kept for other instances to catch up from
+    CHANGE_HISTORY = 10000
+
+    def __init__(self, path=SQLITE_FILE):
+        import sqlite3
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        self.notifier = ChangeNotifier()
+        self.data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        self.last_change = self.db.execute("SELECT COALESCE(MAX(id), 0) FROM changes").fetchone()[0]
+        self.own_changes = set()
+        # The full-text index is loaded on the first search
+        self.post_search = None
+        self.notifier.subscribe('posts', self.index_post)
+        STARTUP.lap("open database")
+
+    def flush(self):
+        """Every change commits in its own transaction, so only the WAL needs folding back"""
+        with self.db:
+            self.db.execute(
+                "DELETE FROM changes WHERE id <= (SELECT MAX(id) FROM changes) - ?", (self.CHANGE_HISTORY,)
+            )
+        self.db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        if self.post_search is not None:
+            self.post_search.save(self.path + ".search")
+
+    def log_change(self, change):
+        """Record a change for other instances' sync(), inside the caller's transaction"""
+        cursor = self.db.execute("INSERT INTO changes (record) VALUES (?)", (json.dumps(change),))
+        self.own_changes.add(cursor.lastrowid)
+
+    def sync(self):
+        """Publish changes other instances committed; one PRAGMA when there are none
+
+        Every mutation runs in its own transaction and the database merges concurrent
+        writers, so there is never anything to reload.
+        """
+        version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.data_version:
+            return None
+        self.data_version = version
+        rows = self.db.execute(
+            "SELECT id, record FROM changes WHERE id > ? ORDER BY id", (self.last_change,)
+        ).fetchall()
+        for change_id, record in rows:
+            self.last_change = change_id
+            if change_id in self.own_changes:
+                self.own_changes.discard(change_id)
+            else:
+                self.notifier.publish(json.loads(record))
+        return None
+
+    def close(self):
+        if self.post_search is not None:
+            self.post_search.save(self.path + ".search")
+        self.db.close()
+
+    def row_to_post(self, row):
+        post_id, author, seq, content, timestamp, image_id, tags = row
+        return author, {
+            'id': post_id,
+            'content': content,
+            'timestamp': timestamp,
+            'image_id': image_id,
+            'tags': json.loads(tags)
+        }
+
+    def posts_page(self, sql, params, limit):
+        """Run a keyset query ordered newest first and build (page, next cursor)"""
+        rows = self.db.execute(sql, params + [limit]).fetchall()
+        page = [self.row_to_post(row) for row in rows]
+        if len(rows) < limit:
+            return page, None
+        _, author, seq, _, timestamp, _, _ = rows[-1]
+        return page, encode_cursor((timestamp, author, seq))
+
+    # ----------- Users -------------
+
+    def user_exists(self, username):
+        return self.db.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def check_password(self, username, password):
+        row = self.db.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None and row[0] == password
+
+    def add_user(self, username, password, bio):
+        """Create an account, returns False if the name is taken"""
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO users (username, username_lower, password, bio) VALUES (?, ?, ?, ?)",
+                (username, username.lower(), password, bio)
+            )
+            if not cursor.rowcount:
+                return False
+            self.db.executemany(
+                "INSERT OR IGNORE INTO user_tokens (token, username) VALUES (?, ?)",
+                [(token, username) for token in set(re.findall(r"\w+", bio.lower()))]
+            )
+            change = {'op': 'signup', 'user': username, 'data': {'bio': bio}}
+            self.log_change(change)
+        self.notifier.publish(change)
+        return True
+
+    def get_user(self, username):
+        """Profile fields and counters shown on cards"""
+        bio, posts, followers, following = self.db.execute(
+            "SELECT bio, post_count, follower_count, following_count FROM users WHERE username = ?",
+            (username,)
+        ).fetchone()
+        return {
+            'username': username,
+            'bio': bio,
+            'post_count': posts,
+            'follower_count': followers,
+            'following_count': following
+        }
+
+    def followers(self, username):
+        return [r[0] for r in self.db.execute("SELECT follower FROM follows WHERE followee = ?", (username,))]
+
+    def following(self, username):
+        return [r[0] for r in self.db.execute("SELECT followee FROM follows WHERE follower = ?", (username,))]
+
+    def is_following(self, username, target):
+        return self.db.execute(
+            "SELECT 1 FROM follows WHERE follower = ? AND followee = ?", (username, target)
+        ).fetchone() is not None
+
+    def follow(self, username, target):
+        change = {'op': 'follow', 'user': username, 'target': target}
+        with self.db:
+            cursor = self.db.execute("INSERT OR IGNORE INTO follows VALUES (?, ?)", (username, target))
+            if cursor.rowcount:
+                self.db.execute("UPDATE users SET following_count = following_count + 1 WHERE username = ?", (username,))
+                self.db.execute("UPDATE users SET follower_count = follower_count + 1 WHERE username = ?", (target,))
+                self.log_change(change)
+        if cursor.rowcount:
+            self.notifier.publish(change)
+
+    def unfollow(self, username, target):
+        change = {'op': 'unfollow', 'user': username, 'target': target}
+        with self.db:
+            cursor = self.db.execute("DELETE FROM follows WHERE follower = ? AND followee = ?", (username, target))
+            if cursor.rowcount:
+                self.db.execute("UPDATE users SET following_count = following_count - 1 WHERE username = ?", (username,))
+                self.db.execute("UPDATE users SET follower_count = follower_count - 1 WHERE username = ?", (target,))
+                self.log_change(change)
+        if cursor.rowcount:
+            self.notifier.publish(change)
+
+    def search_users(self, query, offset=0, limit=DISCOVER_PAGE_SIZE, exclude=None):
+        """Same ordering as UserSearchIndex: username prefix matches, then bio word matches"""
+        query = query.strip().lower()
+        hi = query + "\uffff"
+        matches = "SELECT username, 0 AS grp, username_lower AS k FROM users WHERE username_lower >= ? AND username_lower < ?"
+        params = [query, hi]
+        words = query.split()
+        if words:
+            bio_match = " INTERSECT ".join("SELECT username FROM user_tokens WHERE token >= ? AND token < ?" for _ in words)
+            matches += (
+                " UNION ALL SELECT username, 1, username FROM users"
+                f" WHERE username IN ({bio_match}) AND NOT (username_lower >= ? AND username_lower < ?)"
+            )
+            for word in words:
+                params += [word, word + "\uffff"]
+            params += [query, hi]
+        matches = f"SELECT username, grp, k FROM ({matches}) WHERE username IS NOT ?"
+        params.append(exclude)
+        total = self.db.execute(f"SELECT COUNT(*) FROM ({matches})", params).fetchone()[0]
+        rows = self.db.execute(f"{matches} ORDER BY grp, k, username LIMIT ? OFFSET ?", params + [limit, offset])
+        return [r[0] for r in rows], total
+
+    # ----------- Posts -------------
+
+    def add_post(self, username, content, image_id=None):
+        """Publish a post and return it"""
+        tags = extract_tags(content)
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+        with self.db:
+            # Bumping the counter first takes the write lock, so no other instance can claim seq
+            self.db.execute("UPDATE users SET post_count = post_count + 1 WHERE username = ?", (username,))
+            seq = self.db.execute("SELECT post_count - 1 FROM users WHERE username = ?", (username,)).fetchone()[0]
+            post_id = f"{username}:{seq}"
+            self.db.execute(
+                f"INSERT INTO posts ({self.POST_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (post_id, username, seq, content, timestamp, image_id, json.dumps(tags))
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO post_tags VALUES (?, ?, ?, ?, ?)",
+                [(tag, timestamp, username, seq, post_id) for tag in tags]
+            )
+            new_post = {
+                'id': post_id,
+                'content': content,
+                'timestamp': timestamp,
+                'image_id': image_id,
+                'tags': tags
+            }
+            change = {'op': 'post', 'user': username, 'post': new_post}
+            self.log_change(change)
+        self.notifier.publish(change)
+        return new_post
+
+    def user_posts(self, username):
+        """A user's posts, newest first"""
+        rows = self.db.execute(
+            f"SELECT {self.POST_COLUMNS} FROM posts WHERE author = ? ORDER BY seq DESC", (username,)
+        )
+        return [self.row_to_post(row)[1] for row in rows]
+
+    def like(self, username, post_id):
+        """Like a post, returns False if it was already liked"""
+        with self.db:
+            cursor = self.db.execute("INSERT OR IGNORE INTO likes VALUES (?, ?)", (post_id, username))
+            if not cursor.rowcount:
+                return False
+            author, _ = post_seq(post_id)
+            self.db.execute("UPDATE posts SET like_count = like_count + 1 WHERE id = ?", (post_id,))
+            self.db.execute("UPDATE users SET likes_received = likes_received + 1 WHERE username = ?", (author,))
+            change = {'op': 'like', 'post': post_id, 'user': username}
+            self.log_change(change)
+        self.notifier.publish(change)
+        return True
+
+    def has_liked(self, username, post_id):
+        return self.db.execute(
+            "SELECT 1 FROM likes WHERE post_id = ? AND username = ?", (post_id, username)
+        ).fetchone() is not None
+
+    def like_count(self, post_id):
+        row = self.db.execute("SELECT like_count FROM posts WHERE id = ?", (post_id,)).fetchone()
+        return row[0] if row else 0
+
+    def feed(self, username, cursor=None, limit=FEED_PAGE_SIZE):
+        """One page of a home timeline (own posts + following) and the next cursor"""
+        sql = (
+            f"SELECT {self.POST_COLUMNS} FROM posts"
+            " WHERE author IN (SELECT followee FROM follows WHERE follower = ? UNION SELECT ?)"
+        )
+        params = [username, username]
+        if cursor:
+            sql += " AND (timestamp, author, seq) < (?, ?, ?)"
+            params += list(decode_cursor(cursor))
+        sql += " ORDER BY timestamp DESC, author DESC, seq DESC LIMIT ?"
+        return self.posts_page(sql, params, limit)
+
+    def explore(self, tag=None, cursor=None, limit=FEED_PAGE_SIZE):
+        """One page of posts with a tag (every post when tag is None) and the next cursor"""
+        if tag is None:
+            sql = f"SELECT {self.POST_COLUMNS} FROM posts"
+            params = []
+            if cursor:
+                sql += " WHERE (timestamp, author, seq) < (?, ?, ?)"
+                params += list(decode_cursor(cursor))
+        else:
+            columns = ", ".join(f"p.{c.strip()}" for c in self.POST_COLUMNS.split(","))
+            sql = f"SELECT {columns} FROM post_tags t JOIN posts p ON p.id = t.post_id WHERE t.tag = ?"
+            params = [tag.lower()]
+            if cursor:
+                sql += " AND (t.timestamp, t.author, t.seq) < (?, ?, ?)"
+                params += list(decode_cursor(cursor))
+        order = "t." if tag is not None else ""
+        sql += f" ORDER BY {order}timestamp DESC, {order}author DESC, {order}seq DESC LIMIT ?"
+        return self.posts_page(sql, params, limit)
+
+    def trending_tags(self, n=TRENDING_TAGS, days=TRENDING_DAYS):
+        """Top n tags by posts in the last days, ties broken by all-time count"""
+        cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M")
+        rows = self.db.execute(
+            "SELECT tag FROM post_tags GROUP BY tag"
+            " ORDER BY SUM(timestamp >= ?) DESC, COUNT(*) DESC LIMIT ?",
+            (cutoff, n)
+        )
+        return [r[0] for r in rows]
+
+    # ----------- Search -------------
+
+    def indexable_posts(self, author, start):
+        """(seq, content, timestamp) of an author's posts from seq start on, oldest first"""
+        return self.db.execute(
+            "SELECT seq, content, timestamp FROM posts WHERE author = ? AND seq >= ? ORDER BY seq", (author, start)
+        ).fetchall()
+
+    def index_post(self, change):
+        if self.post_search is not None:
+            self.post_search.on_change(change)
+
+    def search_posts(self, query, offset=0, limit=FEED_PAGE_SIZE):
+        """One page of posts matching a free-text query, best first, and whether more follow"""
+        if self.post_search is None:
+            counts = dict(self.db.execute("SELECT username, post_count FROM users"))
+            self.post_search = load_search_index(self.path + ".search", counts, self.indexable_posts)
+        hits = self.post_search.search(query, offset + limit)
+        ids = [post_id for _, post_id, _ in hits[offset:]]
+        rows = self.db.execute(
+            f"SELECT {self.POST_COLUMNS} FROM posts WHERE id IN ({', '.join('?' * len(ids))})", ids
+        )
+        found = {}
+        for row in rows:
+            author, post = self.row_to_post(row)
+            found[post['id']] = (author, post)
+        return [found[post_id] for post_id in ids if post_id in found], len(hits) == offset + limit
+
+    # ----------- Analytics -------------
+
+    def interest_graph(self):
+        """(usernames, (follower, followee) edges, (username, hashtag, posts) uses) for FollowSuggestions"""
+        return (
+            [row[0] for row in self.db.execute("SELECT username FROM users")],
+            self.db.execute("SELECT follower, followee FROM follows").fetchall(),
+            self.db.execute("SELECT author, tag, COUNT(*) FROM post_tags GROUP BY author, tag").fetchall()
+        )
+
+    def post_activity(self):
+        """(author, timestamp, tags) of every post, for HabitStreaks"""
+        rows = self.db.execute("SELECT author, timestamp, tags FROM posts")
+        return [(author, timestamp, json.loads(tags)) for author, timestamp, tags in rows]
+
+    # ----------- Rankings -------------
+
+    def scores(self, key, window):
+        """SQL for (username, score) of every ranked user, and its parameters"""
+        if window == 'week' and key in self.WEEK_SCORES:
+            return (
+                f"SELECT author AS username, {self.WEEK_SCORES[key]} AS score FROM posts"
+                " WHERE timestamp >= ? GROUP BY author HAVING score > 0"
+            ), [week_start()]
+        column = self.RANK_COLUMNS[key]
+        return f"SELECT username, {column} AS score FROM users WHERE {column} > 0", []
+
+    def rankings(self, key='posts', window='all', offset=0, limit=RANKINGS_PAGE_SIZE):
+        """[(rank, username, score)] for one page and the number of ranked users"""
+        scores, params = self.scores(key, window)
+        total = self.db.execute(f"SELECT COUNT(*) FROM ({scores})", params).fetchone()[0]
+        rows = self.db.execute(
+            f"SELECT username, score FROM ({scores}) ORDER BY score DESC, username LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        return [(offset + i + 1, username, score) for i, (username, score) in enumerate(rows)], total
+
+    def rank(self, username, key='posts', window='all'):
+        scores, params = self.scores(key, window)
+        row = self.db.execute(f"SELECT score FROM ({scores}) WHERE username = ?", params + [username]).fetchone()
+        if row is None:
+            return None
+        ahead = self.db.execute(
+            f"SELECT COUNT(*) FROM ({scores}) WHERE score > ? OR (score = ? AND username < ?)",
+            params + [row[0], row[0], username]
+        ).fetchone()[0]
+        return ahead + 1
+
+    # ----------- Migration -------------
+
+    def import_users(self, users):
+        """Bulk load a users dict (the JSON format) in one transaction"""
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO users (username, username_lower, password, bio) VALUES (?, ?, ?, ?)",
+                [(u, u.lower(), d.get('password', ''), d.get('bio', '')) for u, d in users.items()]
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO user_tokens VALUES (?, ?)",
+                [(t, u) for u, d in users.items() for t in set(re.findall(r"\w+", d.get('bio', '').lower()))]
+            )
+            posts = [(u, p) for u, d in users.items() for p in d.get('posts', [])]
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO posts ({self.POST_COLUMNS}, like_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (p['id'], u, post_seq(p['id'])[1], p.get('content', ''), p.get('timestamp', ''),
+                     p.get('image_id'), json.dumps(p.get('tags', [])), len(set(p.get('likes', []))))
+                    for u, p in posts
+                ]
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO post_tags VALUES (?, ?, ?, ?, ?)",
+                [
+                    (t.lower(), p.get('timestamp', ''), u, post_seq(p['id'])[1], p['id'])
+                    for u, p in posts for t in p.get('tags', [])
+                ]
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO likes VALUES (?, ?)",
+                [(p['id'], liker) for u, p in posts for liker in p.get('likes', [])]
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO follows VALUES (?, ?)",
+                [(u, f) for u, d in users.items() for f in d.get('following', []) if f in users] +
+                [(f, u) for u, d in users.items() for f in d.get('followers', []) if f in users]
+            )
+            # Counters are derived once from the imported rows
+            self.db.execute("""
+                UPDATE users SET
+                    post_count = (SELECT COUNT(*) FROM posts WHERE author = users.username),
+                    likes_received = (SELECT COALESCE(SUM(like_count), 0) FROM posts WHERE author = users.username),
+                    follower_count = (SELECT COUNT(*) FROM follows WHERE followee = users.username),
+                    following_count = (SELECT COUNT(*) FROM follows WHERE follower = users.username)
+            """)
+
+
+def json_backend_file():
+    """The JSON backend's current snapshot: the binary one once converted, else DATA_FILE"""
+    if SNAPSHOT_FORMAT == "binary" and os.path.exists(BINARY_SNAPSHOT_FILE):
+        return BINARY_SNAPSHOT_FILE
+    return DATA_FILE
+
+
+def migrate_json_to_sqlite(images, data_file=None, log_file=LOG_FILE, sqlite_file=SQLITE_FILE):
+    """One-shot copy of the JSON backend's snapshot (and any pending change log) into SQLite"""
+    data_file = data_file or json_backend_file()
+    users = read_snapshot(data_file)
+    assign_post_ids(users)
+    ChangeLog(data_file, log_file).replay(users)
+    migrate_inline_images(users, images)
+    store = SqliteStore(sqlite_file)
+    store.import_users(users)
+    return store
+
+
+def shard_key(username):
+    """Filesystem-safe name of a user's shard directory"""
+    return hashlib.sha1(username.encode('utf-8')).hexdigest()
+
+
+class ShardStore:
+    """Storage backend with a directory of shards per user, loaded on demand
+
+    Each user has a profile shard (password, bio), an edges shard (followers, following)
+    and a posts shard. Startup reads only the summary buckets: bio and counters of every
+    user, which is all login checks, search, cards and all-time rankings need. Mutations
+    mark the shards they touch dirty and save_data writes just those. The feed loads the
+    viewer's edges and the posts of the accounts in it; Explore and weekly rankings span
+    every post, so the first time one is opened the remaining posts shards are loaded.
+    """
+
+    KINDS = {'profile': ('password', 'bio'), 'edges': ('followers', 'following', 'likes'), 'posts': ('posts',)}
+    SCORES = {'posts': 'post_count', 'likes': 'likes_received', 'followers': 'follower_count'}
+
+    def __init__(self, root=SHARD_DIR):
+        self.root = root
+        # Shards are cached in memory without versions, so one instance at a time owns root.
+        # The lock file sits beside root so a half-done migration still finds no directory
+        self.owner = claim_file(f"{root}.lock")
+        self.notifier = ChangeNotifier()
+        self.users = {}
+        self.loaded = set()
+        self.dirty = set()
+        self.dirty_buckets = set()
+        # What the save in progress took out of dirty and dirty_buckets
+        self.saving = (set(), set())
+        self.buckets = {}
+        self.summaries = {}
+        folder = os.path.join(root, "summaries")
+        for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            bucket = read_snapshot(os.path.join(folder, name))
+            self.buckets[name[:-len(".json")]] = set(bucket)
+            self.summaries.update(bucket)
+        self.writer = SnapshotWriter(self.encode_dirty, failed=self.restore_dirty)
+        self.build_indexes()
+        self.tag_index = None
+        self.week = None
+        self.week_boards = None
+        # The full-text index is loaded on the first search
+        self.post_search = None
+        self.notifier.subscribe('posts', self.index_post)
+        STARTUP.lap("summaries")
+
+    def build_indexes(self):
+        self.user_search = UserSearchIndex()
+        self.user_search.build(self.summaries)
+        self.boards = {key: Leaderboard() for key in self.SCORES}
+        for username, summary in self.summaries.items():
+            for key, field in self.SCORES.items():
+                self.boards[key].set(username, summary[field])
+
+    def path(self, username, kind):
+        key = shard_key(username)
+        return os.path.join(self.root, "users", key[:2], key, f"{kind}.json")
+
+    def ensure(self, username, *kinds):
+        """The user's record with the given shards loaded"""
+        data = self.users.setdefault(username, {})
+        for kind in kinds:
+            if (username, kind) not in self.loaded:
+                data.update(read_snapshot(self.path(username, kind)))
+                if kind == 'posts':
+                    data.setdefault('posts', [])
+                self.loaded.add((username, kind))
+        return data
+
+    def load_all_posts(self):
+        """Load every posts shard and index them, for the screens that span all posts"""
+        if self.tag_index is None:
+            for username in self.summaries:
+                self.ensure(username, 'posts')
+            self.tag_index = TagIndex()
+            self.tag_index.build(self.users)
+
+    def encode_dirty(self):
+        """Writer thread: serialize the shards and summary buckets changed since the last save"""
+        self.saving = (set(self.dirty), set(self.dirty_buckets))
+        files = []
+        for username, kind in self.dirty:
+            data = self.users[username]
+            files.append((self.path(username, kind), json.dumps({f: data[f] for f in self.KINDS[kind] if f in data})))
+        for bucket in self.dirty_buckets:
+            summaries = {username: self.summaries[username] for username in self.buckets[bucket]}
+            files.append((os.path.join(self.root, "summaries", f"{bucket}.json"), json.dumps(summaries)))
+        self.dirty.clear()
+        self.dirty_buckets.clear()
+        return files
+
+    def restore_dirty(self):
+        """Writer thread: mark what a failed save held dirty again, so the next save retries it"""
+        self.dirty.update(self.saving[0])
+        self.dirty_buckets.update(self.saving[1])
+
+    def save_data(self):
+        """Queue a write of the dirty shards on the writer thread"""
+        self.writer.request()
+
+    def record_change(self, change, shards, counts=None):
+        """Apply a mutation to the loaded shards, mark what it touched dirty and publish it
+
+        counts maps usernames to {summary field: delta}.
+        """
+        with self.writer.lock:
+            apply_change(self.users, change)
+            self.dirty.update(shards)
+            for username, deltas in (counts or {}).items():
+                summary = self.summaries[username]
+                for field, delta in deltas.items():
+                    summary[field] += delta
+                self.dirty_buckets.add(shard_key(username)[:2])
+                for key, field in self.SCORES.items():
+                    if field in deltas:
+                        self.boards[key].set(username, summary[field])
+        self.save_data()
+        self.notifier.publish(change)
+
+    def flush(self):
+        """Wait until every change so far is on disk"""
+        self.writer.flush()
+        if self.post_search is not None:
+            self.post_search.save(os.path.join(self.root, "search.idx"))
+
+    def close(self):
+        try:
+            self.writer.close()
+            if self.post_search is not None:
+                self.post_search.save(os.path.join(self.root, "search.idx"))
+        finally:
+            self.owner.close()
+
+    def sync(self):
+        """Nothing to pick up: no other instance can open root while this one holds it"""
+        return None
+
+    # ----------- Users -------------
+
+    def user_exists(self, username):
+        return username in self.summaries
+
+    def check_password(self, username, password):
+        return username in self.summaries and self.ensure(username, 'profile').get('password') == password
+
+    def add_user(self, username, password, bio):
+        """Create an account, returns False if the name is taken"""
+        if username in self.summaries:
+            return False
+        bucket = shard_key(username)[:2]
+        with self.writer.lock:
+            self.summaries[username] = {
+                'bio': bio,
+                'post_count': 0,
+                'likes_received': 0,
+                'follower_count': 0,
+                'following_count': 0
+            }
+            self.buckets.setdefault(bucket, set()).add(username)
+            self.dirty_buckets.add(bucket)
+        self.loaded.update((username, kind) for kind in self.KINDS)
+        self.user_search.add(username, bio)
+        self.record_change({
+            'op': 'signup',
+            'user': username,
+            'data': {
+                'password': password,
+                'bio': bio,
+                'followers': [],
+                'following': [],
+                'posts': [],
+                'likes': []
+            }
+        }, [(username, kind) for kind in self.KINDS])
+        return True
+
+    def get_user(self, username):
+        """Profile fields and counters shown on cards"""
+        summary = self.summaries[username]
+        return {
+            'username': username,
+            'bio': summary['bio'],
+            'post_count': summary['post_count'],
+            'follower_count': summary['follower_count'],
+            'following_count': summary['following_count']
+        }
+
+    def followers(self, username):
+        return list(self.ensure(username, 'edges').get('followers', []))
+
+    def following(self, username):
+        return list(self.ensure(username, 'edges').get('following', []))
+
+    def is_following(self, username, target):
+        return target in self.ensure(username, 'edges').get('following', [])
+
+    def follow(self, username, target):
+        if self.is_following(username, target):
+            return
+        self.ensure(target, 'edges')
+        self.record_change(
+            {'op': 'follow', 'user': username, 'target': target},
+            [(username, 'edges'), (target, 'edges')],
+            {username: {'following_count': 1}, target: {'follower_count': 1}}
+        )
+
+    def unfollow(self, username, target):
+        if not self.is_following(username, target):
+            return
+        self.ensure(target, 'edges')
+        self.record_change(
+            {'op': 'unfollow', 'user': username, 'target': target},
+            [(username, 'edges'), (target, 'edges')],
+            {username: {'following_count': -1}, target: {'follower_count': -1}}
+        )
+
+    def search_users(self, query, offset=0, limit=DISCOVER_PAGE_SIZE, exclude=None):
+        return self.user_search.search(query, offset, limit, exclude)
+
+    # ----------- Posts -------------
+
+    def add_post(self, username, content, image_id=None):
+        """Publish a post and return it"""
+        posts = self.ensure(username, 'posts')['posts']
+        new_post = {
+            'id': f"{username}:{len(posts)}",
+            'content': content,
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M"),
+            'likes': [],
+            'image_id': image_id,
+            # Extract hashtags (case-insensitive, store lowercase)
+            'tags': extract_tags(content)
+        }
+        self.record_change(
+            {'op': 'post', 'user': username, 'post': new_post},
+            [(username, 'posts')],
+            {username: {'post_count': 1}}
+        )
+        if self.tag_index is not None:
+            self.tag_index.add(username, new_post)
+        if self.week_boards is not None and new_post['timestamp'] >= self.week:
+            self.week_boards['posts'].add(username, 1)
+        return new_post
+
+    def user_posts(self, username):
+        """A user's posts, newest first"""
+        return self.ensure(username, 'posts')['posts']
+
+    def post(self, post_id):
+        author, _ = post_seq(post_id)
+        if author not in self.summaries:
+            return None
+        self.ensure(author, 'posts')
+        return find_post(self.users, post_id)
+
+    def like(self, username, post_id):
+        """Like a post, returns False if it was already liked"""
+        post = self.post(post_id)
+        if post is None or username in post.get('likes', []):
+            return False
+        author, _ = post_seq(post_id)
+        self.record_change(
+            {'op': 'like', 'post': post_id, 'user': username},
+            [(author, 'posts')],
+            {author: {'likes_received': 1}}
+        )
+        if self.week_boards is not None and post.get('timestamp', '') >= self.week:
+            self.week_boards['likes'].add(author, 1)
+        return True
+
+    def has_liked(self, username, post_id):
+        post = self.post(post_id)
+        return post is not None and username in post.get('likes', [])
+
+    def like_count(self, post_id):
+        post = self.post(post_id)
+        return 0 if post is None else len(post.get('likes', []))
+
+    def feed(self, username, cursor=None, limit=FEED_PAGE_SIZE):
+        """One page of a home timeline, touching only the viewer's and their followees' shards"""
+        authors = self.following(username) + [username]
+        for author in authors:
+            if author in self.summaries:
+                self.ensure(author, 'posts')
+        return merge_timeline(self.users, authors, cursor, limit)
+
+    def explore(self, tag=None, cursor=None, limit=FEED_PAGE_SIZE):
+        """One page of posts with a tag (every post when tag is None) and the next cursor"""
+        self.load_all_posts()
+        return self.tag_index.posts(tag, cursor, limit)
+
+    def trending_tags(self, n=TRENDING_TAGS):
+        self.load_all_posts()
+        return self.tag_index.trending(n)
+
+    # ----------- Search -------------
+
+    def indexable_posts(self, author, start):
+        """(seq, content, timestamp) of an author's posts from seq start on, oldest first"""
+        posts = self.user_posts(author)
+        for seq, post in enumerate(reversed(posts[:len(posts) - start]), start):
+            yield seq, post.get('content', ''), post.get('timestamp', '')
+
+    def index_post(self, change):
+        if self.post_search is not None:
+            self.post_search.on_change(change)
+
+    def search_posts(self, query, offset=0, limit=FEED_PAGE_SIZE):
+        """One page of posts matching a free-text query, best first, and whether more follow
+
+        The saved index means only the posts shards of authors who posted since it was
+        written are read, plus those of the authors on the page.
+        """
+        if self.post_search is None:
+            counts = {username: summary['post_count'] for username, summary in self.summaries.items()}
+            self.post_search = load_search_index(os.path.join(self.root, "search.idx"), counts, self.indexable_posts)
+        hits = self.post_search.search(query, offset + limit)
+        page = [(author, self.post(post_id)) for author, post_id, _ in hits[offset:]]
+        return [(author, post) for author, post in page if post is not None], len(hits) == offset + limit
+
+    # ----------- Analytics -------------
+
+    def interest_graph(self):
+        """(usernames, (follower, followee) edges, (username, hashtag, posts) uses) for FollowSuggestions
+
+        Like Explore, this reads every edges and posts shard the first time.
+        """
+        self.load_all_posts()
+        follows = [
+            (username, followee)
+            for username in self.summaries
+            for followee in self.ensure(username, 'edges').get('following', [])
+        ]
+        uses = Counter((author, tag) for tag, entries in self.tag_index.tags.items() for _, author, _ in entries)
+        return list(self.summaries), follows, [(author, tag, count) for (author, tag), count in uses.items()]
+
+    def post_activity(self):
+        """(author, timestamp, tags) of every post, for HabitStreaks; reads every posts shard the first time"""
+        self.load_all_posts()
+        return [(author, post.get('timestamp', ''), post.get('tags', [])) for _, author, post in self.tag_index.all]
+
+    # ----------- Rankings -------------
+
+    def board(self, key, window):
+        if window != 'week' or key not in RankingIndex.WINDOWED_KEYS:
+            return self.boards[key]
+        start = week_start()
+        if self.week_boards is None or self.week != start:
+            self.load_all_posts()
+            self.week = start
+            self.week_boards = {'posts': Leaderboard(), 'likes': Leaderboard()}
+            entries = self.tag_index.all
+            for _, author, post in entries[bisect_left(entries, ((start,),)):]:
+                self.week_boards['posts'].add(author, 1)
+                self.week_boards['likes'].add(author, len(post.get('likes', [])))
+        return self.week_boards[key]
+
+    def rankings(self, key='posts', window='all', offset=0, limit=RANKINGS_PAGE_SIZE):
+        """[(rank, username, score)] for one page and the number of ranked users"""
+        board = self.board(key, window)
+        return board.page(offset, limit), board.total
+
+    def rank(self, username, key='posts', window='all'):
+        return self.board(key, window).rank(username)
+
+    # ----------- Migration -------------
+
+    def import_users(self, users):
+        """Take over a users dict (the JSON format) and write every shard"""
+        with self.writer.lock:
+            for username, data in users.items():
+                self.users[username] = data
+                self.loaded.update((username, kind) for kind in self.KINDS)
+                self.dirty.update((username, kind) for kind in self.KINDS)
+                posts = data.get('posts', [])
+                self.summaries[username] = {
+                    'bio': data.get('bio', ''),
+                    'post_count': len(posts),
+                    'likes_received': sum(len(set(p.get('likes', []))) for p in posts),
+                    'follower_count': len(data.get('followers', [])),
+                    'following_count': len(data.get('following', []))
+                }
+                bucket = shard_key(username)[:2]
+                self.buckets.setdefault(bucket, set()).add(username)
+                self.dirty_buckets.add(bucket)
+        self.build_indexes()
+        self.save_data()
+        self.writer.flush()
+
+
+def migrate_json_to_shards(images, data_file=None, log_file=LOG_FILE, shard_dir=SHARD_DIR):
+    """One-shot split of the JSON backend's snapshot (and any pending change log) into shards"""
+    data_file = data_file or json_backend_file()
+    users = read_snapshot(data_file)
+    assign_post_ids(users)
+    ChangeLog(data_file, log_file).replay(users)
+    migrate_inline_images(users, images)
+    store = ShardStore(shard_dir)
+    store.import_users(users)
+    return store
+
+
+@METRICS.timed("open store")
+def open_store(images):
+    """Open the backend selected by STORAGE_BACKEND, migrating JSON data into it on first use"""
+    if STORAGE_BACKEND == "shards":
+        if not os.path.isdir(SHARD_DIR) and os.path.exists(json_backend_file()):
+            return migrate_json_to_shards(images)
+        return ShardStore(SHARD_DIR)
+    if STORAGE_BACKEND == "sqlite":
+        if not os.path.exists(SQLITE_FILE) and os.path.exists(json_backend_file()):
+            return migrate_json_to_sqlite(images)
+        return SqliteStore(SQLITE_FILE)
+    return JsonStore(images)
+
+
 class SocialMediaApp:
     def __init__(self, root):
         self.root = root
         self.root.title("HabitHub - Social Media App")
-        self.root.state('zoomed')
+        maximize(self.root)
         self.root.configure(bg="#3f278a")
         
         self.current_user = None
-        self.users = self.load_data()
+        self.images = ImageStore(IMAGE_DIR)
+        self.photo_cache = PhotoCache()
+        self.image_pipeline = ImagePipeline(self.root)
+        self.debug_panel = None
         
+        # The login screen needs no data, so it is drawn before the store loads
         self.show_login_screen()
+        self.root.update()
+        STARTUP.lap("login screen")
+        
+        try:
+            self.store = open_store(self.images)
+        except ValueError as e:
+            # Refuse to start on a corrupt data file rather than overwrite it with nothing
+            messagebox.showerror("Error", str(e))
+            raise SystemExit(1)
+        self.notifier = self.store.notifier
+        print(STARTUP.report())
+        
+        # Who-to-follow suggestions are built when Discover first shows them and habit
+        # streaks when a profile or the streak ranking first does, then both are kept
+        # current from the follows and posts published
+        self.suggestions = None
+        self.streaks = None
+        self.analytics_built = {}
+        self.analytics_changes = {}
+        self.notifier.subscribe('follows', lambda change: self.on_analytics_change('suggestions', change))
+        self.notifier.subscribe('posts', lambda change: self.on_analytics_change('streaks', change))
+        
+        # Pending saves are flushed before the window goes away
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Other instances may share the data files; pick up what they change
+        self.root.after(SYNC_INTERVAL_MS, self.poll_store)
+        
+        if METRICS.enabled:
+            METRICS.add_source('photo_cache', self.photo_cache.stats)
+            self.root.after(METRICS_INTERVAL_MS, self.write_metrics)
     
-    def load_data(self):
-        """Load user data from JSON file"""
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r') as f:
-                try:
-                    return json.load(f)
-                except:
-                    return {}
-        return {}
+    def write_metrics(self):
+        """Append a metrics snapshot to METRICS_FILE every METRICS_INTERVAL_MS"""
+        METRICS.write()
+        self.root.after(METRICS_INTERVAL_MS, self.write_metrics)
     
-    def save_data(self):
-        """Save user data to JSON file"""
-        with open(DATA_FILE, 'w') as f:
-            json.dump(self.users, f, indent=4)
+    def toggle_debug_panel(self):
+        """Show or hide the metrics panel (F12 on the main screen while instrumentation is on)"""
+        if self.debug_panel is not None:
+            self.debug_panel.destroy()
+            self.debug_panel = None
+            return
+        panel = self.debug_panel = tk.Toplevel(self.root)
+        panel.title("HabitHub - Metrics")
+        panel.protocol("WM_DELETE_WINDOW", self.toggle_debug_panel)
+        
+        buttons = ttk.Frame(panel)
+        buttons.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Button(buttons, text="Profile next action", command=lambda: setattr(METRICS, 'profile_armed', True)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Write snapshot", command=METRICS.write).pack(side=tk.LEFT, padx=5)
+        
+        text = scrolledtext.ScrolledText(panel, width=90, height=30, font=("Courier", 9))
+        text.pack(fill=tk.BOTH, expand=True)
+        
+        def refresh():
+            if self.debug_panel is not panel:
+                return
+            snapshot = METRICS.snapshot()
+            lines = [f"{'span':<24}{'count':>8}{'mean ms':>10}{'max ms':>10}{'total ms':>12}"]
+            for name, span in sorted(snapshot['spans'].items(), key=lambda item: -item[1]['total_ms']):
+                lines.append(f"{name:<24}{span['count']:>8}{span['mean_ms']:>10.2f}{span['max_ms']:>10.2f}{span['total_ms']:>12.1f}")
+            lines.append("")
+            for name, value in sorted(snapshot['counters'].items()) + sorted(snapshot['gauges'].items()):
+                lines.append(f"{name:<36}{value:>12}")
+            for name in METRICS.sources:
+                lines.append(f"\n{name}: {json.dumps(snapshot[name])}")
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, "\n".join(lines))
+            panel.after(1000, refresh)
+        
+        refresh()
+    
+    def poll_store(self):
+        """Merge other instances' changes; views refresh themselves through the notifier"""
+        if self.store.sync() == "reload":
+            # Rebuilt when a view next shows them
+            self.analytics_built.clear()
+            self.suggestions = self.streaks = None
+            if self.current_user is not None:
+                self.show_feed_screen()
+        self.root.after(SYNC_INTERVAL_MS, self.poll_store)
+    
+    def refresh_analytics(self, name):
+        """Build self.<name> if it never was since login or a reload, and suggestions once SUGGEST_REFRESH_S old
+        
+        Views call this when they show the result. The export reads the whole store, so it
+        waits for idle: the view asking has painted its placeholder by then.
+        """
+        built = self.analytics_built.get(name)
+        if name == 'suggestions' and load_scipy():
+            if built is None or time.monotonic() - built >= SUGGEST_REFRESH_S:
+                self.root.after_idle(self.build_analytics, name, self.store.interest_graph, FollowSuggestions.build)
+        elif name == 'streaks' and load_numpy():
+            if built is None:
+                self.root.after_idle(self.build_analytics, name, lambda: (self.store.post_activity(),), HabitStreaks)
+    
+    def build_analytics(self, name, export, build):
+        """Set self.<name> to build(*export()) run on a worker, then publish {'op': name}
+        
+        Stores are not thread-safe, so export reads what the build needs here and only the
+        array work runs on the worker. Changes published meanwhile are replayed on the result.
+        """
+        # A view may have asked again before the first request came off the idle queue
+        if name in self.analytics_changes:
+            return
+        # The export is ~10^5 tuples that cannot form cycles; collecting while building them
+        # more than doubles the time the window stalls
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            inputs = export()
+        finally:
+            if collecting:
+                gc.enable()
+        self.analytics_built[name] = time.monotonic()
+        self.analytics_changes[name] = []
+        
+        def on_done(result, error):
+            changes = self.analytics_changes.pop(name)
+            if error is not None:
+                # The next view showing it asks for another build
+                del self.analytics_built[name]
+                METRICS.count(f"{name} build failures")
+                METRICS.gauge(f"{name} build error", repr(error))
+                return
+            for change in changes:
+                result.on_change(change)
+            setattr(self, name, result)
+            self.notifier.publish({'op': name})
+        
+        self.image_pipeline.submit(name, lambda: build(*inputs), on_done)
+    
+    def on_analytics_change(self, name, change):
+        if name in self.analytics_changes:
+            self.analytics_changes[name].append(change)
+        if getattr(self, name) is not None:
+            getattr(self, name).on_change(change)
     
     def clear_window(self):
         """Clear all widgets from window"""
@@ -77,7 +4186,7 @@ class SocialMediaApp:
                 messagebox.showerror("Error", "Please fill in all fields")
                 return
             
-            if username in self.users and self.users[username]['password'] == password:
+            if self.store.check_password(username, password):
                 self.current_user = username
                 self.show_feed_screen()
             else:
@@ -110,19 +4219,10 @@ class SocialMediaApp:
                 messagebox.showerror("Error", "Please fill in all fields")
                 return
             
-            if username in self.users:
+            if not self.store.add_user(username, password, bio):
                 messagebox.showerror("Error", "Username already exists")
                 return
             
-            self.users[username] = {
-                'password': password,
-                'bio': bio,
-                'followers': [],
-                'following': [],
-                'posts': [],
-                'likes': []
-            }
-            self.save_data()
             messagebox.showinfo("Success", "Account created! Now login.")
             signup_username.delete(0, tk.END)
             signup_bio.delete(0, tk.END)
@@ -130,10 +4230,11 @@ class SocialMediaApp:
         
         ttk.Button(signup_frame, text="Sign Up", command=signup).pack(pady=10)
     
+    @METRICS.timed("show feed screen")
     def show_feed_screen(self):
         """Display main feed screen"""
         self.clear_window()
-        self.root.state('zoomed')
+        maximize(self.root)
 
 
         
@@ -146,76 +4247,73 @@ class SocialMediaApp:
         ttk.Button(top_frame, text="Profile", command=self.show_profile).pack(side=tk.RIGHT, padx=5)
         ttk.Button(top_frame, text="Logout", command=self.logout).pack(side=tk.RIGHT, padx=5)
         
-        # Notebook (tabs)
-        notebook = ttk.Notebook(self.root)
-        notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        # Feed tab
-        feed_frame = ttk.Frame(notebook)
-        notebook.add(feed_frame, text="🏠 Feed")
-        self.create_feed_tab(feed_frame)
+        # Notebook (tabs), each one built the first time it is selected
+        self.tabs = LazyNotebook(self.root)
+        self.tabs.notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        # Create post tab
-        post_frame = ttk.Frame(notebook)
-        notebook.add(post_frame, text="✍️ Create Post")
-        self.create_post_tab(post_frame)
+        self.tabs.add("🏠 Feed", self.create_feed_tab)
+        self.tabs.add("✍️ Create Post", self.create_post_tab)
+        self.tabs.add("👥 Friends", self.create_friends_tab)
+        self.tabs.add("🏆 Rankings", self.create_rankings_tab)
+        self.tabs.add("🔍 Discover", self.create_discover_tab)
         
-        # Friends tab
-        friends_frame = ttk.Frame(notebook)
-        notebook.add(friends_frame, text="👥 Friends")
-        self.create_friends_tab(friends_frame)
+        # Explore tab (ALL POSTS + TAGS)
+        self.tabs.add("🌎 Explore", self.create_explore_tab)
+        self.tabs.add("🔎 Search", self.create_search_tab)
         
-        # Rankings tab
-        rankings_frame = ttk.Frame(notebook)
-        notebook.add(rankings_frame, text="🏆 Rankings")
-        self.create_rankings_tab(rankings_frame)
+        # Only the Feed is paid for up front
+        self.tabs.build(self.tabs.notebook.select())
         
-        # Discover tab
-        discover_frame = ttk.Frame(notebook)
-        notebook.add(discover_frame, text="🔍 Discover")
-        self.create_discover_tab(discover_frame)
-
-        # Explore tab (ALL POSTS + TAGS)
-        explore_frame = ttk.Frame(notebook)
-        notebook.add(explore_frame, text="🌎 Explore")
-        self.create_explore_tab(explore_frame)
+        # Hidden metrics panel
+        if METRICS.enabled:
+            self.root.bind("<F12>", lambda e: self.toggle_debug_panel())
     
+
+    @METRICS.rendered("feed tab")
     def create_feed_tab(self, parent):
         """Create the feed tab"""
-        canvas = tk.Canvas(parent, bg="#1a1a1a", highlightthickness=0)
-        scrollbar = ttk.Scrollbar(parent, orient="vertical", command=canvas.yview)
-        scrollable_frame = tk.Frame(canvas, bg="#1a1a1a")
-        
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
+        cursor = None
+        exhausted = False
         
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="n")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        def load_more():
+            nonlocal cursor, exhausted
+            if exhausted:
+                return
+            page, cursor = self.store.feed(self.current_user, cursor)
+            exhausted = cursor is None
+            feed_list.append(page)
         
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        feed_list = VirtualList(
+            parent,
+            lambda row, item: self.create_post_widget(row, *item),
+            key=lambda item: item[1]['id'],
+            empty_text="No posts yet. Follow someone!",
+            on_end=load_more
+        )
         
-        # Get posts from following + own posts
-        all_posts = []
-        for username in self.users[self.current_user]['following'] + [self.current_user]:
-            if username in self.users:
-                for post in self.users[username]['posts']:
-                    all_posts.append((username, post))
+        def load_feed():
+            nonlocal cursor, exhausted
+            cursor, exhausted = None, False
+            feed_list.set_items([])
+            load_more()
         
-        # Ensure posts without tags still work
-        all_posts.sort(key=lambda x: x[1].get('timestamp', ''), reverse=True)
+        def on_new_post(change):
+            author = change['user']
+            if author == self.current_user or self.store.is_following(self.current_user, author):
+                feed_list.insert(0, (author, change['post']))
         
-        if not all_posts:
-            label = tk.Label(scrollable_frame, text="No posts yet. Follow someone!", font=("Arial", 12), bg="#1a1a1a", fg="white")
-            label.pack(pady=20)
+        def on_follow_change(change):
+            if change['op'] in ('follow', 'unfollow') and change['user'] == self.current_user:
+                load_feed()
         
-        for username, post in all_posts:
-            self.create_post_widget(scrollable_frame, username, post)
+        self.notifier.subscribe('posts', on_new_post, owner=feed_list.canvas)
+        self.notifier.subscribe(('user', self.current_user), on_follow_change, owner=feed_list.canvas)
+        load_feed()
     
+
+    @METRICS.rendered("post widget")
     def create_post_widget(self, parent, username, post):
-        self.root.state('zoomed')
+        maximize(self.root)
 
         """Create a single post widget"""
         # Main post container - centered and wide
@@ -232,22 +4330,11 @@ class SocialMediaApp:
         time_label = tk.Label(header, text=post.get('timestamp', ''), font=("Arial", 8), bg="#262626", fg="#888888")
         time_label.pack(anchor=tk.W)
         
-        # Post image (if exists)
-        if post.get('image'):
-            try:
-                image_data = base64.b64decode(post['image'])
-                image = Image.open(io.BytesIO(image_data))
-                # Resize to fit better while maintaining aspect ratio
-                max_width = 550
-                max_height = 550
-                image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(image)
-                img_label = tk.Label(post_frame, image=photo, bg="#262626")
-                img_label.image = photo  # Keep a reference
-                img_label.pack(padx=15, pady=10)
-            except Exception as e:
-                error_label = tk.Label(post_frame, text="[Image failed to load]", font=("Arial", 9), bg="#262626", fg="#888888")
-                error_label.pack(padx=15, pady=10)
+        # Post image (if exists), decoded in the background behind a placeholder
+        if post.get('image_id'):
+            img_label = tk.Label(post_frame, text="🖼 Loading image...", font=("Arial", 9), bg="#262626", fg="#888888")
+            img_label.pack(padx=15, pady=10)
+            self.show_thumbnail(img_label, post, 'display')
         
         # Post content
         if post.get('content'):
@@ -271,16 +4358,19 @@ class SocialMediaApp:
         footer = tk.Frame(post_frame, bg="#262626")
         footer.pack(fill=tk.X, padx=15, pady=10)
         
-        likes = len(post.get('likes', []))
+        likes = self.store.like_count(post['id'])
         likes_label = tk.Label(footer, text=f"❤️ {likes} likes", font=("Arial", 9), bg="#262626", fg="white")
         likes_label.pack(side=tk.LEFT, padx=10)
         
+        # Patch the counter in place when anyone likes this post
+        def on_like(change):
+            likes_label.config(text=f"❤️ {self.store.like_count(post['id'])} likes")
+        
+        self.notifier.subscribe(('post', post['id']), on_like, owner=likes_label)
+        
         def like_post():
-            if self.current_user not in post.get('likes', []):
-                post.setdefault('likes', []).append(self.current_user)
-                self.save_data()
+            if self.store.like(self.current_user, post['id']):
                 messagebox.showinfo("Success", "Post liked!")
-                self.show_feed_screen()
             else:
                 messagebox.showinfo("Info", "You already liked this post")
         
@@ -291,6 +4381,42 @@ class SocialMediaApp:
         separator = tk.Frame(post_frame, height=1, bg="#404040")
         separator.pack(fill=tk.X, pady=10)
     
+    def show_thumbnail(self, label, post, rendition):
+        """Put a rendition of a post's image into label, decoding it on the image pipeline on a cache miss"""
+        key = (post['id'], rendition)
+        photo = self.photo_cache.lookup(key)
+        if photo is not None:
+            label.config(image=photo, text="")
+            label.image = photo  # Keep a reference
+            return
+        
+        def on_done(image, error):
+            if error is not None:
+                label.config(text="[Image failed to load]")
+                return
+            photo = self.photo_cache.put(key, image)
+            label.config(image=photo, text="")
+            label.image = photo  # Keep a reference
+        
+        ticket = self.image_pipeline.submit(key, lambda: self.load_thumbnail(post['image_id'], rendition), on_done)
+        # Posts scrolled out of view lose their widgets; don't decode for them
+        label.bind("<Destroy>", lambda event: self.image_pipeline.cancel(ticket), add="+")
+    
+    @METRICS.timed("decode image")
+    def load_thumbnail(self, image_id, rendition):
+        """Decode a stored rendition of an image"""
+        load_pillow()
+        # Blob is memory-mapped, so only this render pays for reading it
+        with self.images.open(image_id, rendition) as blob:
+            image = Image.open(blob)
+            image.load()
+        # Originals from before renditions existed still need orienting and shrinking
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(RENDITIONS[rendition], Image.Resampling.LANCZOS)
+        METRICS.count("images decoded")
+        return image
+    
+    @METRICS.rendered("create post tab")
     def create_post_tab(self, parent):
         """Create the post creation tab"""
         frame = ttk.Frame(parent)
@@ -324,357 +4450,554 @@ class SocialMediaApp:
                 messagebox.showerror("Error", "Post cannot be empty. Add text or an image!")
                 return
             
-            new_post = {
-                'content': content,
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M"),
-                'likes': [],
-                'image': None,
-                'tags': []
-            }
+            author = self.current_user
             
-            # Extract hashtags (case-insensitive, store lowercase)
-            words = content.split()
-            for w in words:
-                if w.startswith("#") and len(w) > 1:
-                    tag = w.lower()
-                    if tag not in new_post['tags']:
-                        new_post['tags'].append(tag)
-            
-            # Encode image if selected
-            if self.selected_image:
-                try:
-                    with open(self.selected_image, 'rb') as img_file:
-                        new_post['image'] = base64.b64encode(img_file.read()).decode('utf-8')
-                except:
+            def publish(image_id, error):
+                if error is None:
+                    self.store.add_post(author, content, image_id)
+                if not frame.winfo_exists():
+                    return
+                post_button.config(state=tk.NORMAL)
+                if error is not None:
                     messagebox.showerror("Error", "Could not load image")
                     return
+                messagebox.showinfo("Success", "Post published!")
+                text_area.delete("1.0", tk.END)
+                image_label.config(text="No image selected")
+                self.selected_image = None
             
-            # Insert at front of user's posts
-            self.users[self.current_user].setdefault('posts', []).insert(0, new_post)
-            self.save_data()
-            messagebox.showinfo("Success", "Post published!")
-            text_area.delete("1.0", tk.END)
-            image_label.config(text="No image selected")
-            self.selected_image = None
-            self.show_feed_screen()
+            # Store image blob if selected, reading the file on the image pipeline
+            if self.selected_image:
+                path = self.selected_image
+                post_button.config(state=tk.DISABLED)
+                # Closing the window waits for the upload, so the post is never lost
+                self.image_pipeline.submit(('upload', path), lambda: self.images.put_file(path), publish, finish=True)
+            else:
+                publish(None, None)
         
-        ttk.Button(frame, text="📤 Post", command=post).pack(pady=10)
+        post_button = ttk.Button(frame, text="📤 Post", command=post)
+        post_button.pack(pady=10)
     
+    @METRICS.rendered("friends tab")
     def create_friends_tab(self, parent):
-        """Create the friends tab showing who you follow"""
-        self.root.state('zoomed')
-
-
-        canvas = tk.Canvas(parent, bg="gray", highlightthickness=0)
-        scrollbar = ttk.Scrollbar(parent, orient="vertical", command=canvas.yview)
-        scrollable_frame = tk.Frame(canvas, bg="gray")
-        
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
+        """Create the friends tab showing who you follow"""
+        maximize(self.root)
+
+        title = tk.Label(parent, text="👥 Your Friends", font=("Arial", 16, "bold"), bg="#1a1a1a", fg="white")
+        title.pack(side=tk.TOP, fill=tk.X)
         
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="n")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        def unfollow(u):
+            self.store.unfollow(self.current_user, u)
         
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        def render(row, username):
+            friend_frame = tk.Frame(row, bg="#262626", relief=tk.FLAT)
+            friend_frame.pack(pady=50, padx=650, fill=tk.X)
+            
+            name_label = tk.Label(friend_frame, font=("Arial", 12, "bold"), bg="#262626", fg="white")
+            name_label.pack(anchor=tk.W, padx=15, pady=(10, 5))
+            
+            bio_label = tk.Label(friend_frame, font=("Arial", 9), bg="#262626", fg="#888888")
+            bio_label.pack(anchor=tk.W, padx=15, pady=(0, 5))
+            
+            stats_label = tk.Label(friend_frame, font=("Arial", 8), bg="#262626", fg="#888888")
+            stats_label.pack(anchor=tk.W, padx=15, pady=(0, 10))
+            
+            btn = tk.Button(friend_frame, text="Unfollow ✕", bg="#404040", fg="black", border=0, padx=15, pady=8, font=("Arial", 9))
+            btn.pack(anchor=tk.W, padx=15, pady=(0, 10))
+            
+            row.card = (name_label, bio_label, stats_label, btn)
+            update(row, username)
         
-        title = tk.Label(scrollable_frame, text="👥 Your Friends", font=("Arial", 16, "bold"), bg="#1a1a1a", fg="white")
-        title.pack(pady=15)
+        def update(row, username):
+            name_label, bio_label, stats_label, btn = row.card
+            name_label.config(text=f"@{username}")
+            user = self.store.get_user(username)
+            bio_text = user['bio'] if user['bio'] else "(No bio)"
+            bio_label.config(text=bio_text)
+            posts_count = user['post_count']
+            followers_count = user['follower_count']
+            stats_label.config(text=f"📝 {posts_count} posts • 👥 {followers_count} followers")
+            btn.config(command=lambda u=username: unfollow(u))
+            return True
         
-        following_list = self.users[self.current_user].get('following', [])
+        friends_list = VirtualList(
+            parent, render, update=update, bg="gray", row_bg="gray",
+            empty_text="You haven't followed anyone yet!"
+        )
         
-        if not following_list:
-            label = tk.Label(scrollable_frame, text="You haven't followed anyone yet!", font=("Arial", 11), bg="#1a1a1a", fg="white")
-            label.pack(pady=20)
+        def on_follow_change(change):
+            if change['op'] not in ('follow', 'unfollow') or change['user'] != self.current_user:
+                return
+            if change['op'] == 'unfollow':
+                friends_list.remove(change['target'])
+            elif friends_list.index_of(change['target']) is None:
+                index = bisect_left(friends_list.items, change['target'])
+                friends_list.insert(index, change['target'])
         
-        for username in sorted(following_list):
-            if username in self.users:
-                friend_frame = tk.Frame(scrollable_frame, bg="#262626", relief=tk.FLAT)
-                friend_frame.pack(pady=50, padx=650, fill=tk.X)
-                
-                name_label = tk.Label(friend_frame, text=f"@{username}", font=("Arial", 12, "bold"), bg="#262626", fg="white")
-                name_label.pack(anchor=tk.W, padx=15, pady=(10, 5))
-                
-                bio_text = self.users[username].get('bio', '') if self.users[username].get('bio', '') else "(No bio)"
-                bio_label = tk.Label(friend_frame, text=bio_text, font=("Arial", 9), bg="#262626", fg="#888888")
-                bio_label.pack(anchor=tk.W, padx=15, pady=(0, 5))
-                
-                posts_count = len(self.users[username].get('posts', []))
-                followers_count = len(self.users[username].get('followers', []))
-                stats_label = tk.Label(friend_frame, text=f"📝 {posts_count} posts • 👥 {followers_count} followers", font=("Arial", 8), bg="#262626", fg="#888888")
-                stats_label.pack(anchor=tk.W, padx=15, pady=(0, 10))
-                
-                def unfollow(u=username):
-                    if u in self.users[self.current_user].get('following', []):
-                        try:
-                            self.users[self.current_user]['following'].remove(u)
-                        except:
-                            pass
-                    if self.current_user in self.users[u].get('followers', []):
-                        try:
-                            self.users[u]['followers'].remove(self.current_user)
-                        except:
-                            pass
-                    self.save_data()
-                    self.show_feed_screen()
-                
-                btn = tk.Button(friend_frame, text="Unfollow ✕", command=unfollow, bg="#404040", fg="black", border=0, padx=15, pady=8, font=("Arial", 9))
-                btn.pack(anchor=tk.W, padx=15, pady=(0, 10))
+        self.notifier.subscribe(('user', self.current_user), on_follow_change, owner=friends_list.canvas)
+        
+        friends_list.set_items(sorted(self.store.following(self.current_user)))
     
+    @METRICS.rendered("rankings tab")
     def create_rankings_tab(self, parent):
         """Create the rankings/leaderboard tab"""
                
-        self.root.state('zoomed')
+        maximize(self.root)
 
         frame = ttk.Frame(parent)
         frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         ttk.Label(frame, text="🏆 Global Rankings", font=("Arial", 14, "bold")).pack(pady=10)
-        ttk.Label(frame, text="Ranked by number of posts", font=("Arial", 10)).pack(pady=5)
+        
+        # Ranking key / time window selectors
+        options_frame = ttk.Frame(frame)
+        options_frame.pack(pady=5)
+        
+        ttk.Label(options_frame, text="Ranked by", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
+        # Streak boards come from self.streaks rather than the store: every post, then its busiest tags once built
+        streak_keys = {"day streak": None} if load_numpy() else {}
+        key_names = list(RankingIndex.KEYS.values())
+        key_box = ttk.Combobox(options_frame, values=key_names + list(streak_keys), state="readonly", width=18)
+        key_box.set(key_names[0])
+        
+        def add_streak_keys(change=None):
+            if self.streaks is not None:
+                streak_keys.update((f"{tag} streak", tag) for tag in self.streaks.tags())
+                key_box.config(values=key_names + list(streak_keys))
+        key_box.pack(side=tk.LEFT, padx=5)
+        
+        window_names = list(RankingIndex.WINDOWS.values())
+        window_box = ttk.Combobox(options_frame, values=window_names, state="readonly", width=12)
+        window_box.set(window_names[0])
+        window_box.pack(side=tk.LEFT, padx=5)
+        
+        own_rank_label = ttk.Label(frame, font=("Arial", 10))
+        own_rank_label.pack(pady=5)
+        
+        # Paging controls
+        pager = ttk.Frame(frame)
+        pager.pack(side=tk.BOTTOM, pady=5)
+        prev_button = ttk.Button(pager, text="◀ Prev")
+        prev_button.pack(side=tk.LEFT, padx=5)
+        page_label = ttk.Label(pager, font=("Arial", 10))
+        page_label.pack(side=tk.LEFT, padx=10)
+        next_button = ttk.Button(pager, text="Next ▶")
+        next_button.pack(side=tk.LEFT, padx=5)
         
         scroll_frame = ttk.Frame(frame)
         scroll_frame.pack(fill=tk.BOTH, expand=True)
         
-        canvas = tk.Canvas(scroll_frame, bg="gray", highlightthickness=0)
-        scrollbar = ttk.Scrollbar(scroll_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
+        units = {'posts': "📝 {} posts", 'likes': "❤️ {} likes", 'followers': "👥 {} followers", 'streak': "🔥 {} day streak"}
+        state = {'key': 'posts', 'window': 'all', 'tag': None, 'page': 0}
         
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
+        def render(row, entry):
+            rank_frame = ttk.Frame(row)
+            rank_frame.pack(fill=tk.X, padx=5, pady=3)
+            
+            # Create a container for the rank info
+            info_frame = ttk.Frame(rank_frame)
+            info_frame.pack(fill=tk.X, padx=10, pady=8)
+            
+            # Rank and username (left side)
+            rank_label = ttk.Label(info_frame, font=("Arial", 11, "bold"))
+            rank_label.pack(side=tk.LEFT, padx=5)
+            
+            # Score (right side)
+            count_label = ttk.Label(info_frame, font=("Arial", 10))
+            count_label.pack(side=tk.RIGHT, padx=5)
+            
+            # Bio (second line)
+            bio_label = ttk.Label(rank_frame, font=("Arial", 8, "italic"), foreground="gray")
+            bio_label.pack(fill=tk.X, padx=15)
+            
+            row.card = (rank_frame, rank_label, count_label, bio_label)
+            update(row, entry)
+        
+        def update(row, entry):
+            rank, username, score = entry
+            rank_frame, rank_label, count_label, bio_label = row.card
+            
+            # Highlight current user's friends in blue
+            is_friend = self.store.is_following(self.current_user, username)
+            is_self = username == self.current_user
+            
+            if is_self or is_friend:
+                rank_frame.configure(relief=tk.RAISED, borderwidth=2)
+            else:
+                rank_frame.configure(relief=tk.FLAT, borderwidth=0)
+            
+            # Medal emojis for top 3
+            medal = ""
+            if rank == 1:
+                medal = "🥇 "
+            elif rank == 2:
+                medal = "🥈 "
+            elif rank == 3:
+                medal = "🥉 "
+            
+            rank_text = f"#{rank} {medal}@{username}"
+            
+            if is_self:
+                rank_text += " (YOU)"
+            
+            rank_label.config(text=rank_text)
+            count_label.config(text=units[state['key']].format(score))
+            bio = self.store.get_user(username)['bio']
+            bio_text = bio if bio else "(No bio)"
+            bio_label.config(text=bio_text)
+            return True
+        
+        rankings_list = VirtualList(
+            scroll_frame, render, update=update, bg="gray", anchor="nw", estimate=70,
+            empty_text="No posts yet! Be the first to post.", empty_fg="black"
         )
         
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        def load_rankings(change=None):
+            # Only users with a score are ranked, one page at a time
+            offset = state['page'] * RANKINGS_PAGE_SIZE
+            if state['key'] != 'streak':
+                rankings_list.empty_text = "No posts yet! Be the first to post."
+                entries, total = self.store.rankings(state['key'], state['window'], offset, RANKINGS_PAGE_SIZE)
+                own_rank = self.store.rank(self.current_user, state['key'], state['window'])
+            elif self.streaks is None:
+                self.refresh_analytics('streaks')
+                rankings_list.empty_text = "Calculating streaks..."
+                entries, total, own_rank = [], 0, None
+            else:
+                rankings_list.empty_text = "Nobody is on a streak. Post today to start one!"
+                entries, total = self.streaks.rankings(state['tag'], offset, RANKINGS_PAGE_SIZE)
+                own_rank = self.streaks.rank(self.current_user, state['tag'])
+            pages = max((total + RANKINGS_PAGE_SIZE - 1) // RANKINGS_PAGE_SIZE, 1)
+            if state['page'] >= pages:
+                state['page'] = pages - 1
+                return load_rankings()
+            rankings_list.set_items(entries)
+            
+            page_label.config(text=f"Page {state['page'] + 1} of {pages}")
+            prev_button.config(state=tk.NORMAL if state['page'] > 0 else tk.DISABLED)
+            next_button.config(state=tk.NORMAL if state['page'] < pages - 1 else tk.DISABLED)
+            
+            if own_rank is None:
+                own_rank_label.config(text="You are not ranked yet")
+            else:
+                own_rank_label.config(text=f"Your rank: #{own_rank} of {total}")
         
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        def on_options_changed(event=None):
+            names = {v: k for k, v in RankingIndex.KEYS.items()}
+            names.update((name, 'streak') for name in streak_keys)
+            state['key'] = names[key_box.get()]
+            state['tag'] = streak_keys.get(key_box.get())
+            if state['key'] in RankingIndex.WINDOWED_KEYS:
+                window_box.config(state="readonly")
+                state['window'] = {v: k for k, v in RankingIndex.WINDOWS.items()}[window_box.get()]
+            else:
+                window_box.set(RankingIndex.WINDOWS['all'])
+                window_box.config(state=tk.DISABLED)
+                state['window'] = 'all'
+            state['page'] = 0
+            load_rankings()
         
-        # Get all users with posts and sort by post count
-        user_rankings = []
-        for username, user_data in self.users.items():
-            post_count = len(user_data.get('posts', []))
-            if post_count > 0:  # Only include users with at least 1 post
-                user_rankings.append((username, post_count))
+        def turn_page(step):
+            state['page'] += step
+            load_rankings()
         
-        # Sort by post count (descending)
-        user_rankings.sort(key=lambda x: x[1], reverse=True)
+        key_box.bind("<<ComboboxSelected>>", on_options_changed)
+        window_box.bind("<<ComboboxSelected>>", on_options_changed)
+        prev_button.config(command=lambda: turn_page(-1))
+        next_button.config(command=lambda: turn_page(1))
         
-        if not user_rankings:
-            ttk.Label(scrollable_frame, text="No posts yet! Be the first to post.", font=("Arial", 11)).pack(pady=20)
-        else:
-            for rank, (username, post_count) in enumerate(user_rankings, 1):
-                # Highlight current user's friends in blue
-                is_friend = username in self.users[self.current_user].get('following', [])
-                is_self = username == self.current_user
-                
-                if is_self or is_friend:
-                    rank_frame = ttk.Frame(scrollable_frame, relief=tk.RAISED, borderwidth=2)
-                else:
-                    rank_frame = ttk.Frame(scrollable_frame)
-                
-                rank_frame.pack(fill=tk.X, padx=5, pady=3)
-                
-                # Create a container for the rank info
-                info_frame = ttk.Frame(rank_frame)
-                info_frame.pack(fill=tk.X, padx=10, pady=8)
-                
-                # Medal emojis for top 3
-                medal = ""
-                if rank == 1:
-                    medal = "🥇 "
-                elif rank == 2:
-                    medal = "🥈 "
-                elif rank == 3:
-                    medal = "🥉 "
-                
-                rank_text = f"#{rank} {medal}@{username}"
-                
-                if is_self:
-                    rank_text += " (YOU)"
-                
-                # Rank and username (left side)
-                ttk.Label(
-                    info_frame,
-                    text=rank_text,
-                    font=("Arial", 11, "bold")
-                ).pack(side=tk.LEFT, padx=5)
-                
-                # Post count (right side)
-                ttk.Label(
-                    info_frame,
-                    text=f"📝 {post_count} posts",
-                    font=("Arial", 10)
-                ).pack(side=tk.RIGHT, padx=5)
-                
-                # Bio (second line)
-                bio_text = self.users[username].get('bio', '') if self.users[username].get('bio', '') else "(No bio)"
-                ttk.Label(
-                    rank_frame,
-                    text=bio_text,
-                    font=("Arial", 8, "italic"),
-                    foreground="gray"
-                ).pack(fill=tk.X, padx=15)
+        def on_change(change):
+            self.tabs.refresh(parent, load_rankings)
+        
+        def on_streaks(change):
+            add_streak_keys()
+            on_change(change)
+        
+        # Scores move on posts, likes and follows, and streaks arrive once built
+        for topic in ('posts', 'likes', 'follows'):
+            self.notifier.subscribe(topic, on_change, owner=rankings_list.canvas)
+        self.notifier.subscribe('streaks', on_streaks, owner=rankings_list.canvas)
+        add_streak_keys()
+        load_rankings()
     
+    @METRICS.rendered("discover tab")
     def create_discover_tab(self, parent):
         """Create the discover tab to find and follow users"""
-        self.root.state('zoomed')
+        maximize(self.root)
 
         frame = ttk.Frame(parent)
         frame.pack(fill=tk.BOTH, expand=True, padx=300, pady=50)
         
         ttk.Label(frame, text="🔍 Discover Users", font=("Arial", 14, "bold")).pack(pady=10)
         
-        scroll_frame = ttk.Frame(frame)
-        scroll_frame.pack(fill=tk.BOTH, expand=True)
+        # Who to follow, filled in by show_suggestions below
+        suggestions_frame = ttk.LabelFrame(frame, text="Suggested for you", padding=10)
+        suggestions_frame.pack(fill=tk.X, pady=5)
         
-        canvas = tk.Canvas(scroll_frame, bg="#9e89c4", highlightthickness=0)
-        scrollbar = ttk.Scrollbar(scroll_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
+        # Search box (username prefix or words in the bio)
+        search_frame = ttk.Frame(frame)
+        search_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(search_frame, text="Search:", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
+        search_entry = ttk.Entry(search_frame, width=40)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        results_label = ttk.Label(search_frame, font=("Arial", 9, "italic"))
+        results_label.pack(side=tk.LEFT, padx=10)
         
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
+        # Paging controls
+        pager = ttk.Frame(frame)
+        pager.pack(side=tk.BOTTOM, pady=5)
+        prev_button = ttk.Button(pager, text="◀ Prev")
+        prev_button.pack(side=tk.LEFT, padx=5)
+        page_label = ttk.Label(pager, font=("Arial", 10))
+        page_label.pack(side=tk.LEFT, padx=10)
+        next_button = ttk.Button(pager, text="Next ▶")
+        next_button.pack(side=tk.LEFT, padx=5)
         
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        scroll_frame = ttk.Frame(frame)
+        scroll_frame.pack(fill=tk.BOTH, expand=True)
         
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        state = {'page': 0, 'pending': None}
         
-        user_count = 0
-        for username in sorted(self.users.keys()):
-            if username == self.current_user:
-                continue
-            
-            user_count += 1
-            user_frame = ttk.LabelFrame(scrollable_frame, text=f"@{username}", padding=50)
+        def toggle_follow(u):
+            # The follows subscription below patches just this card
+            if self.store.is_following(self.current_user, u):
+                self.store.unfollow(self.current_user, u)
+            else:
+                self.store.follow(self.current_user, u)
+        
+        def render(row, username):
+            user_frame = ttk.LabelFrame(row, padding=50)
             user_frame.pack(fill=tk.X, padx=5, pady=5)
             
-            bio_text = self.users[username].get('bio', '') if self.users[username].get('bio', '') else "(No bio)"
-            ttk.Label(user_frame, text=bio_text, font=("Arial", 12)).pack(anchor=tk.W)
+            bio_label = ttk.Label(user_frame, font=("Arial", 12))
+            bio_label.pack(anchor=tk.W)
             
-            stats = f"Posts: {len(self.users[username].get('posts', []))} | Followers: {len(self.users[username].get('followers', []))}"
-            ttk.Label(user_frame, text=stats, font=("Arial", 9, "italic")).pack(anchor=tk.W, pady=3)
+            stats_label = ttk.Label(user_frame, font=("Arial", 9, "italic"))
+            stats_label.pack(anchor=tk.W, pady=3)
             
-            is_following = username in self.users[self.current_user].get('following', [])
+            btn = ttk.Button(user_frame)
+            btn.pack(anchor=tk.W, pady=5)
             
+            row.card = (user_frame, bio_label, stats_label, btn)
+            update(row, username)
+        
+        def update(row, username):
+            user_frame, bio_label, stats_label, btn = row.card
+            user_frame.config(text=f"@{username}")
             
-            def toggle_follow(u=username, following=is_following):
-                if following:
-                    self.users[self.current_user]['following'].remove(u)
-                    self.users[u]['followers'].remove(self.current_user)
-                else:
-                    self.users[self.current_user]['following'].append(u)
-                    self.users[u]['followers'].append(self.current_user)
-
-                self.save_data()
-
-                # ❗ Instead of creating a NEW Discover section,
-                #    clear the existing one and rebuild it
-                for widget in parent.winfo_children():
-                    widget.destroy()
-
-                self.create_discover_tab(parent)
-
+            user = self.store.get_user(username)
+            bio_text = user['bio'] if user['bio'] else "(No bio)"
+            bio_label.config(text=bio_text)
             
+            stats = f"Posts: {user['post_count']} | Followers: {user['follower_count']}"
+            stats_label.config(text=stats)
+            
+            is_following = self.store.is_following(self.current_user, username)
             btn_text = "Unfollow ✓" if is_following else "Follow +"
-            ttk.Button(user_frame, text=btn_text, command=toggle_follow).pack(anchor=tk.W, pady=5)
+            btn.config(text=btn_text, command=lambda u=username: toggle_follow(u))
+            return True
+        
+        users_list = VirtualList(
+            scroll_frame, render, update=update, bg="#9e89c4", anchor="nw", estimate=190,
+            empty_text="No other users yet!", empty_fg="black"
+        )
+        
+        def load_users(change=None):
+            page, total = self.store.search_users(
+                search_entry.get(),
+                state['page'] * DISCOVER_PAGE_SIZE,
+                DISCOVER_PAGE_SIZE,
+                exclude=self.current_user
+            )
+            pages = max((total + DISCOVER_PAGE_SIZE - 1) // DISCOVER_PAGE_SIZE, 1)
+            if state['page'] >= pages:
+                state['page'] = pages - 1
+                return load_users()
+            
+            users_list.empty_text = "No users match your search" if search_entry.get().strip() else "No other users yet!"
+            users_list.set_items(page)
+            
+            results_label.config(text=f"{total} users")
+            page_label.config(text=f"Page {state['page'] + 1} of {pages}")
+            prev_button.config(state=tk.NORMAL if state['page'] > 0 else tk.DISABLED)
+            next_button.config(state=tk.NORMAL if state['page'] < pages - 1 else tk.DISABLED)
+        
+        def on_search(event=None):
+            # Wait for a pause in typing before querying
+            if state['pending'] is not None:
+                search_entry.after_cancel(state['pending'])
+            state['page'] = 0
+            state['pending'] = search_entry.after(250, run_search)
+        
+        def run_search():
+            state['pending'] = None
+            load_users()
+        
+        def turn_page(step):
+            state['page'] += step
+            load_users()
+        
+        search_entry.bind("<KeyRelease>", on_search)
+        prev_button.config(command=lambda: turn_page(-1))
+        next_button.config(command=lambda: turn_page(1))
+        
+        def show_suggestions(change=None):
+            for widget in suggestions_frame.winfo_children():
+                widget.destroy()
+            # Suggestions are only built for, and refreshed by, this tab
+            self.refresh_analytics('suggestions')
+            if self.suggestions is None:
+                text = "Finding people you may know..." if load_scipy() else "Suggestions need numpy and scipy installed"
+                ttk.Label(suggestions_frame, text=text, font=("Arial", 9, "italic")).pack(anchor=tk.W)
+                return
+            suggested = self.suggestions.suggestions(self.current_user)
+            if not suggested:
+                ttk.Label(suggestions_frame, text="Follow a few people or post with #tags to get suggestions",
+                          font=("Arial", 9, "italic")).pack(anchor=tk.W)
+            for username, mutual, follows_you, tag in suggested:
+                row = ttk.Frame(suggestions_frame)
+                row.pack(fill=tk.X, pady=2)
+                ttk.Label(row, text=f"@{username}", font=("Arial", 11, "bold")).pack(side=tk.LEFT)
+                reasons = []
+                if mutual:
+                    reasons.append(f"{mutual} mutual follow{'s' if mutual != 1 else ''}")
+                if follows_you:
+                    reasons.append("follows you")
+                if tag:
+                    reasons.append(f"also posts {tag}")
+                ttk.Label(row, text=" · ".join(reasons), font=("Arial", 9, "italic")).pack(side=tk.LEFT, padx=10)
+                ttk.Button(row, text="Follow +", command=lambda u=username: toggle_follow(u)).pack(side=tk.RIGHT)
+        
+        def on_follow_change(change):
+            users_list.refresh_item(change['target'])
+            # The app's own subscription has already rescored the follower
+            if change['user'] == self.current_user:
+                show_suggestions()
         
-        if user_count == 0:
-            ttk.Label(scrollable_frame, text="No other users yet!", font=("Arial", 11)).pack(pady=20)
+        self.notifier.subscribe('users', load_users, owner=users_list.canvas)
+        self.notifier.subscribe('follows', on_follow_change, owner=users_list.canvas)
+        self.notifier.subscribe('suggestions', show_suggestions, owner=users_list.canvas)
+        load_users()
+        show_suggestions()
     
+    @METRICS.rendered("explore tab")
     def create_explore_tab(self, parent):
         """Explore tab shows all posts + tag categories"""
-        self.root.state('zoomed')
+        maximize(self.root)
 
 
-        notebook = ttk.Notebook(parent)
-        notebook.pack(fill=tk.BOTH, expand=True)
+        explore_tabs = LazyNotebook(parent)
+        explore_tabs.notebook.pack(fill=tk.BOTH, expand=True)
 
         # ----------- TAB 1: ALL POSTS -------------
-        all_tab = ttk.Frame(notebook)
-        notebook.add(all_tab, text="🔥 All Posts")
-        self.build_explore_feed(all_tab, mode="all")
+        explore_tabs.add("🔥 All Posts", lambda tab: self.build_explore_feed(tab, mode="all"))
 
-        # ----------- TAB 2: #study ---------------
-        study_tab = ttk.Frame(notebook)
-        notebook.add(study_tab, text="#study")
-        self.build_explore_feed(study_tab, mode="#study")
+        # ----------- TRENDING TAGS: built when first opened ---------------
+        tags = self.store.trending_tags()
+        for tag in DEFAULT_EXPLORE_TAGS:
+            if len(tags) >= TRENDING_TAGS:
+                break
+            if tag not in tags:
+                tags.append(tag)
+        for tag in tags:
+            explore_tabs.add(tag, lambda tab, t=tag: self.build_explore_feed(tab, mode=t))
 
-        # ----------- TAB 3: #hydrated ------------
-        hydrated_tab = ttk.Frame(notebook)
-        notebook.add(hydrated_tab, text="#hydrated")
-        self.build_explore_feed(hydrated_tab, mode="#hydrated")
-
-        # ----------- TAB 4: #nutrition -----------
-        nutrition_tab = ttk.Frame(notebook)
-        notebook.add(nutrition_tab, text="#nutrition")
-        self.build_explore_feed(nutrition_tab, mode="#nutrition")
-        
-        # ----------- TAB 5: #fitness -----------
-        fitness_tab = ttk.Frame(notebook)
-        notebook.add(fitness_tab, text="#fitness")
-        self.build_explore_feed(fitness_tab, mode="#fitness")
-        
-        # ----------- TAB 5: #sleep -----------
-        fitness_tab = ttk.Frame(notebook)
-        notebook.add(fitness_tab, text="#sleep")
-        self.build_explore_feed(fitness_tab, mode="#sleep")
+        explore_tabs.build(explore_tabs.notebook.select())
 
 
     
+    @METRICS.rendered("explore feed")
     def build_explore_feed(self, parent, mode="all"):
-        canvas = tk.Canvas(parent, bg="#1a1a1a", highlightthickness=0)
-        scrollbar = ttk.Scrollbar(parent, orient="vertical", command=canvas.yview)
-        scrollable_frame = tk.Frame(canvas, bg="#1a1a1a")
-
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
+        msg = f"No posts found for {mode}" if mode != "all" else "No posts yet!"
+        tag = None if mode == "all" else mode
+        cursor = None
+        exhausted = False
 
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        def load_more():
+            nonlocal cursor, exhausted
+            if exhausted:
+                return
+            # Newest first, straight from the tag index
+            page, cursor = self.store.explore(tag, cursor, FEED_PAGE_SIZE)
+            exhausted = cursor is None
+            explore_list.append(page)
 
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        explore_list = VirtualList(
+            parent,
+            lambda row, item: self.create_post_widget(row, *item),
+            key=lambda item: item[1]['id'],
+            anchor="nw",
+            empty_text=msg,
+            on_end=load_more
+        )
+        load_more()
 
-        # Gather *all* posts from *all* users
-        all_posts = []
-        for user, data in self.users.items():
-            for post in data.get("posts", []):
-                all_posts.append((user, post))
-
-        # Filter by tag if needed
-        if mode != "all":
-            tag = mode.lower()
-            all_posts = [
-                (u, p) for (u, p) in all_posts
-                if "tags" in p and tag in [t.lower() for t in p.get("tags", [])]
-            ]
-
-        # Sort newest first (by timestamp if present)
-        all_posts.sort(key=lambda x: x[1].get("timestamp", ""), reverse=True)
-
-        if not all_posts:
-            msg = f"No posts found for {mode}" if mode != "all" else "No posts yet!"
-            tk.Label(scrollable_frame, text=msg, fg="white", bg="#1a1a1a",
-                     font=("Arial", 12)).pack(pady=20)
-            return
+        def on_new_post(change):
+            if mode == "all" or mode.lower() in [t.lower() for t in change['post'].get("tags", [])]:
+                explore_list.insert(0, (change['user'], change['post']))
 
-        for username, post in all_posts:
-            self.create_post_widget(scrollable_frame, username, post)
+        self.notifier.subscribe('posts', on_new_post, owner=explore_list.canvas)
+    
+    @METRICS.rendered("search tab")
+    def create_search_tab(self, parent):
+        """Create the tab searching the text of every post"""
+        frame = ttk.Frame(parent)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        search_frame = ttk.Frame(frame)
+        search_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(search_frame, text="Search posts:", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
+        search_entry = ttk.Entry(search_frame, width=50)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        results_label = ttk.Label(search_frame, font=("Arial", 9, "italic"))
+        results_label.pack(side=tk.LEFT, padx=10)
+        
+        state = {'offset': 0, 'more': False, 'pending': None}
+        
+        def load_more():
+            if not state['more']:
+                return
+            # Best matches first; pages go deeper into the same ranking
+            page, state['more'] = self.store.search_posts(search_entry.get(), state['offset'], FEED_PAGE_SIZE)
+            state['offset'] += FEED_PAGE_SIZE
+            results_list.append(page)
+        
+        results_list = VirtualList(
+            frame,
+            lambda row, item: self.create_post_widget(row, *item),
+            key=lambda item: item[1]['id'],
+            anchor="nw",
+            empty_text="Search every post by words or #tags",
+            on_end=load_more
+        )
+        
+        def run_search():
+            state['pending'] = None
+            query = search_entry.get().strip()
+            state['offset'] = 0
+            state['more'] = bool(query)
+            results_list.empty_text = "No posts match your search" if query else "Search every post by words or #tags"
+            results_list.set_items([])
+            started = time.perf_counter()
+            load_more()
+            results_label.config(text=f"{(time.perf_counter() - started) * 1000:.0f} ms" if query else "")
+        
+        def on_search(event=None):
+            # Wait for a pause in typing before querying
+            if state['pending'] is not None:
+                search_entry.after_cancel(state['pending'])
+            state['pending'] = search_entry.after(250, run_search)
+        
+        search_entry.bind("<KeyRelease>", on_search)
+        search_entry.focus_set()
     
+    @METRICS.timed("show profile")
     def show_profile(self):
         """Show user profile"""
         profile_window = tk.Toplevel(self.root)
         profile_window.title(f"{self.current_user} - Profile")
         profile_window.geometry("1500x1200+750+600")
-        profile_window.state('zoomed')  # Maximize window
+        maximize(profile_window)
         profile_window.configure(bg="#1a1a1a")
         
         # Main scrollable frame
@@ -704,31 +5027,59 @@ class SocialMediaApp:
         username_label = tk.Label(header_frame, text=f"@{self.current_user}", font=("Arial", 32, "bold"), bg="#1a1a1a", fg="white")
         username_label.pack(pady=15)
         
-        bio_label = tk.Label(header_frame, text=f"{self.users[self.current_user].get('bio', '')}", font=("Arial", 14), bg="#1a1a1a", fg="#888888")
+        user = self.store.get_user(self.current_user)
+        bio_label = tk.Label(header_frame, text=f"{user['bio']}", font=("Arial", 14), bg="#1a1a1a", fg="#888888")
         bio_label.pack(pady=8)
         
         # Stats section
         stats_frame = tk.Frame(center_frame, bg="#262626", relief=tk.FLAT)
         stats_frame.pack(fill=tk.X, pady=20)
         
-        followers = len(self.users[self.current_user].get('followers', []))
-        following = len(self.users[self.current_user].get('following', []))
-        posts = len(self.users[self.current_user].get('posts', []))
+        followers = user['follower_count']
+        following = user['following_count']
+        posts = user['post_count']
         
         stats_label = tk.Label(stats_frame, text=f"📝 {posts} Posts     👥 {followers} Followers     🔗 {following} Following", font=("Arial", 15, "bold"), bg="#262626", fg="white")
         stats_label.pack(pady=25)
         
+        # Streaks section, filled in by show_streaks once the streaks are built
+        streaks_label = tk.Label(center_frame, text="🔥 Streaks", font=("Arial", 16, "bold"), bg="#1a1a1a", fg="white")
+        streaks_label.pack(pady=(20, 15))
+        streaks_display = tk.Frame(center_frame, bg="#1a1a1a")
+        streaks_display.pack(fill=tk.X)
+        
+        def show_streaks(change=None):
+            for widget in streaks_display.winfo_children():
+                widget.destroy()
+            if self.streaks is None:
+                self.refresh_analytics('streaks')
+                text = "Calculating streaks..." if load_numpy() else "Streaks need numpy installed"
+                tk.Label(streaks_display, text=text, font=("Arial", 12), bg="#1a1a1a", fg="#888888").pack()
+                return
+            habits = self.streaks.profile(self.current_user)
+            if not habits:
+                tk.Label(streaks_display, text="Post to start a streak", font=("Arial", 12), bg="#1a1a1a", fg="#888888").pack()
+            for tag, current, longest, weekly in habits:
+                # One bar per week, by how many of its days had a post
+                bars = "".join("·▁▂▃▄▅▆█"[days] for days in weekly)
+                text = f"{tag or 'All posts'}: 🔥 {current} day{'s' if current != 1 else ''}   best {longest}   last {STREAK_WEEKS} weeks {bars}"
+                tk.Label(streaks_display, text=text, font=("Arial", 13), bg="#1a1a1a", fg="white").pack(pady=4)
+        
+        self.notifier.subscribe('streaks', show_streaks, owner=streaks_display)
+        show_streaks()
+        
         # Followers section
         followers_label = tk.Label(center_frame, text="👥 Followers", font=("Arial", 16, "bold"), bg="#1a1a1a", fg="white")
         followers_label.pack(pady=(20, 15))
         
-        if not self.users[self.current_user].get('followers', []):
+        follower_names = self.store.followers(self.current_user)
+        if not follower_names:
             no_followers = tk.Label(center_frame, text="No followers yet", font=("Arial", 12), bg="#1a1a1a", fg="#888888")
             no_followers.pack()
         else:
             followers_display = tk.Frame(center_frame, bg="#1a1a1a")
             followers_display.pack(fill=tk.X)
-            for follower in sorted(self.users[self.current_user].get('followers', [])):
+            for follower in sorted(follower_names):
                 follower_label = tk.Label(followers_display, text=f"• @{follower}", font=("Arial", 13), bg="#1a1a1a", fg="white")
                 follower_label.pack(pady=4)
         
@@ -736,13 +5087,14 @@ class SocialMediaApp:
         following_label = tk.Label(center_frame, text="🔗 Following", font=("Arial", 16, "bold"), bg="#1a1a1a", fg="white")
         following_label.pack(pady=(20, 15))
         
-        if not self.users[self.current_user].get('following', []):
+        following_names = self.store.following(self.current_user)
+        if not following_names:
             no_following = tk.Label(center_frame, text="Not following anyone yet", font=("Arial", 12), bg="#1a1a1a", fg="#888888")
             no_following.pack()
         else:
             following_display = tk.Frame(center_frame, bg="#1a1a1a")
             following_display.pack(fill=tk.X)
-            for person in sorted(self.users[self.current_user].get('following', [])):
+            for person in sorted(following_names):
                 person_label = tk.Label(following_display, text=f"• @{person}", font=("Arial", 13), bg="#1a1a1a", fg="white")
                 person_label.pack(pady=4)
         
@@ -750,28 +5102,950 @@ class SocialMediaApp:
         posts_title = tk.Label(center_frame, text="📝 Your Posts", font=("Arial", 16, "bold"), bg="#1a1a1a", fg="white")
         posts_title.pack(pady=(20, 15))
         
-        if not self.users[self.current_user].get('posts', []):
+        own_posts = self.store.user_posts(self.current_user)
+        if not own_posts:
             no_posts = tk.Label(center_frame, text="No posts yet", font=("Arial", 12), bg="#1a1a1a", fg="#888888")
             no_posts.pack()
         else:
             posts_display = tk.Frame(center_frame, bg="#1a1a1a")
             posts_display.pack(fill=tk.BOTH, expand=True)
-            for post in self.users[self.current_user].get('posts', []):
+            for post in own_posts:
                 post_card = tk.Frame(posts_display, bg="#262626", relief=tk.FLAT)
                 post_card.pack(fill=tk.X, pady=10)
                 
                 time_label = tk.Label(post_card, text=post.get('timestamp', ''), font=("Arial", 11), bg="#262626", fg="#888888")
                 time_label.pack(anchor=tk.W, padx=20, pady=(12, 5))
                 
+                if post.get('image_id'):
+                    thumb_label = tk.Label(post_card, text="🖼", font=("Arial", 11), bg="#262626", fg="#888888")
+                    thumb_label.pack(anchor=tk.CENTER, padx=20, pady=5)
+                    self.show_thumbnail(thumb_label, post, 'thumb')
+                
                 content_label = tk.Label(post_card, text=post.get('content', ''), font=("Arial", 12), bg="#262626", fg="white", wraplength=800, justify=tk.CENTER)
                 content_label.pack(anchor=tk.CENTER, padx=20, pady=(5, 15))
     
     def logout(self):
         """Logout user"""
+        self.store.flush()
         self.current_user = None
         self.show_login_screen()
+    
+    def on_close(self):
+        """Write everything out, then close the window"""
+        # Views go first, so uploads finishing during shutdown only store their posts
+        self.clear_window()
+        try:
+            self.image_pipeline.shutdown()
+            self.store.close()
+        except Exception as e:
+            # The window closes regardless; say what may not have been saved
+            messagebox.showerror("Error", f"Could not save all changes: {e}")
+        finally:
+            if METRICS.enabled:
+                METRICS.write()
+            self.root.destroy()
+
+
+# ----------- Benchmarks -------------
+
+# Words the synthetic dataset generator builds bios and posts from
+BENCH_WORDS = [
+    "morning", "evening", "daily", "streak", "goal", "week", "progress", "today", "finally",
+    "again", "minutes", "pages", "miles", "glasses", "hours", "habit", "routine", "new",
+    "tired", "proud", "easy", "hard", "started", "kept", "skipped", "back", "with", "friends"
+]
+
+# Hashtags in order of popularity; picks follow a power law over this list
+BENCH_TAGS = [
+    "fitness", "reading", "running", "meditation", "water", "sleep", "journaling", "coding",
+    "gym", "yoga", "walking", "study", "nofap", "vegan", "piano", "guitar", "drawing",
+    "cycling", "swimming", "stretching", "cooking", "language", "budget", "nosugar"
+]
+
+# Operations timed per sampled user, and how many feed/explore pages follow the first
+BENCH_SAMPLES = 50
+BENCH_PAGES = 3
+
+
+def zipf_weights(n, exponent=1.1):
+    """Cumulative weights picking item i with probability proportional to 1 / (i + 1) ** exponent"""
+    return list(accumulate(1 / (i + 1) ** exponent for i in range(n)))
+
+
+def heavy_tailed(rng, mean):
+    """Random count with the given mean and a Pareto tail, so a few users do most of it"""
+    return int(rng.paretovariate(1.5) * mean / 3)
+
+
+def make_bench_image(rng):
+    """Small random JPEG standing in for an upload"""
+    load_pillow()
+    image = Image.new("RGB", (rng.randint(320, 1280), rng.randint(240, 960)), tuple(rng.choices(range(256), k=3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def generate_dataset(directory, users=1000, posts_per_user=20, follows_per_user=15, likes_per_post=5,
+                     images=0, days=60, seed=0):
+    """Write a synthetic DATA_FILE (and IMAGE_DIR) under directory and return its sizes
+
+    Follows and likes are drawn from a power law over users, so a few accounts are very
+    popular, and hashtags follow a power law over BENCH_TAGS. The same seed always gives
+    the same dataset, so reports from different commits can be compared.
+    """
+    import random
+    rng = random.Random(seed)
+    names = [f"user{i}" for i in range(users)]
+    popularity = zipf_weights(users)
+    tag_weights = zipf_weights(len(BENCH_TAGS))
+    now = datetime.now()
+    data = {
+        name: {
+            'password': "password",
+            'bio': " ".join(rng.sample(BENCH_WORDS, 3) + rng.sample(BENCH_TAGS, 2)),
+            'followers': [],
+            'following': [],
+            'posts': [],
+            'likes': []
+        }
+        for name in names
+    }
+    follows = likes = 0
+    for name in names:
+        followees = set(rng.choices(names, cum_weights=popularity, k=heavy_tailed(rng, follows_per_user)))
+        followees.discard(name)
+        for followee in followees:
+            data[name]['following'].append(followee)
+            data[followee]['followers'].append(name)
+        follows += len(followees)
+    
+    posts = []
+    for name in names:
+        times = sorted(now - timedelta(minutes=rng.randrange(days * 24 * 60)) for _ in range(heavy_tailed(rng, posts_per_user)))
+        for seq, when in enumerate(times):
+            tags = set(rng.choices(BENCH_TAGS, cum_weights=tag_weights, k=rng.randint(0, 3)))
+            content = " ".join(rng.sample(BENCH_WORDS, 6) + [f"#{tag}" for tag in tags])
+            likers = set(rng.choices(names, cum_weights=popularity, k=heavy_tailed(rng, likes_per_post)))
+            likes += len(likers)
+            post = {
+                'id': f"{name}:{seq}",
+                'content': content,
+                'timestamp': when.strftime("%Y-%m-%d %H:%M"),
+                'likes': sorted(likers),
+                'image_id': None,
+                'tags': extract_tags(content)
+            }
+            data[name]['posts'].insert(0, post)
+            posts.append(post)
+    
+    if images and posts:
+        store = ImageStore(os.path.join(directory, IMAGE_DIR))
+        for post in rng.sample(posts, min(images, len(posts))):
+            data_bytes = make_bench_image(rng)
+            post['image_id'] = store.put(data_bytes)
+            store.put_renditions(post['image_id'], data_bytes)
+    
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, DATA_FILE)
+    write_atomic(path, encode_users(path, data))
+    return {
+        'users': users,
+        'posts': len(posts),
+        'follows': follows,
+        'likes': likes,
+        'images': min(images, len(posts)),
+        'seed': seed,
+        'bytes': os.path.getsize(path)
+    }
+
+
+def latency_summary(samples):
+    """Count, throughput and percentiles of a list of durations in seconds"""
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'total_s': round(total, 6),
+        'ops_per_s': round(len(samples) / total, 1) if total else None,
+        **{
+            f"p{percent}_ms": round(samples[min(len(samples) - 1, len(samples) * percent // 100)] * 1000, 3)
+            for percent in (50, 90, 99)
+        },
+        'max_ms': round(samples[-1] * 1000, 3)
+    }
+
+
+class BenchTimer:
+    """Latencies of named operations, summarized as throughput and percentiles"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def time(self, name, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        self.add(name, time.perf_counter() - started)
+        return result
+
+    def report(self):
+        return {name: latency_summary(samples) for name, samples in self.samples.items()}
+
+
+def bench_reads(store, timer, names, rng):
+    """Time what the feed, explore, search, rankings, discover and profile screens ask the store for"""
+    for username in names:
+        cursor = None
+        for page in range(BENCH_PAGES):
+            _, cursor = timer.time("feed" if page == 0 else "feed next page", store.feed, username, cursor)
+            if cursor is None:
+                break
+        timer.time("profile", store.get_user, username)
+        timer.time("user posts", store.user_posts, username)
+        timer.time("search users", store.search_users, username[:rng.randint(1, len(username))], 0, DISCOVER_PAGE_SIZE, username)
+        for key in RankingIndex.KEYS:
+            window = rng.choice(('all', 'week')) if key in RankingIndex.WINDOWED_KEYS else 'all'
+            timer.time(f"rankings {window}", store.rankings, key, window)
+            timer.time(f"rank {window}", store.rank, username, key, window)
+    tags = timer.time("trending tags", store.trending_tags)
+    for tag in [None] + tags:
+        cursor = None
+        for page in range(BENCH_PAGES):
+            _, cursor = timer.time("explore" if page == 0 else "explore next page", store.explore, tag, cursor)
+            if cursor is None:
+                break
+    for username in names:
+        timer.time("search posts", store.search_posts, " ".join(rng.sample(BENCH_WORDS, rng.randint(1, 3))))
+
+
+def bench_suggestions(store, timer, names):
+    """Time the who-to-follow batch job, lookups, and the refresh after a follow"""
+    inputs = timer.time("suggestions export", store.interest_graph)
+    suggestions = timer.time("suggestions build", FollowSuggestions.build, *inputs)
+    for username in names:
+        suggested = timer.time("suggestions", suggestions.suggestions, username)
+        if suggested:
+            timer.time("suggestions refresh", suggestions.on_change, {'op': 'follow', 'user': username, 'target': suggested[0][0]})
+
+
+def bench_streaks(store, timer, names):
+    """Time building the habit streaks, a profile, the streak boards, and a new post landing"""
+    posts = timer.time("streaks export", store.post_activity)
+    streaks = timer.time("streaks build", HabitStreaks, posts)
+    timer.time("streak board", streaks.board)
+    for tag in store.trending_tags():
+        timer.time("streak board tag", streaks.board, tag)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M")
+    for username in names:
+        timer.time("streaks profile", streaks.profile, username)
+        timer.time("streak rankings", streaks.rankings)
+        timer.time("streak rank", streaks.rank, username)
+        timer.time("streaks post", streaks.on_change, {'op': 'post', 'user': username, 'post': {'timestamp': now, 'tags': ["#bench"]}})
+
+
+def bench_writes(store, timer, names, rng):
+    """Time posting, liking and following, then a full save where the backend has one"""
+    for username in names:
+        post = timer.time("post", store.add_post, username, f"benchmark post #{rng.choice(BENCH_TAGS)}")
+        timer.time("like", store.like, rng.choice(names), post['id'])
+        target = rng.choice(names)
+        if target != username:
+            toggle = store.unfollow if store.is_following(username, target) else store.follow
+            timer.time("follow toggle", toggle, username, target)
+    if hasattr(store, 'save_data'):
+        for _ in range(3):
+            store.save_data()
+            timer.time("save", store.flush)
+    else:
+        timer.time("save", store.flush)
+
+
+def bench_widgets(timer, names):
+    """Time building the main screen and each tab; needs a display (Xvfb will do)"""
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return f"skipped: {e}"
+    try:
+        app = SocialMediaApp(root)
+        for username in names:
+            app.current_user = username
+            timer.time("screen main", lambda: (app.show_feed_screen(), root.update()))
+            for index, name in enumerate(app.tabs.notebook.tabs()):
+                label = ("feed", "post", "friends", "rankings", "discover", "explore", "search")[index] if index < 7 else name
+                timer.time(f"tab {label}", lambda: (app.tabs.build(name), root.update()))
+        app.image_pipeline.shutdown()
+        app.store.close()
+        return "ok"
+    except tk.TclError as e:
+        return f"failed: {e}"
+    finally:
+        root.destroy()
+
+
+def run_benchmark(users=1000, images=0, seed=0, backend=None, samples=BENCH_SAMPLES, widgets=True):
+    """Generate a dataset in a scratch directory, time every store operation on it and return a report"""
+    import random
+    import tempfile
+    import tracemalloc
+    global STORAGE_BACKEND
+    if backend is not None:
+        STORAGE_BACKEND = backend
+    rng = random.Random(seed)
+    timer = BenchTimer()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="habithub-bench-") as directory:
+        started = time.perf_counter()
+        dataset = generate_dataset(directory, users=users, images=images, seed=seed)
+        dataset['generate_s'] = round(time.perf_counter() - started, 3)
+        os.chdir(directory)
+        try:
+            image_store = ImageStore(IMAGE_DIR)
+            # The first open converts or migrates the JSON data file, so it is timed apart
+            timer.time("first open", open_store, image_store).close()
+            for _ in range(3):
+                timer.time("open", open_store, image_store).close()
+            
+            store = open_store(image_store)
+            names = store.search_users("", 0, users)[0]
+            sample = rng.sample(names, min(samples, len(names)))
+            bench_reads(store, timer, sample, rng)
+            if load_scipy():
+                bench_suggestions(store, timer, sample)
+            if load_numpy():
+                bench_streaks(store, timer, sample)
+            bench_writes(store, timer, sample, rng)
+            store.close()
+            
+            # Peak memory is traced in a separate pass since tracing slows everything down
+            tracemalloc.start()
+            store = open_store(image_store)
+            bench_reads(store, BenchTimer(), sample[:5], rng)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            store.close()
+            
+            widget_status = bench_widgets(timer, sample[:5]) if widgets else "skipped"
+        finally:
+            os.chdir(cwd)
+    return {
+        'backend': STORAGE_BACKEND,
+        'persistence': PERSISTENCE_MODE,
+        'snapshot_format': SNAPSHOT_FORMAT,
+        'feed_mode': FEED_MODE,
+        'dataset': dataset,
+        'peak_memory_bytes': peak_memory,
+        'widgets': widget_status,
+        'operations': timer.report()
+    }
+
+
+def run_suggestions_benchmark(users=100000, seed=0, samples=BENCH_SAMPLES):
+    """Time the who-to-follow batch on a synthetic graph and return a report
+
+    Follows and hashtag use are drawn as generate_dataset draws them, without the posts
+    themselves, so a graph of 100k users fits in memory where the full dataset would not.
+    """
+    import random
+    import tracemalloc
+    rng = random.Random(seed)
+    timer = BenchTimer()
+    load_scipy()
+    names = [f"user{i}" for i in range(users)]
+    popularity = zipf_weights(users)
+    tag_weights = zipf_weights(len(BENCH_TAGS))
+    follows = []
+    uses = []
+    for name in names:
+        followees = set(rng.choices(names, cum_weights=popularity, k=heavy_tailed(rng, 15)))
+        followees.discard(name)
+        follows.extend((name, followee) for followee in followees)
+        counts = Counter()
+        for _ in range(heavy_tailed(rng, 20)):
+            counts.update(set(rng.choices(BENCH_TAGS, cum_weights=tag_weights, k=rng.randint(0, 3))))
+        uses.extend((name, f"#{tag}", count) for tag, count in counts.items())
+    
+    suggestions = timer.time("suggestions matrices", FollowSuggestions, names, follows, uses)
+    timer.time("suggestions score all", suggestions.score, np.arange(users))
+    sample = rng.sample(names, min(samples, users))
+    for username in sample:
+        suggested = timer.time("suggestions", suggestions.suggestions, username)
+        if suggested:
+            timer.time("suggestions refresh", suggestions.on_change, {'op': 'follow', 'user': username, 'target': suggested[0][0]})
+    # Users a follow marked stale are rescored on their next lookup
+    for uid in rng.sample(sorted(suggestions.stale), min(samples, len(suggestions.stale))):
+        timer.time("suggestions stale", suggestions.suggestions, names[uid])
+    
+    tracemalloc.start()
+    FollowSuggestions.build(names, follows, uses)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'users': users,
+        'follows': len(follows),
+        'tag_uses': len(uses),
+        'seed': seed,
+        'peak_memory_bytes': peak_memory,
+        'operations': timer.report()
+    }
+
+
+# ----------- API server -------------
+
+class ApiError(Exception):
+    """Error answered to an API client as {"error": message} with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def api_post(author, post, like_count):
+    """The JSON shape of a post in API responses"""
+    return {
+        'id': post['id'],
+        'author': author,
+        'content': post.get('content', ''),
+        'timestamp': post.get('timestamp', ''),
+        'tags': post.get('tags', []),
+        'image_id': post.get('image_id'),
+        'likes': like_count
+    }
+
+
+class ApiServer:
+    """HTTP/JSON API over the same store as the Tk window, served by asyncio
+
+    Stores are not thread-safe, so every store call runs on one dedicated thread while the
+    event loop only parses and writes HTTP; uploads and image reads go to a separate pool.
+    Connections are kept alive. Logins hand out bearer tokens held in memory.
+    """
+
+    def __init__(self, store, images):
+        self.store = store
+        self.images = images
+        self.store_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+        self.image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+        self.tokens = {}
+        self.routes = [
+            (method, re.compile(pattern), handler)
+            for method, pattern, handler in (
+                ("POST", r"/signup", self.signup),
+                ("POST", r"/login", self.login),
+                ("GET", r"/feed", self.feed),
+                ("GET", r"/explore", self.explore),
+                ("GET", r"/tags/trending", self.trending),
+                ("GET", r"/posts/search", self.search_posts),
+                ("GET", r"/rankings", self.rankings),
+                ("POST", r"/posts", self.create_post),
+                ("POST", r"/posts/(?P<post_id>[^/]+)/like", self.like),
+                ("GET", r"/users", self.search),
+                ("GET", r"/users/(?P<username>[^/]+)", self.profile),
+                ("GET", r"/users/(?P<username>[^/]+)/posts", self.user_posts),
+                ("POST", r"/users/(?P<username>[^/]+)/follow", self.follow),
+                ("DELETE", r"/users/(?P<username>[^/]+)/follow", self.unfollow),
+                ("GET", r"/images/(?P<digest>[0-9a-f]{64})", self.image),
+            )
+        ]
+
+    def call(self, fn, *args):
+        """Run fn on the store thread"""
+        import asyncio
+        return asyncio.get_running_loop().run_in_executor(self.store_thread, fn, *args)
+
+    async def serve(self, host=API_HOST, port=API_PORT):
+        import asyncio
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving the HabitHub API on http://{host}:{port}")
+        syncing = asyncio.create_task(self.sync_forever())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            syncing.cancel()
+            self.store_thread.submit(self.store.close).result()
+            self.store_thread.shutdown()
+            self.image_pool.shutdown()
+
+    async def sync_forever(self):
+        """Merge changes other instances (e.g. a Tk window) make to the same data"""
+        import asyncio
+        while True:
+            await asyncio.sleep(SYNC_INTERVAL_MS / 1000)
+            await self.call(self.store.sync)
+
+    # ----------- HTTP -------------
+
+    async def handle_connection(self, reader, writer):
+        """Answer requests on one connection until the client closes it"""
+        import asyncio
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                try:
+                    request_line, *header_lines = head.decode('latin-1').split("\r\n")
+                    method, target, version = request_line.split(" ", 2)
+                    headers = {}
+                    for line in header_lines:
+                        name, _, value = line.partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    self.respond(writer, 400, {'error': "Malformed request"}, keep_alive=False)
+                    break
+                if length > API_MAX_BODY:
+                    self.respond(writer, 400, {'error': "Request body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get('connection', '').lower() != "close"
+                status, payload = await self.dispatch(method, target, headers, body)
+                self.respond(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer, status, payload, keep_alive):
+        from http import HTTPStatus
+        if isinstance(payload, bytes):
+            content_type = "image/gif" if payload.startswith(b"GIF8") else f"image/{IMAGE_FORMAT.lower()}"
+            body = payload
+        else:
+            content_type = "application/json"
+            body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+        )
+
+    async def dispatch(self, method, target, headers, body):
+        """Route a request to its handler and turn the result or error into (status, payload)"""
+        import urllib.parse
+        url = urllib.parse.urlsplit(target)
+        request = {
+            'query': {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()},
+            'headers': headers,
+            'body': body
+        }
+        path_matched = False
+        try:
+            for route_method, pattern, handler in self.routes:
+                match = pattern.fullmatch(url.path)
+                if match is None:
+                    continue
+                path_matched = True
+                if route_method == method:
+                    params = {name: urllib.parse.unquote(value) for name, value in match.groupdict().items()}
+                    return await handler(request, **params)
+            raise ApiError(405, "Method not allowed") if path_matched else ApiError(404, "Not found")
+        except ApiError as e:
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            METRICS.count("api errors")
+            METRICS.gauge("api last error", f"{method} {target}: {e!r}")
+            return 500, {'error': "Internal server error"}
+
+    def json_body(self, request):
+        try:
+            data = json.loads(request['body'] or b"{}")
+        except ValueError:
+            raise ApiError(400, "Body is not valid JSON")
+        if not isinstance(data, dict):
+            raise ApiError(400, "Body must be a JSON object")
+        return data
+
+    def authenticate(self, request):
+        """Username behind the request's bearer token"""
+        scheme, _, token = request['headers'].get('authorization', '').partition(" ")
+        username = self.tokens.get(token) if scheme.lower() == "bearer" else None
+        if username is None:
+            raise ApiError(401, "Login required")
+        return username
+
+    def page_args(self, request):
+        """(cursor, limit) of a paginated request"""
+        try:
+            limit = int(request['query'].get('limit', FEED_PAGE_SIZE))
+        except ValueError:
+            raise ApiError(400, "limit must be a number")
+        cursor = request['query'].get('cursor') or None
+        if cursor is not None:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                raise ApiError(400, "Invalid cursor")
+        return cursor, max(1, min(limit, 100))
+
+    def offset_args(self, request, default_limit):
+        try:
+            offset = int(request['query'].get('offset', 0))
+            limit = int(request['query'].get('limit', default_limit))
+        except ValueError:
+            raise ApiError(400, "offset and limit must be numbers")
+        return max(0, offset), max(1, min(limit, 100))
+
+    def posts_page(self, page, cursor):
+        """Serialize a (page, cursor) result on the store thread, where like counts are read"""
+        return {'posts': [api_post(author, post, self.store.like_count(post['id'])) for author, post in page], 'cursor': cursor}
+
+    def require_user(self, username):
+        if not self.store.user_exists(username):
+            raise ApiError(404, f"No user named {username}")
+
+    # ----------- Accounts -------------
+
+    async def signup(self, request):
+        data = self.json_body(request)
+        username = str(data.get('username', '')).strip()
+        password = str(data.get('password', ''))
+        if not username or not password:
+            raise ApiError(400, "username and password are required")
+        if not await self.call(self.store.add_user, username, password, str(data.get('bio', '')).strip()):
+            raise ApiError(409, "Username already exists")
+        return 201, {'username': username}
+
+    async def login(self, request):
+        data = self.json_body(request)
+        username = str(data.get('username', '')).strip()
+        if not await self.call(self.store.check_password, username, str(data.get('password', ''))):
+            raise ApiError(401, "Invalid username or password")
+        token = os.urandom(16).hex()
+        self.tokens[token] = username
+        return 200, {'token': token, 'username': username}
+
+    async def profile(self, request, username):
+        def work():
+            self.require_user(username)
+            return self.store.get_user(username)
+        return 200, await self.call(work)
+
+    async def search(self, request):
+        offset, limit = self.offset_args(request, DISCOVER_PAGE_SIZE)
+        users, total = await self.call(self.store.search_users, request['query'].get('q', ""), offset, limit)
+        return 200, {'users': users, 'total': total}
+
+    async def follow(self, request, username):
+        follower = self.authenticate(request)
+        if follower == username:
+            raise ApiError(400, "You cannot follow yourself")
+        def work():
+            self.require_user(username)
+            self.store.follow(follower, username)
+        await self.call(work)
+        return 200, {'following': True}
+
+    async def unfollow(self, request, username):
+        follower = self.authenticate(request)
+        def work():
+            self.require_user(username)
+            self.store.unfollow(follower, username)
+        await self.call(work)
+        return 200, {'following': False}
+
+    # ----------- Posts -------------
+
+    async def feed(self, request):
+        username = self.authenticate(request)
+        cursor, limit = self.page_args(request)
+        return 200, await self.call(lambda: self.posts_page(*self.store.feed(username, cursor, limit)))
+
+    async def explore(self, request):
+        cursor, limit = self.page_args(request)
+        # Tags are stored with their "#", which clients may leave out since it needs escaping in URLs
+        tag = request['query'].get('tag', "").lstrip("#").lower()
+        tag = f"#{tag}" if tag else None
+        return 200, await self.call(lambda: self.posts_page(*self.store.explore(tag, cursor, limit)))
+
+    async def trending(self, request):
+        return 200, {'tags': await self.call(self.store.trending_tags)}
+
+    async def search_posts(self, request):
+        offset, limit = self.offset_args(request, FEED_PAGE_SIZE)
+        query = request['query'].get('q', "")
+        def work():
+            page, more = self.store.search_posts(query, offset, limit)
+            return {'posts': self.posts_page(page, None)['posts'], 'more': more}
+        return 200, await self.call(work)
+
+    async def user_posts(self, request, username):
+        def work():
+            self.require_user(username)
+            return self.posts_page([(username, post) for post in self.store.user_posts(username)], None)
+        return 200, await self.call(work)
+
+    async def create_post(self, request):
+        import asyncio
+        username = self.authenticate(request)
+        data = self.json_body(request)
+        content = str(data.get('content', '')).strip()
+        image_id = None
+        if data.get('image'):
+            def store_image():
+                image = base64.b64decode(data['image'], validate=True)
+                digest = self.images.put(image)
+                self.images.put_renditions(digest, image)
+                return digest
+            try:
+                image_id = await asyncio.get_running_loop().run_in_executor(self.image_pool, store_image)
+            except Exception:
+                raise ApiError(400, "image must be a base64 encoded picture")
+        if not content and image_id is None:
+            raise ApiError(400, "A post needs content or an image")
+        post = await self.call(self.store.add_post, username, content, image_id)
+        return 201, api_post(username, post, 0)
+
+    async def like(self, request, post_id):
+        username = self.authenticate(request)
+        def work():
+            try:
+                author, seq = post_seq(post_id)
+            except ValueError:
+                raise ApiError(404, "No such post")
+            # Post ids number each author's posts from 0
+            if not self.store.user_exists(author) or not 0 <= seq < self.store.get_user(author)['post_count']:
+                raise ApiError(404, "No such post")
+            liked = self.store.like(username, post_id)
+            return {'liked': liked, 'likes': self.store.like_count(post_id)}
+        return 200, await self.call(work)
+
+    async def rankings(self, request):
+        key = request['query'].get('key', 'posts')
+        window = request['query'].get('window', 'all')
+        if key not in RankingIndex.KEYS or window not in RankingIndex.WINDOWS:
+            raise ApiError(400, f"key must be one of {list(RankingIndex.KEYS)}, window one of {list(RankingIndex.WINDOWS)}")
+        if window == 'week' and key not in RankingIndex.WINDOWED_KEYS:
+            raise ApiError(400, f"{key} has no weekly ranking")
+        offset, limit = self.offset_args(request, RANKINGS_PAGE_SIZE)
+        entries, total = await self.call(self.store.rankings, key, window, offset, limit)
+        return 200, {
+            'entries': [{'rank': rank, 'username': username, 'score': score} for rank, username, score in entries],
+            'total': total
+        }
+
+    async def image(self, request, digest):
+        import asyncio
+        rendition = request['query'].get('rendition')
+        if rendition is not None and rendition not in RENDITIONS:
+            raise ApiError(400, f"rendition must be one of {list(RENDITIONS)}")
+        def read():
+            with self.images.open(digest, rendition) as blob:
+                return bytes(blob[:])
+        try:
+            return 200, await asyncio.get_running_loop().run_in_executor(self.image_pool, read)
+        except FileNotFoundError:
+            raise ApiError(404, "No such image")
+
+
+def serve_api(host=API_HOST, port=API_PORT):
+    """Run the API server over the configured store until interrupted"""
+    import asyncio
+    images = ImageStore(IMAGE_DIR)
+    server = ApiServer(open_store(images), images)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+# ----------- API load test -------------
+
+class ApiClient:
+    """Minimal keep-alive HTTP/JSON client for the load test"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+        self.token = None
+
+    async def connect(self):
+        import asyncio
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, data=None):
+        """Send one request and return (status, parsed JSON body)"""
+        body = json.dumps(data).encode() if data is not None else b""
+        auth = f"Authorization: Bearer {self.token}\r\n" if self.token else ""
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n{auth}"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+        )
+        await self.writer.drain()
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode('latin-1').split("\r\n")
+        length = 0
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        payload = await self.reader.readexactly(length)
+        return int(status_line.split(" ", 2)[1]), json.loads(payload) if payload else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+# Share of load test requests per operation
+LOADTEST_MIX = {'feed': 40, 'explore': 20, 'rankings': 15, 'like': 10, 'post': 5, 'follow': 5, 'search': 5}
+
+
+async def load_test(host=API_HOST, port=API_PORT, clients=50, duration=10.0, seed=0):
+    """Run clients simulated users against a running API server and report latencies
+
+    Every client signs up its own account, logs in and then keeps sending a LOADTEST_MIX
+    of requests over one keep-alive connection until duration seconds are up.
+    """
+    import asyncio
+    import random
+    import urllib.parse
+    timer = BenchTimer()
+    errors = {}
+    run = os.urandom(3).hex()
+    names = [f"load{run}_{n}" for n in range(clients)]
+    operations, weights = zip(*LOADTEST_MIX.items())
+    weights = list(accumulate(weights))
+    deadline = time.perf_counter() + duration
+    
+    async def timed(client, operation, method, path, data=None):
+        started = time.perf_counter()
+        status, payload = await client.request(method, path, data)
+        timer.add(operation, time.perf_counter() - started)
+        if status >= 400:
+            errors[operation] = errors.get(operation, 0) + 1
+        return payload
+    
+    async def simulate(n):
+        rng = random.Random(seed * 100003 + n)
+        client = ApiClient(host, port)
+        await client.connect()
+        try:
+            await timed(client, "signup", "POST", "/signup", {'username': names[n], 'password': "password", 'bio': "load test"})
+            client.token = (await timed(client, "login", "POST", "/login", {'username': names[n], 'password': "password"}))['token']
+            seen = []
+            while time.perf_counter() < deadline:
+                operation = rng.choices(operations, cum_weights=weights)[0]
+                if operation == 'feed':
+                    payload = await timed(client, operation, "GET", f"/feed?limit={FEED_PAGE_SIZE}")
+                    seen = [post['id'] for post in payload['posts']] or seen
+                elif operation == 'explore':
+                    tag = rng.choice(["", "fitness", "reading", "running"])
+                    payload = await timed(client, operation, "GET", f"/explore?tag={tag}")
+                    seen = [post['id'] for post in payload['posts']] or seen
+                elif operation == 'rankings':
+                    key = rng.choice(list(RankingIndex.WINDOWED_KEYS))
+                    await timed(client, operation, "GET", f"/rankings?key={key}&window={rng.choice(list(RankingIndex.WINDOWS))}")
+                elif operation == 'like' and seen:
+                    await timed(client, operation, "POST", f"/posts/{urllib.parse.quote(rng.choice(seen))}/like")
+                elif operation == 'post':
+                    await timed(client, operation, "POST", "/posts", {'content': f"load test #{rng.choice(BENCH_TAGS)}"})
+                elif operation == 'follow':
+                    target = rng.choice(names)
+                    if target != names[n]:
+                        await timed(client, operation, "POST", f"/users/{target}/follow")
+                elif operation == 'search':
+                    await timed(client, operation, "GET", f"/users?q={names[n][:rng.randint(1, 6)]}")
+        finally:
+            client.close()
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate(n) for n in range(clients)))
+    elapsed = time.perf_counter() - started
+    samples = [sample for operation_samples in timer.samples.values() for sample in operation_samples]
+    overall = latency_summary(samples)
+    return {
+        'clients': clients,
+        'duration_s': round(elapsed, 3),
+        'requests': len(samples),
+        'requests_per_s': round(len(samples) / elapsed, 1),
+        'p50_ms': overall['p50_ms'],
+        'p99_ms': overall['p99_ms'],
+        'errors': errors,
+        'operations': timer.report()
+    }
+
 
 if __name__ == "__main__":
+    import argparse
+    import asyncio
+    parser = argparse.ArgumentParser(description="HabitHub - Social Media App")
+    parser.add_argument("--migrate-sqlite", action="store_true", help=f"copy the JSON backend's data into {SQLITE_FILE} and exit")
+    parser.add_argument("--migrate-images", action="store_true", help="make renditions for every stored image and exit")
+    parser.add_argument("--workers", type=int, default=None, help="processes used by --migrate-images")
+    parser.add_argument("--bench", action="store_true", help="time the data layer on a synthetic dataset and print a JSON report")
+    parser.add_argument("--generate", metavar="DIR", help="write a synthetic dataset into DIR and exit")
+    parser.add_argument("--users", type=int, default=1000, help="users in the synthetic dataset")
+    parser.add_argument("--images", type=int, default=0, help="posts given an image in the synthetic dataset")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic dataset")
+    parser.add_argument("--backend", choices=("json", "shards", "sqlite"), help="storage backend to benchmark")
+    parser.add_argument("--bench-suggestions", action="store_true", help="time the who-to-follow batch on a synthetic graph of --users users and print a JSON report")
+    parser.add_argument("--no-widgets", action="store_true", help="skip the widget timings of --bench")
+    parser.add_argument("--output", help="file the --bench report is written to instead of stdout")
+    parser.add_argument("--metrics", action="store_true", help=f"record timings and counters (F12 shows them, {METRICS_FILE} logs them)")
+    parser.add_argument("--profile", action="store_true", help=f"like --metrics, and run the first instrumented action under cProfile into {PROFILE_FILE}")
+    parser.add_argument("--serve", action="store_true", help="run the HTTP/JSON API server instead of the window")
+    parser.add_argument("--loadtest", action="store_true", help="load test a running API server and print a JSON report")
+    parser.add_argument("--host", default=API_HOST, help="address of the API server")
+    parser.add_argument("--port", type=int, default=API_PORT, help="port of the API server")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent simulated users of --loadtest")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds --loadtest runs for")
+    args = parser.parse_args()
+    
+    if args.metrics or args.profile:
+        METRICS.enabled = True
+        METRICS.profile_armed = args.profile
+    
+    if args.generate:
+        print(json.dumps(generate_dataset(args.generate, users=args.users, images=args.images, seed=args.seed)))
+        raise SystemExit
+    
+    if args.bench or args.bench_suggestions:
+        if args.bench_suggestions:
+            if not load_scipy():
+                raise SystemExit("--bench-suggestions needs numpy and scipy")
+            report = run_suggestions_benchmark(args.users, args.seed)
+        else:
+            report = run_benchmark(args.users, args.images, args.seed, args.backend, widgets=not args.no_widgets)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+        raise SystemExit
+    
+    if args.migrate_images:
+        done, failed = migrate_image_renditions(ImageStore(IMAGE_DIR), args.workers)
+        print(f"Made renditions for {len(done)} images, {len(failed)} failed")
+        raise SystemExit(1 if failed else 0)
+    
+    if args.migrate_sqlite:
+        migrate_json_to_sqlite(ImageStore(IMAGE_DIR)).close()
+        print(f"Migrated {json_backend_file()} to {SQLITE_FILE}")
+        raise SystemExit
+    
+    if args.serve:
+        serve_api(args.host, args.port)
+        raise SystemExit
+    
+    if args.loadtest:
+        report = asyncio.run(load_test(args.host, args.port, args.clients, args.duration, args.seed))
+        print(json.dumps(report, indent=2))
+        raise SystemExit
+    
+    STARTUP.lap("imports")
     root = tk.Tk()
     app = SocialMediaApp(root)
     root.mainloop()
\ No newline at end of file
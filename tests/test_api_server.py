@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import HabitHub
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def send(request):
+    """Feeds one raw request through handle_connection and returns the raw response"""
+    server = HabitHub.ApiServer(None, None)
+
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(request)
+        reader.feed_eof()
+        writer = FakeWriter()
+        await server.handle_connection(reader, writer)
+        assert writer.closed
+        return writer.data
+
+    try:
+        return asyncio.run(run())
+    finally:
+        server.store_thread.shutdown()
+        server.image_pool.shutdown()
+
+
+@pytest.mark.parametrize("length", ["-1", "abc", str(HabitHub.API_MAX_BODY + 1)])
+def test_bad_content_length_is_rejected(length):
+    response = send(f"POST /login HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}".encode())
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in response
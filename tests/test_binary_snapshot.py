@@ -0,0 +1,40 @@
+import pytest
+
+from HabitHub import encode_snapshot, read_binary_snapshot, read_snapshot, write_atomic
+
+
+def sample_users():
+    return {
+        "ann": {'password': "x", 'bio': "hi", 'posts': [{'id': "ann:1", 'content': "second ✓"}, {'id': "ann:0", 'content': "first"}]},
+        "bob": {'password': "y", 'bio': "", 'posts': []},
+    }
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "data.snap")
+    write_atomic(path, encode_snapshot(sample_users()))
+    assert read_snapshot(path) == sample_users()
+
+
+def test_lazy_bodies_are_read_on_demand(tmp_path):
+    path = str(tmp_path / "data.snap")
+    write_atomic(path, encode_snapshot(sample_users()))
+    users, bodies = read_binary_snapshot(path, lazy=True)
+    posts = users["ann"]['posts']
+    assert all('content' not in post for post in posts)
+    # A snapshot written over the file does not move the bodies already referenced
+    write_atomic(path, encode_snapshot({"cat": {'posts': [{'id': "cat:0", 'content': "other text entirely"}]}}))
+    bodies.fill(posts[0])
+    assert posts[0]['content'] == "second ✓" and '_body' not in posts[0]
+    # Re-encoding takes the bodies still unread from the old file
+    rewritten = str(tmp_path / "again.snap")
+    write_atomic(rewritten, encode_snapshot(users, bodies))
+    bodies.close()
+    assert read_snapshot(rewritten) == sample_users()
+
+
+def test_truncated_file_is_refused(tmp_path):
+    path = str(tmp_path / "data.snap")
+    write_atomic(path, encode_snapshot(sample_users())[:-3])
+    with pytest.raises(ValueError):
+        read_snapshot(path)
@@ -0,0 +1,98 @@
+import math
+import random
+
+import pytest
+
+pytest.importorskip("scipy")
+
+import HabitHub
+from HabitHub import FollowSuggestions
+
+HabitHub.load_scipy()
+
+
+def make_graph(seed, n=300, tags=12):
+    rnd = random.Random(seed)
+    names = [f"user{i}" for i in range(n)]
+    follows = [(a, b) for a in names for b in set(rnd.choices(names, k=rnd.randrange(0, 10))) if a != b]
+    tag_names = [f"#tag{i}" for i in range(tags)]
+    uses = [(a, tag, rnd.randrange(1, 9)) for a in names for tag in set(rnd.choices(tag_names, k=rnd.randrange(0, 4)))]
+    return names, follows, uses
+
+
+class BruteForce:
+    """The scores FollowSuggestions ranks by, from plain sets and dicts"""
+
+    def __init__(self, names, follows, uses):
+        self.names = names
+        self.follows = {name: set() for name in names}
+        for a, b in follows:
+            self.follows[a].add(b)
+        self.vectors = {name: {} for name in names}
+        for name, tag, count in uses:
+            self.vectors[name][tag] = math.log1p(count)
+        for vector in self.vectors.values():
+            norm = math.sqrt(sum(v * v for v in vector.values())) or 1
+            for tag in vector:
+                vector[tag] /= norm
+        self.tag_authors = {}
+        for tag in {tag for _, tag, _ in uses}:
+            heaviest = sorted((-count, name) for name, t, count in uses if t == tag)[:HabitHub.SUGGEST_TAG_AUTHORS]
+            self.tag_authors[tag] = {name for _, name in heaviest}
+
+    def score(self, user, candidate):
+        mutual = sum(candidate in self.follows[friend] for friend in self.follows[user])
+        back = user in self.follows[candidate]
+        similarity = sum(self.vectors[user].get(tag, 0) * v for tag, v in self.vectors[candidate].items())
+        return (HabitHub.SUGGEST_MUTUAL_WEIGHT * mutual + HabitHub.SUGGEST_FOLLOWS_YOU_WEIGHT * back
+                + HabitHub.SUGGEST_TAG_WEIGHT * similarity)
+
+    def best(self, user):
+        candidates = set().union(*(self.follows[friend] for friend in self.follows[user]))
+        candidates |= {name for name in self.names if user in self.follows[name]}
+        for tag in self.vectors[user]:
+            candidates |= self.tag_authors[tag]
+        candidates -= self.follows[user] | {user}
+        return sorted((self.score(user, c) for c in candidates), reverse=True)[:HabitHub.SUGGESTIONS]
+
+
+def assert_matches(suggestions, brute):
+    for user in brute.names:
+        found = [brute.score(user, name) for name, _, _, _ in suggestions.suggestions(user)]
+        # Ties may be broken either way, so compare the scores rather than the names
+        assert found == pytest.approx(brute.best(user), abs=1e-4), user
+        for name, mutual, follows_you, _ in suggestions.suggestions(user):
+            assert name not in brute.follows[user] and name != user
+            assert mutual == sum(name in brute.follows[friend] for friend in brute.follows[user])
+            assert follows_you == (user in brute.follows[name])
+
+
+def test_matches_brute_force():
+    names, follows, uses = make_graph(seed=1)
+    assert_matches(FollowSuggestions.build(names, follows, uses), BruteForce(names, follows, uses))
+
+
+def test_follows_and_unfollows_patch_the_matrices():
+    names, follows, uses = make_graph(seed=2)
+    suggestions = FollowSuggestions.build(names, follows, uses)
+    user = names[5]
+    target = suggestions.suggestions(user)[0][0]
+    follows.append((user, target))
+    suggestions.on_change({'op': 'follow', 'user': user, 'target': target})
+    assert target not in [name for name, _, _, _ in suggestions.suggestions(user)]
+    assert_matches(suggestions, BruteForce(names, follows, uses))
+    follows.remove((user, target))
+    suggestions.on_change({'op': 'unfollow', 'user': user, 'target': target})
+    assert_matches(suggestions, BruteForce(names, follows, uses))
+
+
+def test_reasons():
+    follows = [("ann", "bob"), ("bob", "cat"), ("dan", "ann")]
+    uses = [("ann", "#running", 3), ("eve", "#running", 5), ("eve", "#reading", 1)]
+    suggestions = FollowSuggestions.build(["ann", "bob", "cat", "dan", "eve"], follows, uses)
+    assert sorted(suggestions.suggestions("ann")) == [
+        ("cat", 1, False, None),
+        ("dan", 0, True, None),
+        ("eve", 0, False, "#running"),
+    ]
+    assert suggestions.suggestions("nobody") == []
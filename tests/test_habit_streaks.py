@@ -0,0 +1,106 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import HabitHub
+from HabitHub import HabitStreaks
+
+HabitHub.load_numpy()
+
+
+def stamp(day):
+    return f"{day.isoformat()} 12:00"
+
+
+def runs(days):
+    """(current streak, best streak) of a set of dates, as plain loops"""
+    today = date.today()
+    longest = run = 0
+    previous = None
+    for day in sorted(days):
+        run = run + 1 if previous == day - timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    current = 0
+    day = today if today in days else today - timedelta(days=1)
+    while day in days:
+        current += 1
+        day -= timedelta(days=1)
+    return current, longest
+
+
+def weekly(days):
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+    weeks = [monday - timedelta(weeks=HabitHub.STREAK_WEEKS - 1 - i) for i in range(HabitHub.STREAK_WEEKS)]
+    return [sum(start <= day < start + timedelta(days=7) and day <= today for day in days) for start in weeks]
+
+
+def make_posts(seed, users=60):
+    rnd = random.Random(seed)
+    today = date.today()
+    posts = []
+    for i in range(users):
+        # Some users post nearly every day, some rarely
+        chance = rnd.random()
+        for back in range(200):
+            if rnd.random() < chance:
+                tags = rnd.sample(["#run", "#read", "#swim"], rnd.randrange(0, 3))
+                posts.append((f"user{i}", stamp(today - timedelta(days=back)), tags))
+    rnd.shuffle(posts)
+    return posts
+
+
+def series_days(posts):
+    days = {}
+    for author, timestamp, tags in posts:
+        day = date.fromisoformat(timestamp[:10])
+        for tag in [None] + tags:
+            days.setdefault((author, tag), set()).add(day)
+    return days
+
+
+def test_profiles_match_brute_force():
+    posts = make_posts(seed=1)
+    streaks = HabitStreaks(posts)
+    days = series_days(posts)
+    for user in {author for author, _, _ in posts}:
+        for tag, current, longest, weeks in streaks.profile(user):
+            assert (current, longest) == runs(days[(user, tag)]), (user, tag)
+            assert weeks == weekly(days[(user, tag)])
+
+
+def test_rankings_order_current_streaks():
+    posts = make_posts(seed=2)
+    streaks = HabitStreaks(posts)
+    days = series_days(posts)
+    for tag in (None, "#run"):
+        current = {user: runs(d)[0] for (user, t), d in days.items() if t == tag}
+        expected = sorted((-streak, user) for user, streak in current.items() if streak > 0)
+        page, total = streaks.rankings(tag, 0, 1000)
+        assert total == len(expected)
+        assert [(user, streak) for _, user, streak in page] == [(user, -negative) for negative, user in expected]
+
+
+def test_new_posts_extend_streaks():
+    today = date.today()
+    posts = [("ann", stamp(today - timedelta(days=back)), ["#run"]) for back in (1, 2, 3)]
+    posts.append(("bob", stamp(today - timedelta(days=1)), []))
+    streaks = HabitStreaks(posts)
+    assert streaks.rank("ann", "#run") == 1
+    assert streaks.rankings(None)[0] == [(1, "ann", 3), (2, "bob", 1)]
+    streaks.on_change({'op': 'post', 'user': "bob", 'post': {'timestamp': stamp(today), 'tags': ["#run"]}})
+    streaks.on_change({'op': 'post', 'user': "cat", 'post': {'timestamp': stamp(today), 'tags': []}})
+    assert streaks.rankings(None)[0] == [(1, "ann", 3), (2, "bob", 2), (3, "cat", 1)]
+    assert streaks.rankings("#run")[0] == [(1, "ann", 3), (2, "bob", 1)]
+    assert streaks.tags() == ["#run"]
+
+
+def test_bad_timestamps_are_skipped():
+    today = date.today()
+    streaks = HabitStreaks([("ann", "not a date", []), ("ann", stamp(today), [])])
+    assert streaks.profile("ann")[0][:3] == (None, 1, 1)
+    assert HabitStreaks([]).rankings(None) == ([], 0)
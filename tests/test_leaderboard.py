@@ -0,0 +1,62 @@
+import random
+
+from HabitHub import Leaderboard
+
+
+def expected_page(scores, offset, limit):
+    ranked = sorted(((-score, name) for name, score in scores.items() if score > 0))
+    return [(rank, name, -negative) for rank, (negative, name) in enumerate(ranked, 1)][offset:offset + limit]
+
+
+def test_matches_sorting_through_random_updates():
+    rnd = random.Random(7)
+    board = Leaderboard()
+    scores = {}
+    for _ in range(2000):
+        name = f"user{rnd.randrange(200)}"
+        # Scores past the initial capacity make the tree grow
+        if rnd.random() < 0.5:
+            scores[name] = rnd.randrange(0, 100)
+            board.set(name, scores[name])
+        else:
+            scores[name] = max(scores.get(name, 0) + rnd.randrange(-3, 4), 0)
+            board.add(name, scores[name] - board.score(name))
+    expected = expected_page(scores, 0, len(scores))
+    assert board.total == len(expected)
+    for offset, limit in ((0, 10), (5, 20), (len(expected) - 3, 10), (len(expected), 5)):
+        assert board.page(offset, limit) == expected[offset:offset + limit]
+    for rank, name, _ in expected:
+        assert board.rank(name) == rank
+
+
+def test_unranked_users():
+    board = Leaderboard()
+    board.set("ann", 3)
+    board.set("ann", 0)
+    assert board.rank("ann") is None
+    assert board.rank("bob") is None
+    assert board.total == 0
+    assert board.page() == []
+
+
+def test_ties_rank_by_username():
+    board = Leaderboard()
+    for name in ("cat", "ann", "bob"):
+        board.set(name, 5)
+    board.set("dan", 9)
+    assert board.page() == [(1, "dan", 9), (2, "ann", 5), (3, "bob", 5), (4, "cat", 5)]
+    assert board.rank("cat") == 4
+
+
+def test_from_scores_matches_incremental_sets():
+    rnd = random.Random(3)
+    scores = {f"user{i}": rnd.randrange(-2, 500) for i in range(300)}
+    built = Leaderboard.from_scores(scores)
+    board = Leaderboard()
+    for name, score in scores.items():
+        board.set(name, max(score, 0))
+    assert built.total == board.total
+    assert built.page(0, 400) == board.page(0, 400)
+    # A board built in one pass keeps taking updates
+    built.set("user0", 1000)
+    assert built.rank("user0") == 1
@@ -0,0 +1,91 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from HabitHub import PostSearchIndex, post_tokens
+
+WORDS = ["run", "read", "swim", "walk", "code", "sleep", "yoga", "cook"]
+
+
+def make_posts(count, seed):
+    """{author: [(seq, content, timestamp)]} with random words and times"""
+    rnd = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    posts = {}
+    for i in range(count):
+        author = f"user{rnd.randrange(40)}"
+        timestamp = (start + timedelta(minutes=rnd.randrange(400000))).strftime("%Y-%m-%d %H:%M")
+        content = " ".join(rnd.choice(WORDS) for _ in range(rnd.randrange(1, 8)))
+        posts.setdefault(author, []).append((len(posts.get(author, [])), content, timestamp))
+    return posts
+
+
+def build(posts):
+    index = PostSearchIndex()
+    index.catch_up({author: len(p) for author, p in posts.items()}, lambda author, start: posts[author][start:])
+    index.build_heads()
+    return index
+
+
+def brute_force(index, query, k):
+    n = len(index)
+    scores = {}
+    for token in dict.fromkeys(post_tokens(query)):
+        if token not in index.terms:
+            continue
+        ids, tfs = index.terms[token]
+        idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+        for doc, tf in zip(ids, tfs):
+            scores[doc] = scores.get(doc, 0.0) + idf * index.impact(doc, tf)
+    return sorted(scores.values(), reverse=True)[:k]
+
+
+def assert_matches(index, query, k=20):
+    found = [score for _, _, score in index.search(query, k)]
+    assert found == pytest.approx(brute_force(index, query, k), rel=1e-9)
+
+
+@pytest.mark.parametrize("query", ["run", "read swim", "yoga cook code", "missing", "run missing"])
+def test_search_matches_brute_force(query):
+    index = build(make_posts(4000, seed=1))
+    assert_matches(index, query)
+
+
+def test_heads_stay_capped_as_posts_arrive():
+    index = build(make_posts(3000, seed=2))
+    more = make_posts(3000, seed=3)
+    for author, posts in more.items():
+        start = index.indexed.get(author, 0)
+        for seq, content, timestamp in posts:
+            index.on_change({'post': {'id': f"{author}:{start + seq}", 'content': content, 'timestamp': timestamp}})
+    assert all(len(head) <= PostSearchIndex.HEAD for head in index.heads.values())
+    for query in ("run", "read swim", "sleep walk"):
+        assert_matches(index, query)
+
+
+def test_results_point_at_posts():
+    posts = {"ann": [(0, "slow morning run", "2026-03-01 08:00")], "bob": [(0, "read then run", "2026-03-02 08:00")]}
+    index = build(posts)
+    assert [(author, post_id) for author, post_id, _ in index.search("run")] == [("bob", "bob:0"), ("ann", "ann:0")]
+    assert index.search("swim") == []
+
+
+def test_save_load_and_catch_up(tmp_path):
+    posts = make_posts(2000, seed=4)
+    index = build(posts)
+    index.search("run")
+    path = str(tmp_path / "posts.search")
+    index.save(path)
+    posts["late"] = [(0, "run run run", "2026-12-01 10:00")]
+    loaded = PostSearchIndex.load(path)
+    counts = {author: len(p) for author, p in posts.items()}
+    assert loaded.catch_up(counts, lambda author, start: posts[author][start:])
+    assert loaded.search("run", 1)[0][1] == "late:0"
+    for query in ("run", "code yoga"):
+        assert_matches(loaded, query)
+    # An index that knows posts the data lost has to be rebuilt
+    loaded.save(path)
+    counts["late"] = 0
+    assert not PostSearchIndex.load(path).catch_up(counts, lambda author, start: [])
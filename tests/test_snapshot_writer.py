@@ -0,0 +1,33 @@
+import pytest
+
+from HabitHub import SnapshotWriter
+
+
+def test_writes_requested_files(tmp_path):
+    path = str(tmp_path / "out" / "data.json")
+    writer = SnapshotWriter(lambda: [(path, "{}")], delay=0)
+    writer.request()
+    writer.flush()
+    with open(path) as f:
+        assert f.read() == "{}"
+    writer.close()
+
+
+def test_failed_encode_is_raised_by_flush_and_writer_keeps_going(tmp_path):
+    path = str(tmp_path / "data.json")
+    outcomes = [TypeError("boom"), "second"]
+
+    def encode():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return [(path, outcome)]
+
+    writer = SnapshotWriter(encode, delay=0)
+    writer.request()
+    with pytest.raises(TypeError):
+        writer.flush()
+    writer.request()
+    writer.close()
+    with open(path) as f:
+        assert f.read() == "second"
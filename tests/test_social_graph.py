@@ -0,0 +1,34 @@
+from HabitHub import SocialGraph
+
+
+def sample_users():
+    return {
+        "a": {'following': ["c"], 'followers': [], 'posts': [{'id': "a:0", 'likes': ["z", "b"]}]},
+        "b": {'following': ["c"], 'followers': [], 'posts': []},
+        "c": {'following': [], 'followers': ["z", "a", "b"], 'posts': []},
+        "z": {'following': ["c"], 'followers': [], 'posts': []},
+    }
+
+
+def test_export_keeps_list_order():
+    users = sample_users()
+    graph = SocialGraph()
+    graph.build(users)
+    assert graph.followers_of("c") == ["z", "a", "b"]
+    graph.export(users)
+    assert users == sample_users()
+
+
+def test_membership_and_counts():
+    graph = SocialGraph()
+    graph.build(sample_users())
+    assert graph.is_following("a", "c") and not graph.is_following("c", "a")
+    assert not graph.is_following("nobody", "c")
+    graph.unfollow("a", "c")
+    graph.follow("c", "a")
+    graph.follow("c", "a")
+    assert graph.follower_count("c") == 2 and graph.following_count("c") == 1
+    graph.like("a:0", "b")
+    graph.like("a:0", "c")
+    assert graph.like_count("a:0") == 3
+    assert graph.has_liked("a:0", "c") and not graph.has_liked("a:0", "a")
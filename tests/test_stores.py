@@ -0,0 +1,167 @@
+import pytest
+
+import HabitHub
+
+
+def open_json(path):
+    images = HabitHub.ImageStore(str(path / "images"))
+    return HabitHub.JsonStore(images, str(path / "data.snap"), str(path / "data.log"))
+
+
+def open_sqlite(path):
+    return HabitHub.SqliteStore(str(path / "data.db"))
+
+
+def open_shards(path):
+    return HabitHub.ShardStore(str(path / "shards"))
+
+
+@pytest.fixture(params=[open_json, open_sqlite, open_shards], ids=["json", "sqlite", "shards"])
+def reopen(request, tmp_path, monkeypatch):
+    """Opens the backend on the same files each time it is called"""
+    monkeypatch.chdir(tmp_path)
+    stores = []
+
+    def open_store():
+        stores.append(request.param(tmp_path))
+        return stores[-1]
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+def populate(store):
+    for name in ("ann", "bob", "cat"):
+        assert store.add_user(name, "secret", f"{name} likes #running")
+    store.follow("ann", "bob")
+    store.follow("cat", "bob")
+    first = store.add_post("bob", "morning run #running")
+    second = store.add_post("bob", "evening swim #swimming")
+    store.add_post("cat", "read twenty pages #reading")
+    store.like("ann", first['id'])
+    store.like("cat", first['id'])
+    return first, second
+
+
+def test_users_and_follows(reopen):
+    store = reopen()
+    populate(store)
+    assert not store.add_user("ann", "other", "")
+    assert store.user_exists("ann") and not store.user_exists("dan")
+    assert store.check_password("ann", "secret") and not store.check_password("ann", "wrong")
+    assert sorted(store.followers("bob")) == ["ann", "cat"]
+    assert store.following("ann") == ["bob"]
+    assert store.is_following("ann", "bob") and not store.is_following("bob", "ann")
+    store.unfollow("cat", "bob")
+    assert store.get_user("bob")['follower_count'] == 1
+    assert store.get_user("cat")['following_count'] == 0
+
+
+def test_posts_likes_and_feeds(reopen):
+    store = reopen()
+    first, second = populate(store)
+    assert [post['id'] for post in store.user_posts("bob")] == [second['id'], first['id']]
+    assert store.like_count(first['id']) == 2
+    assert store.has_liked("ann", first['id']) and not store.has_liked("bob", first['id'])
+    assert store.like("ann", first['id']) is False
+    assert store.like_count(first['id']) == 2
+    feed, _ = store.feed("ann")
+    assert {author for author, _ in feed} == {"bob"}
+    explore, _ = store.explore("#running")
+    assert [post['id'] for _, post in explore] == [first['id']]
+    assert set(store.trending_tags()) == {"#running", "#swimming", "#reading"}
+
+
+def test_rankings(reopen):
+    store = reopen()
+    populate(store)
+    entries, total = store.rankings('posts')
+    assert total == 2
+    assert entries == [(1, "bob", 2), (2, "cat", 1)]
+    assert store.rank("cat", 'posts') == 2
+    assert store.rankings('likes')[0] == [(1, "bob", 2)]
+    assert store.rank("ann", 'likes') is None
+
+
+def test_search(reopen):
+    store = reopen()
+    first, _ = populate(store)
+    page, more = store.search_posts("run")
+    assert [post['id'] for _, post in page] == [first['id']]
+    assert not more
+    assert [name for name in store.search_users("b")[0]] == ["bob"]
+
+
+def test_follow_notifies_only_on_change(reopen):
+    store = reopen()
+    populate(store)
+    seen = []
+    store.notifier.subscribe('follows', seen.append)
+    store.follow("ann", "bob")
+    store.unfollow("bob", "cat")
+    store.follow("bob", "cat")
+    assert [(change['op'], change['user'], change['target']) for change in seen] == [("follow", "bob", "cat")]
+
+
+def test_data_survives_reopening(reopen):
+    store = reopen()
+    first, second = populate(store)
+    store.unfollow("cat", "bob")
+    store.close()
+    store = reopen()
+    assert store.following("ann") == ["bob"]
+    assert store.followers("bob") == ["ann"]
+    assert [post['id'] for post in store.user_posts("bob")] == [second['id'], first['id']]
+    assert store.like_count(first['id']) == 2
+    assert store.has_liked("cat", first['id'])
+    # New posts continue the author's numbering
+    assert store.add_post("bob", "again")['id'] == "bob:2"
+
+
+def test_shards_from_a_failed_save_are_written_by_the_next(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = open_shards(tmp_path)
+    store.add_user("ann", "secret", "")
+    store.flush()
+    write_atomic = HabitHub.write_atomic
+
+    def failing(path, data):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(HabitHub, "write_atomic", failing)
+    store.add_post("ann", "lost?")
+    with pytest.raises(OSError):
+        store.flush()
+    monkeypatch.setattr(HabitHub, "write_atomic", write_atomic)
+    store.save_data()
+    store.close()
+    store = open_shards(tmp_path)
+    assert [post['content'] for post in store.user_posts("ann")] == ["lost?"]
+    assert store.get_user("ann")['post_count'] == 1
+    store.close()
+
+
+def test_json_search_skips_posts_gone_since_indexing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = open_json(tmp_path)
+    store.add_user("ann", "secret", "")
+    kept = store.add_post("ann", "run one")
+    store.add_post("ann", "run two")
+    assert len(store.search_posts("run")[0]) == 2
+    # As after a reload onto data that lost the newer post
+    del store.users["ann"]['posts'][0]
+    assert [post['id'] for _, post in store.search_posts("run")[0]] == [kept['id']]
+    store.close()
+
+
+def test_shards_refuse_a_second_instance(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = open_shards(tmp_path)
+    store.add_user("ann", "secret", "")
+    with pytest.raises(ValueError):
+        open_shards(tmp_path)
+    store.close()
+    store = open_shards(tmp_path)
+    assert store.user_exists("ann")
+    store.close()
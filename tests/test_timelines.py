@@ -0,0 +1,171 @@
+import random
+
+from HabitHub import SocialGraph, TagIndex, TimelineStore, decode_cursor, encode_cursor, merge_timeline, post_key
+
+TAGS = ["run", "swim", "read", "lift"]
+
+
+def random_users(seed, authors=6, posts=120):
+    """Users whose posts are newest first, with many posts sharing a minute"""
+    rnd = random.Random(seed)
+    users = {f"user{i}": {'posts': []} for i in range(authors)}
+    for seq in range(posts):
+        author = f"user{rnd.randrange(authors)}"
+        own = users[author]['posts']
+        own.insert(0, {
+            'id': f"{author}:{len(own)}",
+            'timestamp': f"2024-05-01 10:{seq // 7:02d}",
+            'tags': rnd.sample(TAGS, rnd.randrange(3))
+        })
+    return users
+
+
+def newest_first(users, authors, tag=None):
+    entries = [
+        (post_key(author, post), author, post)
+        for author in authors for post in users.get(author, {}).get('posts', [])
+        if tag is None or tag in post['tags']
+    ]
+    return [(author, post) for _, author, post in sorted(entries, key=lambda e: e[0], reverse=True)]
+
+
+def read_all(fetch, limit):
+    """Follow next cursors from the first page to the end"""
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = fetch(cursor, limit)
+        pages.append(page)
+        if cursor is None:
+            return pages
+        assert len(pages) < 1000
+
+
+def flatten(pages):
+    return [entry for page in pages for entry in page]
+
+
+def test_cursor_round_trip():
+    for key in [("2024-05-01 10:00", "ann", 3), ("", "zé中/+=", 0), ("2024-05-01 10:00", "a b", 12345)]:
+        cursor = encode_cursor(key)
+        assert cursor.isascii() and "/" not in cursor and "+" not in cursor
+        assert decode_cursor(cursor) == key
+
+
+def test_merge_timeline_pages_match_sorting():
+    users = random_users(1)
+    for authors in (list(users), ["user0", "user3"], ["user1", "nobody"], []):
+        expected = newest_first(users, authors)
+        for limit in (1, 7, 20, len(expected) + 1):
+            pages = read_all(lambda cursor, limit: merge_timeline(users, authors, cursor, limit), limit)
+            assert flatten(pages) == expected
+            assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_tag_index_pages_match_sorting():
+    users = random_users(2)
+    index = TagIndex()
+    index.build(users)
+    for tag in TAGS + [None, "missing"]:
+        expected = newest_first(users, users, tag)
+        assert index.posts(tag)[0] == expected
+        if tag is not None:
+            assert index.count(tag) == len(expected)
+        for limit in (1, 9, 50):
+            pages = read_all(lambda cursor, limit: index.posts(tag, cursor, limit), limit)
+            assert flatten(pages) == expected
+            assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_tag_index_add_keeps_order_and_cursors():
+    users = random_users(3)
+    index = TagIndex()
+    index.build(users)
+    first, cursor = index.posts("run", None, 5)
+    post = {'id': "user0:999", 'timestamp': "2024-05-01 11:00", 'tags': ["RUN", "run"]}
+    users["user0"]['posts'].insert(0, post)
+    index.add("user0", post)
+    # A cursor handed out before the post arrived still continues where it left off
+    rest = flatten(read_all(lambda c, limit: index.posts("run", c or cursor, limit), 5))
+    expected = newest_first(users, users, "run")
+    assert expected[0] == ("user0", post)
+    assert first + rest == expected[1:]
+    assert index.posts("Run", None, 1)[0] == [("user0", post)]
+
+
+class Timelines:
+    """A TimelineStore fed the same changes a store would publish"""
+
+    def __init__(self, users, limit):
+        self.users = users
+        self.graph = SocialGraph()
+        self.graph.build(users)
+        self.store = TimelineStore(users, self.graph, limit)
+        self.minute = 0
+
+    def post(self, author):
+        own = self.users[author]['posts']
+        self.minute += 1
+        post = {'id': f"{author}:{len(own)}", 'timestamp': f"2024-05-02 {self.minute // 60:02d}:{self.minute % 60:02d}", 'tags': []}
+        own.insert(0, post)
+        self.store.on_change({'op': 'post', 'user': author, 'post': post})
+
+    def follow(self, username, target):
+        self.graph.follow(username, target)
+        self.store.on_change({'op': 'follow', 'user': username, 'target': target})
+
+    def unfollow(self, username, target):
+        self.graph.unfollow(username, target)
+        self.store.on_change({'op': 'unfollow', 'user': username, 'target': target})
+
+    def check(self, username, limits=(1, 4, 25)):
+        authors = self.graph.following_of(username) + [username]
+        expected = newest_first(self.users, authors)
+        for limit in limits:
+            pages = read_all(lambda cursor, limit: self.store.page(username, cursor, limit), limit)
+            assert flatten(pages) == expected
+            assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_timeline_pages_match_merging():
+    users = random_users(4, authors=5, posts=60)
+    users["user0"]['following'] = ["user1", "user2"]
+    for limit in (5, 12, 1000):
+        timelines = Timelines(users, limit)
+        timelines.check("user0")
+        timelines.check("user4")
+
+
+def test_timeline_follows_posts_and_unfollows():
+    rnd = random.Random(5)
+    users = random_users(6, authors=6, posts=90)
+    users["user0"]['following'] = ["user1"]
+    timelines = Timelines(users, 12)
+    timelines.check("user0")
+    for _ in range(60):
+        target = f"user{rnd.randrange(1, 6)}"
+        action = rnd.random()
+        if action < 0.4:
+            timelines.post(target if rnd.random() < 0.7 else "user0")
+        elif action < 0.7:
+            timelines.follow("user0", target)
+        else:
+            timelines.unfollow("user0", target)
+        timelines.check("user0")
+
+
+def test_follow_backfills_a_prolific_account():
+    users = random_users(7, authors=3, posts=30)
+    users["user9"] = {'posts': []}
+    timelines = Timelines(users, 10)
+    timelines.check("user0")
+    for _ in range(25):
+        timelines.post("user9")
+    # The new followee alone has more posts than the timeline holds
+    timelines.follow("user0", "user9")
+    assert timelines.store.page("user0", None, 10)[0] == newest_first(users, ["user9"])[:10]
+    timelines.check("user0")
+    timelines.follow("user0", "user9")
+    timelines.check("user0")
+    timelines.unfollow("user0", "user9")
+    timelines.check("user0")
@@ -0,0 +1,87 @@
+import random
+import re
+
+from HabitHub import UserSearchIndex
+
+WORDS = ["running", "runner", "reading", "swim", "yoga", "early", "bird"]
+
+
+def random_users(seed, count=150):
+    rnd = random.Random(seed)
+    users = {}
+    while len(users) < count:
+        name = rnd.choice(["Ann", "ann", "Bob", "run", "Rya", "sam"]) + str(rnd.randrange(100))
+        users[name] = {'bio': " ".join(rnd.sample(WORDS, rnd.randrange(4))) + rnd.choice(["", "!", " #yoga"])}
+    return users
+
+
+def expected_matches(users, query, exclude=None):
+    query = query.strip().lower()
+    by_name = sorted((name for name in users if name.lower().startswith(query)), key=lambda n: (n.lower(), n))
+    by_bio = []
+    if query:
+        for name in sorted(users):
+            tokens = re.findall(r"\w+", users[name]['bio'].lower())
+            if not name.lower().startswith(query) and all(
+                any(token.startswith(word) for token in tokens) for word in query.split()
+            ):
+                by_bio.append(name)
+    return [name for name in by_name + by_bio if name != exclude]
+
+
+def read_all(index, query, limit, exclude=None):
+    names = []
+    offset = 0
+    while True:
+        page, total = index.search(query, offset, limit, exclude)
+        assert len(page) <= limit
+        names.extend(page)
+        offset += limit
+        if offset >= total:
+            return names, total
+
+
+def test_name_prefixes_come_before_bio_matches():
+    index = UserSearchIndex()
+    index.build({
+        "runa": {'bio': ""},
+        "Bob": {'bio': "Running every morning"},
+        "amy": {'bio': "trail runner"},
+        "Run2": {'bio': "swim"},
+        "zed": {'bio': "yoga"},
+    })
+    assert index.search("run") == (["Run2", "runa", "Bob", "amy"], 4)
+    assert index.search("  RUN ") == (["Run2", "runa", "Bob", "amy"], 4)
+    assert index.search("running morn") == (["Bob"], 1)
+    assert index.search("") == (["amy", "Bob", "Run2", "runa", "zed"], 5)
+    assert index.search("nothing") == ([], 0)
+
+
+def test_pages_and_exclude_match_brute_force():
+    rnd = random.Random(11)
+    users = random_users(11)
+    index = UserSearchIndex()
+    index.build(users)
+    for query in ["", "a", "ann", "RUN", "run", "r", "early bird", "yo", "zzz", "runner read"]:
+        matches = expected_matches(users, query)
+        # The excluded user may be missing from the matches or fall anywhere among them
+        excludes = {None, rnd.choice(list(users))}
+        if matches:
+            excludes |= {matches[0], matches[len(matches) // 2], matches[-1]}
+        for exclude in excludes:
+            expected = expected_matches(users, query, exclude)
+            for limit in (1, 7, 500):
+                assert read_all(index, query, limit, exclude) == (expected, len(expected))
+
+
+def test_signups_are_searchable():
+    users = random_users(12, count=40)
+    index = UserSearchIndex()
+    index.build(users)
+    for name, bio in [("runway", "early swim"), ("Annie", ""), ("sam5000", "Runner!")]:
+        users[name] = {'bio': bio}
+        index.on_change({'op': 'signup', 'user': name, 'data': {'bio': bio}})
+    index.on_change({'op': 'follow', 'user': "runway", 'target': "Annie"})
+    for query in ["run", "ann", "early", "sam"]:
+        expected = expected_matches(users, query)
+        assert read_all(index, query, 4) == (expected, len(expected))
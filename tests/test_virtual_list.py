@@ -0,0 +1,191 @@
+import pytest
+
+import HabitHub
+
+
+class FakeCanvas:
+    """Enough of a Tk canvas to drive VirtualList without a display"""
+
+    def __init__(self, parent, **options):
+        self.top = 0
+        self.height = 250
+        self.idle = []
+        self.windows = {}
+        self.texts = {}
+        self.scrollregion = None
+        self.last_item = 0
+
+    def pack(self, **options):
+        pass
+
+    def bind(self, event, handler):
+        pass
+
+    def configure(self, scrollregion=None, **options):
+        if scrollregion is not None:
+            self.scrollregion = scrollregion
+
+    def canvasy(self, y):
+        return self.top + y
+
+    def winfo_height(self):
+        return self.height
+
+    def winfo_width(self):
+        return 400
+
+    def winfo_exists(self):
+        return True
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+
+    def create_window(self, x, y, window=None, anchor=None):
+        self.last_item += 1
+        self.windows[self.last_item] = window
+        return self.last_item
+
+    def create_text(self, x, y, text=None, **options):
+        self.last_item += 1
+        self.texts[self.last_item] = text
+        return self.last_item
+
+    def coords(self, item, *position):
+        pass
+
+    def itemconfigure(self, item, **options):
+        if 'text' in options:
+            self.texts[item] = options['text']
+
+    def delete(self, item):
+        self.windows.pop(item, None)
+        self.texts.pop(item, None)
+
+
+class FakeScrollbar:
+    def __init__(self, parent, **options):
+        pass
+
+    def pack(self, **options):
+        pass
+
+    def set(self, first, last):
+        pass
+
+
+class FakeFrame:
+    def __init__(self, parent, **options):
+        self.height = 0
+
+    def bind(self, event, handler):
+        pass
+
+    def winfo_children(self):
+        return []
+
+    def update_idletasks(self):
+        pass
+
+    def winfo_reqheight(self):
+        return self.height
+
+
+@pytest.fixture
+def make_list(monkeypatch):
+    monkeypatch.setattr(HabitHub.tk, "Canvas", FakeCanvas)
+    monkeypatch.setattr(HabitHub.ttk, "Scrollbar", FakeScrollbar)
+    monkeypatch.setattr(HabitHub.ttk, "Frame", FakeFrame)
+
+    def make(height=50, **options):
+        def render(row, item):
+            row.height = height
+
+        options.setdefault('overscan', 0)
+        return HabitHub.VirtualList(None, render, **options)
+
+    return make
+
+
+def settle(view):
+    """Run idle callbacks until the list stops scheduling refreshes"""
+    for _ in range(100):
+        if not view.canvas.idle:
+            return
+        view.canvas.idle.pop(0)()
+    raise AssertionError("refresh never settled")
+
+
+def test_visible_range_follows_the_viewport(make_list):
+    view = make_list(estimate=100)
+    view.items = list(range(100))
+    view.heights = [None] * 100
+    view.relayout()
+    assert view.offsets[-1] == 100 * 100
+    assert view.visible_range() == (0, 3)
+    view.canvas.top = 1000
+    assert view.visible_range() == (10, 13)
+    view.overscan = 100
+    assert view.visible_range() == (9, 14)
+    view.canvas.top = 9900
+    assert view.visible_range() == (98, 100)
+
+
+def test_unmeasured_rows_use_the_average_height_and_gap(make_list):
+    view = make_list(estimate=100, gap=10)
+    view.items = list(range(4))
+    view.heights = [30, None, 50, None]
+    view.relayout()
+    assert view.offsets == [0, 40, 90, 150, 200]
+    assert view.canvas.scrollregion == (0, 0, 400, 200)
+
+
+def test_refresh_builds_only_the_rows_in_range(make_list):
+    view = make_list(estimate=100)
+    view.set_items(range(100))
+    settle(view)
+    # Rows measure 50 once rendered, so the viewport fits five of them
+    assert sorted(view.rows) == [0, 1, 2, 3, 4]
+    assert view.offsets[-1] == 50 * 100
+    view.canvas.top = 2000
+    view.schedule_refresh()
+    settle(view)
+    assert sorted(view.rows) == [40, 41, 42, 43, 44]
+    # The rows that left were reused rather than new ones built
+    assert len(view.canvas.windows) == 5 and view.pool == []
+
+
+def test_on_end_fires_when_the_last_row_comes_into_range(make_list):
+    pages = []
+
+    def on_end():
+        pages.append(len(view.items))
+        if len(pages) < 3:
+            view.append(range(len(view.items), len(view.items) + 20))
+
+    view = make_list(on_end=on_end)
+    view.set_items(range(20))
+    settle(view)
+    assert pages == []
+    view.canvas.top = 20 * 50 - view.canvas.height
+    view.schedule_refresh()
+    settle(view)
+    assert pages == [20]
+    view.canvas.top = 40 * 50 - view.canvas.height
+    view.schedule_refresh()
+    settle(view)
+    assert pages == [20, 40]
+    assert len(view.items) == 60
+
+
+def test_short_and_empty_lists(make_list):
+    ends = []
+    view = make_list(on_end=lambda: ends.append(1), empty_text="Nothing here")
+    view.set_items([])
+    settle(view)
+    assert list(view.canvas.texts.values()) == ["Nothing here"]
+    assert ends == [1]
+    view.set_items(range(3))
+    settle(view)
+    assert sorted(view.rows) == [0, 1, 2]
+    assert view.canvas.texts == {}
+    assert ends == [1, 1]